@@ -0,0 +1,260 @@
+"""Binary Dependency Log.
+
+@see: Cake Build System (http://sourceforge.net/projects/cake-build)
+@copyright: Copyright (c) 2010 Lewis Baker, Stuart McMahon.
+@license: Licensed under the MIT license.
+"""
+
+import os
+import os.path
+import struct
+import threading
+
+import cake.filesys
+
+class DepsLog(object):
+  """An append-only log of the dependency lists of every target.
+
+  Each path is written to the log once and given an integer id. A target's
+  dependency list is stored as a list of ids, so dependency lists that
+  share headers don't store the header paths many times over. Updating a
+  target appends a new record that supersedes the old one.
+
+  The log file is a header followed by records. Each record starts with
+  a 32-bit little-endian word containing the size of the record's
+  payload, with the top bit set for dependency records::
+    path record:       utf-8 encoded path
+    dependency record: target id, followed by dependency ids (32-bit each)
+
+  A record that was only partially written, eg. due to a power failure,
+  is discarded when the log is next opened.
+
+  The log is safe to use from multiple threads but not from multiple
+  processes at once.
+  """
+
+  MAGIC = "CKDL".encode('latin-1') # We need bytes for Python 3.x
+  """The signature at the start of a deps log file.
+
+  @type: bytes
+  """
+
+  VERSION = 1
+  """The version of the deps log file format.
+
+  @type: int
+  """
+
+  COMPACT_RATIO = 3
+  """Rewrite the log when it holds this many times more dependency
+  records than targets.
+
+  @type: int
+  """
+
+  _headerStruct = struct.Struct("<4sI")
+  _wordStruct = struct.Struct("<I")
+  _depsFlag = 0x80000000
+
+  def __init__(self, path):
+    """Open a deps log, creating it if it doesn't exist.
+
+    @param path: The path of the deps log file.
+    @type path: string
+    """
+    self.path = path
+    self._lock = threading.Lock()
+    self._paths = []
+    self._pathIds = {}
+    self._deps = {}
+    self._recordCount = 0
+    self._file = None
+
+    try:
+      validLength = self._load()
+    except EnvironmentError:
+      validLength = None
+
+    if validLength is None:
+      self._rewrite()
+    else:
+      self._file = open(path, "r+b")
+      self._file.truncate(validLength)
+      self._file.seek(validLength)
+      if self._recordCount > self.COMPACT_RATIO * max(len(self._deps), 1):
+        self._rewrite()
+
+  def _load(self):
+    """Load the records from the log file.
+
+    @return: The length of the valid part of the file, or None if the file
+    is not a valid deps log.
+    """
+    data = cake.filesys.readFile(self.path)
+
+    headerSize = self._headerStruct.size
+    if len(data) < headerSize:
+      return None
+    magic, version = self._headerStruct.unpack_from(data, 0)
+    if magic != self.MAGIC or version != self.VERSION:
+      return None
+
+    unpackWord = self._wordStruct.unpack_from
+    paths = self._paths
+    pathIds = self._pathIds
+    deps = self._deps
+    pos = headerSize
+    end = len(data)
+    while pos + 4 <= end:
+      size, = unpackWord(data, pos)
+      isDeps = size & self._depsFlag
+      size &= ~self._depsFlag
+      recordEnd = pos + 4 + size
+      if recordEnd > end:
+        break # Truncated record
+
+      if isDeps:
+        count = size // 4
+        if count < 1 or size % 4:
+          break # Corrupt record
+        ids = struct.unpack_from("<%iI" % count, data, pos + 4)
+        if max(ids) >= len(paths):
+          break # Corrupt record
+        deps[ids[0]] = ids[1:]
+        self._recordCount += 1
+      else:
+        try:
+          path = data[pos + 4:recordEnd].decode("utf8")
+        except UnicodeDecodeError:
+          break # Corrupt record
+        pathIds[path] = len(paths)
+        paths.append(path)
+
+      pos = recordEnd
+
+    return pos
+
+  def _rewrite(self):
+    """Rewrite the log file containing only the most recent records.
+    """
+    paths = self._paths
+    deps = self._deps
+
+    # Renumber the paths that are still referenced.
+    newPaths = []
+    newPathIds = {}
+    def getNewId(oldId):
+      path = paths[oldId]
+      newId = newPathIds.get(path, None)
+      if newId is None:
+        newId = newPathIds[path] = len(newPaths)
+        newPaths.append(path)
+      return newId
+
+    newDeps = {}
+    for targetId, depIds in deps.items():
+      newTargetId = getNewId(targetId)
+      newDeps[newTargetId] = tuple(getNewId(i) for i in depIds)
+
+    chunks = [self._headerStruct.pack(self.MAGIC, self.VERSION)]
+    for path in newPaths:
+      chunks.append(self._encodePath(path))
+    for targetId, depIds in newDeps.items():
+      chunks.append(self._encodeDeps(targetId, depIds))
+
+    if self._file is not None:
+      self._file.close()
+      self._file = None
+
+    tempPath = self.path + ".tmp"
+    cake.filesys.writeFile(tempPath, b"".join(chunks))
+    os.replace(tempPath, self.path)
+
+    self._paths = newPaths
+    self._pathIds = newPathIds
+    self._deps = newDeps
+    self._recordCount = len(newDeps)
+
+    self._file = open(self.path, "r+b")
+    self._file.seek(0, os.SEEK_END)
+
+  def _encodePath(self, path):
+    data = path.encode("utf8")
+    return self._wordStruct.pack(len(data)) + data
+
+  def _encodeDeps(self, targetId, depIds):
+    ids = (targetId,) + tuple(depIds)
+    header = self._wordStruct.pack((len(ids) * 4) | self._depsFlag)
+    return header + struct.pack("<%iI" % len(ids), *ids)
+
+  def _getPathId(self, path, chunks):
+    pathId = self._pathIds.get(path, None)
+    if pathId is None:
+      pathId = self._pathIds[path] = len(self._paths)
+      self._paths.append(path)
+      chunks.append(self._encodePath(path))
+    return pathId
+
+  def getDependencies(self, target):
+    """Get the most recently recorded dependencies of a target.
+
+    @param target: The path of the target.
+    @type target: string
+
+    @return: The list of dependency paths or None if the target has no
+    dependencies recorded.
+    @rtype: list of string or None
+    """
+    self._lock.acquire()
+    try:
+      targetId = self._pathIds.get(target, None)
+      if targetId is None:
+        return None
+      depIds = self._deps.get(targetId, None)
+      if depIds is None:
+        return None
+      paths = self._paths
+      return [paths[i] for i in depIds]
+    finally:
+      self._lock.release()
+
+  def recordDependencies(self, target, dependencies):
+    """Record the dependencies of a target.
+
+    Nothing is written if the dependencies are unchanged.
+
+    @param target: The path of the target.
+    @type target: string
+
+    @param dependencies: The dependency paths.
+    @type dependencies: list of string
+    """
+    self._lock.acquire()
+    try:
+      chunks = []
+      targetId = self._getPathId(target, chunks)
+      depIds = tuple(self._getPathId(p, chunks) for p in dependencies)
+      if not chunks and self._deps.get(targetId, None) == depIds:
+        return
+
+      self._deps[targetId] = depIds
+      self._recordCount += 1
+      chunks.append(self._encodeDeps(targetId, depIds))
+
+      # Write all records at once so a failure leaves at most one
+      # truncated record at the end of the file.
+      self._file.write(b"".join(chunks))
+      self._file.flush()
+    finally:
+      self._lock.release()
+
+  def close(self):
+    """Close the deps log file.
+    """
+    self._lock.acquire()
+    try:
+      if self._file is not None:
+        self._file.close()
+        self._file = None
+    finally:
+      self._lock.release()
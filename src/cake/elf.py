@@ -0,0 +1,235 @@
+"""Utilities for reading ELF files.
+
+@see: Cake Build System (http://sourceforge.net/projects/cake-build)
+@copyright: Copyright (c) 2010 Lewis Baker, Stuart McMahon.
+@license: Licensed under the MIT license.
+"""
+
+import struct
+
+_MAGIC = b"\x7fELF"
+
+# Section types
+_SHT_DYNAMIC = 6
+_SHT_DYNSYM = 11
+_SHT_GNU_VERDEF = 0x6ffffffd
+_SHT_GNU_VERSYM = 0x6fffffff
+
+# Dynamic section tags
+_DT_NULL = 0
+_DT_SONAME = 14
+
+_SHN_UNDEF = 0
+
+# Symbol visibility
+_STV_INTERNAL = 1
+_STV_HIDDEN = 2
+
+# The version definition naming the file itself
+_VER_FLG_BASE = 1
+
+_bindings = {1: 'GLOBAL', 2: 'WEAK', 10: 'UNIQUE'}
+_types = {
+  0: 'NOTYPE', 1: 'OBJECT', 2: 'FUNC', 5: 'COMMON', 6: 'TLS', 10: 'IFUNC',
+  }
+# Programs may copy data symbols into their own image, so their size is
+# part of the interface.
+_sizedTypes = frozenset(['OBJECT', 'COMMON', 'TLS'])
+
+class _ElfFile(object):
+
+  def __init__(self, f):
+    self._file = f
+
+    ident = self.read(0, 16)
+    if len(ident) != 16 or ident[:4] != _MAGIC:
+      raise ValueError("not an ELF file")
+    elfClass = ident[4:5]
+    elfData = ident[5:6]
+    if elfData == b"\x01":
+      order = "<"
+    elif elfData == b"\x02":
+      order = ">"
+    else:
+      raise ValueError("unknown ELF data encoding")
+
+    if elfClass == b"\x01":
+      header = order + "HHIIIIIHHHHHH"
+      self._section = struct.Struct(order + "IIIIIIIIII")
+      self._symbol = struct.Struct(order + "IIIBBH")
+      self._symbolFields = (0, 3, 4, 5, 2) # name, info, other, shndx, size
+      self._dynamic = struct.Struct(order + "iI")
+    elif elfClass == b"\x02":
+      header = order + "HHIQQQIHHHHHH"
+      self._section = struct.Struct(order + "IIQQQQIIQQ")
+      self._symbol = struct.Struct(order + "IBBHQQ")
+      self._symbolFields = (0, 1, 2, 3, 5)
+      self._dynamic = struct.Struct(order + "qQ")
+    else:
+      raise ValueError("unknown ELF class")
+    self._order = order
+
+    header = struct.Struct(header)
+    fields = self.unpack(header, 16)
+    shoff, shentsize, shnum = fields[5], fields[10], fields[11]
+    if shoff and shnum == 0:
+      # Large section counts are stored in the first section header.
+      shnum = self.unpack(self._section, shoff)[5]
+    if shoff and shentsize < self._section.size:
+      raise ValueError("invalid section header size")
+
+    self.sections = [
+      self.unpack(self._section, shoff + i * shentsize)
+      for i in range(shnum)
+      ]
+
+  def read(self, offset, size):
+    self._file.seek(offset)
+    return self._file.read(size)
+
+  def unpack(self, s, offset):
+    data = self.read(offset, s.size)
+    if len(data) != s.size:
+      raise ValueError("truncated ELF file")
+    return s.unpack(data)
+
+  def readSection(self, section):
+    offset, size = section[4], section[5]
+    data = self.read(offset, size)
+    if len(data) != size:
+      raise ValueError("truncated ELF file")
+    return data
+
+  def readString(self, data, offset):
+    end = data.find(b"\0", offset)
+    if end < 0:
+      raise ValueError("unterminated string")
+    return data[offset:end].decode("utf8", "replace")
+
+  def readEntries(self, section, s):
+    data = self.readSection(section)
+    entrySize = section[9] or s.size
+    if entrySize < s.size:
+      raise ValueError("invalid entry size")
+    return [
+      s.unpack_from(data, offset)
+      for offset in range(0, len(data) - s.size + 1, entrySize)
+      ]
+
+  def getLinkedStrings(self, section):
+    link = section[6]
+    if link >= len(self.sections):
+      raise ValueError("invalid section link")
+    return self.readSection(self.sections[link])
+
+  def getSoname(self):
+    for section in self.sections:
+      if section[1] == _SHT_DYNAMIC:
+        strings = self.getLinkedStrings(section)
+        for tag, value in self.readEntries(section, self._dynamic):
+          if tag == _DT_NULL:
+            break
+          if tag == _DT_SONAME:
+            return self.readString(strings, value)
+    return None
+
+  def getVersionNames(self):
+    names = {}
+    verdef = struct.Struct(self._order + "HHHHIII")
+    verdaux = struct.Struct(self._order + "II")
+    for section in self.sections:
+      if section[1] == _SHT_GNU_VERDEF:
+        data = self.readSection(section)
+        strings = self.getLinkedStrings(section)
+        offset = 0
+        for _ in range(section[7]): # sh_info is the number of entries
+          _, flags, index, count, _, aux, nextOffset = verdef.unpack_from(data, offset)
+          if count and not flags & _VER_FLG_BASE:
+            nameOffset, _ = verdaux.unpack_from(data, offset + aux)
+            names[index] = self.readString(strings, nameOffset)
+          if not nextOffset:
+            break
+          offset += nextOffset
+    return names
+
+  def getVersionIndices(self):
+    versym = struct.Struct(self._order + "H")
+    for section in self.sections:
+      if section[1] == _SHT_GNU_VERSYM:
+        return [v for v, in self.readEntries(section, versym)]
+    return None
+
+  def getExportedSymbols(self):
+    versionNames = self.getVersionNames()
+    versionIndices = self.getVersionIndices()
+    nameField, infoField, otherField, shndxField, sizeField = self._symbolFields
+
+    symbols = []
+    for section in self.sections:
+      if section[1] != _SHT_DYNSYM:
+        continue
+      strings = self.getLinkedStrings(section)
+      for i, entry in enumerate(self.readEntries(section, self._symbol)):
+        if entry[shndxField] == _SHN_UNDEF:
+          continue # Imported, not exported
+        if (entry[otherField] & 0x3) in (_STV_INTERNAL, _STV_HIDDEN):
+          continue
+        info = entry[infoField]
+        binding = _bindings.get(info >> 4, None)
+        if binding is None:
+          continue # Local
+        symbolType = _types.get(info & 0xf, None)
+        if symbolType is None:
+          continue # Section and file symbols
+
+        name = self.readString(strings, entry[nameField])
+        if versionIndices is not None and i < len(versionIndices):
+          index = versionIndices[i]
+          version = versionNames.get(index & 0x7fff, None)
+          if version is not None:
+            if index & 0x8000:
+              name += "@" + version
+            else:
+              name += "@@" + version
+
+        symbol = "%s %s %s" % (symbolType, binding, name)
+        if symbolType in _sizedTypes:
+          symbol += " %i" % entry[sizeField]
+        symbols.append(symbol)
+    return symbols
+
+def readInterfaceStub(path):
+  """Read the interface that a shared library exports to programs
+  linked against it.
+
+  The interface is the library's soname and the name, type, binding,
+  version and (for data symbols) size of each symbol it exports. Programs
+  linked against the library only need to be relinked if it changes.
+
+  @param path: The path of the shared library.
+  @type path: string
+
+  @return: The interface as normalised text, with one line per exported
+  symbol in sorted order.
+  @rtype: string
+
+  @raise ValueError: If the file is not a valid ELF file.
+  @raise EnvironmentError: If the file could not be read.
+  """
+  f = open(path, "rb")
+  try:
+    try:
+      elf = _ElfFile(f)
+      soname = elf.getSoname()
+      symbols = elf.getExportedSymbols()
+    except struct.error as e:
+      raise ValueError("invalid ELF file: %s" % str(e))
+  finally:
+    f.close()
+
+  lines = []
+  if soname is not None:
+    lines.append("soname %s\n" % soname)
+  for symbol in sorted(set(symbols)):
+    lines.append("symbol %s\n" % symbol)
+  return "".join(lines)
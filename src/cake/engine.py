@@ -6,6 +6,7 @@
 """
 
 import codecs
+import copy
 import threading
 import traceback
 import sys
@@ -24,6 +25,9 @@ import cake.task
 import cake.path
 import cake.hash
 import cake.filesys
+import cake.includes
+import cake.depslog
+import cake.listingcache
 import cake.threadpool
 
 from cake.script import Script as _Script
@@ -157,6 +161,10 @@ class Engine(object):
 
   @ivar oscwd: The initial working directory when Cake was first started.
   @type oscwd: string
+
+  @ivar includeScanner: The scanner used to find the headers included by
+  C/C++ source files without compiling them.
+  @type includeScanner: L{IncludeScanner}
   """
   
   scriptCachePath = None
@@ -175,6 +183,24 @@ class Engine(object):
   target files themselves with a different extension (usually .dep).
   @type: string or None
   """
+  depsLogPath = None
+  """Path of the binary dependency log file.
+  
+  The absolute path of a file that stores the dependency lists of all
+  targets. Paths shared by many targets, such as headers, are only stored
+  once in the log rather than once in every dependency info file. If None
+  the dependency lists are stored in the dependency info files.
+  @type: string or None
+  """
+  listingCachePath = None
+  """Path of the directory listing cache file.
+  
+  The absolute path of a file that stores the listings of directories
+  searched by FileSystemTool.findFiles() and glob() between builds.
+  Directories that haven't changed since they were last searched are
+  not read again. If None directories are read every time.
+  @type: string or None
+  """
   
   forceBuild = False
   defaultConfigScriptName = "config.cake"
@@ -199,6 +225,16 @@ class Engine(object):
     self.oscwd = os.getcwd() # Save original cwd in case someone changes it.
     self.buildSuccessCallbacks = []
     self.buildFailureCallbacks = []
+    self.includeScanner = cake.includes.IncludeScanner(self.getTimestamp)
+    self._depsLog = None
+    self._depsLogLock = threading.Lock()
+    self._listingCache = None
+    self._listingCacheLock = threading.Lock()
+    self._sharedCompiles = {}
+    self._sharedCompilesLock = threading.Lock()
+    self.knownDirectories = cake.filesys.KnownDirectories()
+    self._cacheThreadPool = None
+    self._cacheThreadPoolLock = threading.Lock()
 
   @property
   def errorCount(self):
@@ -533,13 +569,56 @@ class Engine(object):
           pathDigestStr[2],
           pathDigestStr
           )
-        cake.filesys.makeDirs(cake.path.dirName(cacheFilePath))
+        cake.filesys.makeDirs(cake.path.dirName(cacheFilePath), self.knownDirectories)
       else:
         cacheFilePath = None
       byteCode = cake.bytecode.loadCode(path, cfile=cacheFilePath, cached=cached)
       self._byteCodeCache[path] = byteCode
     return byteCode
     
+  def getCacheThreadPool(self, threadCount):
+    """Get the thread pool used to look up objects in object caches.
+
+    @param threadCount: The number of threads to create if the thread pool
+    doesn't exist yet.
+    @type threadCount: int
+
+    @rtype: L{ThreadPool}
+    """
+    self._cacheThreadPoolLock.acquire()
+    try:
+      if self._cacheThreadPool is None:
+        self._cacheThreadPool = cake.threadpool.ThreadPool(max(threadCount, 1))
+      return self._cacheThreadPool
+    finally:
+      self._cacheThreadPoolLock.release()
+
+  def shareCompile(self, key, task, target):
+    """Share the result of a compile with later identical compiles.
+
+    The first compile registered with a key is shared with every later
+    compile registered with the same key during this build, whether it is
+    still in progress or has already completed.
+
+    @param key: A hashable key identifying the inputs of the compile.
+    @param task: The task that performs the compile.
+    @type task: L{Task}
+    @param target: The absolute path of the file the compile produces.
+    @type target: string
+
+    @return: None if this is the first compile with this key, otherwise
+    the (task, target) tuple of the first compile.
+    @rtype: tuple of (L{Task}, string) or None
+    """
+    self._sharedCompilesLock.acquire()
+    try:
+      shared = self._sharedCompiles.get(key, None)
+      if shared is None:
+        self._sharedCompiles[key] = (task, target)
+      return shared
+    finally:
+      self._sharedCompilesLock.release()
+
   def notifyFileChanged(self, path):
     """Let the engine know a file has changed.
     
@@ -569,6 +648,19 @@ class Engine(object):
       self._timestampCache[path] = timestamp
     return timestamp
 
+  def updateTimestampCache(self, path, stat):
+    """Update the internal cache of file timestamps with a new entry.
+    
+    Use this to avoid another system call when the file has already
+    been stat'ed, eg. while walking a directory.
+    
+    @param path: The path of the file.
+    @type path: string
+    @param stat: The result of stat'ing the file.
+    @type stat: os.stat_result
+    """
+    self._timestampCache[path] = stat.st_mtime_ns
+
   def updateFileDigestCache(self, path, timestamp, digest):
     """Update the internal cache of file digests with a new entry.
     
@@ -650,8 +742,60 @@ class Engine(object):
     if dependencyInfo.version != DependencyInfo.VERSION:
       raise DependencyInfoError("version has changed")
 
+    if dependencyInfo.depsLogged:
+      if self.depsLogPath is None:
+        raise DependencyInfoError("is stored in a dependency log")
+      depPaths = self._getDepsLog().getDependencies(target)
+      if depPaths is None or len(depPaths) != len(dependencyInfo.depTimestamps):
+        raise DependencyInfoError("is missing from the dependency log")
+      dependencyInfo.depPaths = depPaths
+      dependencyInfo.depsLogged = False
+
     return dependencyInfo
   
+  def _getDepsLog(self):
+    """Get the dependency log, opening it on first use.
+    """
+    depsLog = self._depsLog
+    if depsLog is None:
+      self._depsLogLock.acquire()
+      try:
+        depsLog = self._depsLog
+        if depsLog is None:
+          cake.filesys.makeDirs(
+            cake.path.dirName(self.depsLogPath),
+            self.knownDirectories,
+            )
+          depsLog = self._depsLog = cake.depslog.DepsLog(self.depsLogPath)
+      finally:
+        self._depsLogLock.release()
+    return depsLog
+  
+  def getListingCache(self):
+    """Get the directory listing cache, loading it on first use.
+    
+    The cache is saved when the build finishes.
+    
+    @return: The listing cache or None if L{listingCachePath} is None.
+    @rtype: L{cake.listingcache.ListingCache} or None
+    """
+    if self.listingCachePath is None:
+      return None
+    
+    listingCache = self._listingCache
+    if listingCache is None:
+      self._listingCacheLock.acquire()
+      try:
+        listingCache = self._listingCache
+        if listingCache is None:
+          listingCache = cake.listingcache.ListingCache(self.listingCachePath)
+          self.addBuildSuccessCallback(listingCache.save)
+          self.addBuildFailureCallback(listingCache.save)
+          self._listingCache = listingCache
+      finally:
+        self._listingCacheLock.release()
+    return listingCache
+  
   def getDependencyInfoPath(self, target):
     """Get the path of a dependency info file given it's associated target.
     """
@@ -682,9 +826,15 @@ class Engine(object):
     """
     depPath = self.getDependencyInfoPath(target)
 
-    dependencyString = pickle.dumps(dependencyInfo, pickle.HIGHEST_PROTOCOL)
- 
     try:
+      if self.depsLogPath is not None and dependencyInfo.depPaths is not None:
+        self._getDepsLog().recordDependencies(target, dependencyInfo.depPaths)
+        # Don't modify the caller's copy, it may still be in use.
+        dependencyInfo = copy.copy(dependencyInfo)
+        dependencyInfo.depPaths = None
+        dependencyInfo.depsLogged = True
+
+      dependencyString = pickle.dumps(dependencyInfo, pickle.HIGHEST_PROTOCOL)
       cake.filesys.writeFile(depPath, dependencyString + DependencyInfo.MAGIC)
     except Exception as e:
       msg = "cake: Error writing dependency info to %s: %s" % (depPath, e)
@@ -701,6 +851,13 @@ class DependencyInfo(object):
   @type args: usually a list of string's
   """
   
+  depsLogged = False
+  """Whether the dependency paths are stored in the engine's dependency
+  log rather than in the pickled dependency info.
+
+  @type: bool
+  """
+  
   VERSION = 3
   """The most recent DependencyInfo version.
 
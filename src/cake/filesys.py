@@ -5,13 +5,117 @@
 @license: Licensed under the MIT license.
 """
 
+import errno
 import shutil
 import os
 import os.path
+import threading
 import time
 
 import cake.path
 
+class KnownDirectories(object):
+  """The absolute paths of directories known to exist.
+  
+  Passed to L{makeDirs} so that it can skip the system calls for
+  directories it has already created or found.
+  """
+  
+  def __init__(self):
+    self._dirs = set()
+    self._lock = threading.Lock()
+    self._local = threading.local()
+    self._hitCounters = []
+  
+  def contains(self, key):
+    """Return True if a directory is known to exist.
+    
+    @param key: The key of the directory as returned by L{getKey}.
+    """
+    if key is None or key not in self._dirs:
+      return False
+    # Each thread counts its own hits so no lock is needed.
+    counter = getattr(self._local, "hits", None)
+    if counter is None:
+      counter = self._local.hits = [0]
+      self._lock.acquire()
+      try:
+        self._hitCounters.append(counter)
+      finally:
+        self._lock.release()
+    counter[0] += 1
+    return True
+  
+  def add(self, key):
+    """Remember that a directory exists.
+    
+    @param key: The key of the directory as returned by L{getKey}.
+    """
+    if key is None:
+      return
+    self._lock.acquire()
+    try:
+      self._dirs.add(key)
+    finally:
+      self._lock.release()
+  
+  def forget(self, path):
+    """Forget that a directory and the directories under it exist.
+    
+    Call this when a directory is deleted other than by L{removeTree} so
+    that L{makeDirs} creates it again.
+    
+    @param path: The path of the directory.
+    @type path: string
+    """
+    key = self.getKey(path)
+    if key is None:
+      return
+    prefix = os.path.join(key, "")
+    self._lock.acquire()
+    try:
+      self._dirs.discard(key)
+      for d in [d for d in self._dirs if d.startswith(prefix)]:
+        self._dirs.discard(d)
+    finally:
+      self._lock.release()
+  
+  def clear(self):
+    """Forget all directories, eg. because they may have been deleted
+    since the last build.
+    """
+    self._lock.acquire()
+    try:
+      self._dirs.clear()
+    finally:
+      self._lock.release()
+  
+  def getStats(self):
+    """Get statistics about the directories known to exist.
+    
+    @return: A tuple of the number of directory checks that were skipped
+    because the directory was known to exist and the number of
+    directories known to exist.
+    @rtype: tuple of (int, int)
+    """
+    self._lock.acquire()
+    try:
+      hits = sum(counter[0] for counter in self._hitCounters)
+      return hits, len(self._dirs)
+    finally:
+      self._lock.release()
+  
+  @staticmethod
+  def getKey(path):
+    """Get the key a directory is known by.
+    
+    @return: The key or None if the path is relative, since relative
+    paths depend on the current directory so aren't remembered.
+    """
+    if not os.path.isabs(path):
+      return None
+    return os.path.normcase(os.path.normpath(path))
+
 def toUtc(timestamp):
   """Convert a timestamp from local time-zone to UTC.
   """
@@ -50,7 +154,7 @@ def isDir(path):
   """
   return cake.path.isDir(path)
 
-def remove(path):
+def remove(path, knownDirectories=None):
   """Remove a file.
   
   Unlike os.remove() this function fails silently if the
@@ -58,6 +162,9 @@ def remove(path):
 
   @param path: The path of the file to remove.
   @type path: string
+  @param knownDirectories: The directories known to exist, which
+  forgets the path if it was a symbolic link to a directory.
+  @type knownDirectories: L{KnownDirectories} or None
   """
   try:
     os.remove(path)
@@ -65,8 +172,11 @@ def remove(path):
     # Ignore failure if file doesn't exist. Fail if it's a directory.
     if os.path.exists(path):
       raise
+  else:
+    if knownDirectories is not None:
+      knownDirectories.forget(path) # In case it was a link to a directory.
 
-def removeTree(path):
+def removeTree(path, knownDirectories=None):
   """Recursively delete all files and directories at the specified path.
 
   Unlike os.removedirs() this function stops deleting entries when
@@ -76,7 +186,12 @@ def removeTree(path):
   empty.
 
   @param path: Path to the directory containing the tree to remove
+  @param knownDirectories: The directories known to exist, which
+  forgets the removed directories.
+  @type knownDirectories: L{KnownDirectories} or None
   """
+  if knownDirectories is not None:
+    knownDirectories.forget(path)
   for root, dirs, files in os.walk(path, topdown=False):
     for name in files:
       p = os.path.join(root, name)
@@ -98,7 +213,72 @@ def copyFile(source, target):
   """
   shutil.copyfile(source, target)
 
-def makeDirs(path):
+# Errors from os.copy_file_range() meaning the file systems don't
+# support it and the data should be copied another way.
+_copyRangeUnsupported = frozenset(
+  getattr(errno, name)
+  for name in ("ENOSYS", "EXDEV", "EINVAL", "EOPNOTSUPP", "ENOTSUP", "EBADF")
+  if hasattr(errno, name)
+  )
+
+def copyFileData(source, target):
+  """Copy the contents of a file from source path to target path.
+  
+  The data is copied within the kernel using os.copy_file_range() where
+  it is available, which may share the data blocks on file systems that
+  support it. Otherwise it falls back to L{copyFile}, which uses
+  sendfile() where it can.
+  
+  The target path is removed before it is written so that if it is a
+  hard link to another file, eg. the source, that file isn't changed.
+  
+  @param source: The path of the source file.
+  @type source: string
+  @param target: The path of the target file.
+  @type target: string
+  """
+  remove(target)
+
+  copyRange = getattr(os, "copy_file_range", None)
+  if copyRange is None:
+    return copyFile(source, target)
+
+  with open(source, "rb") as s, open(target, "wb") as t:
+    size = os.fstat(s.fileno()).st_size
+    copied = 0
+    try:
+      while copied < size:
+        count = copyRange(s.fileno(), t.fileno(), size - copied)
+        if count == 0:
+          break # The source was truncated while copying.
+        copied += count
+    except OSError as e:
+      if copied or e.errno not in _copyRangeUnsupported:
+        raise
+      # The target is still empty so fall back to copying it by hand.
+      shutil.copyfileobj(s, t)
+
+def linkFile(source, target):
+  """Make a hard link to a source file at the target path.
+  
+  Replaces the target path if it exists.
+  
+  @param source: The path of the source file.
+  @type source: string
+  @param target: The path of the hard link.
+  @type target: string
+  
+  @raise EnvironmentError: If the link could not be made, eg. because
+  the paths are on different file systems.
+  """
+  try:
+    os.remove(target)
+  except EnvironmentError:
+    if os.path.lexists(target):
+      raise
+  os.link(source, target)
+
+def makeDirs(path, knownDirectories=None):
   """Recursively create directories.
   
   Unlike os.makedirs(), it does not throw an exception if the
@@ -106,12 +286,21 @@ def makeDirs(path):
   
   @param path: The path of the directory to create.
   @type path: string 
+  @param knownDirectories: The directories known to exist. Absolute
+  directories that are created or found to exist are added to it, so
+  creating them again makes no system calls.
+  @type knownDirectories: L{KnownDirectories} or None
   """
   # Don't try to create an empty directory, eg. if someone calls
   # makeDirs(os.path.dirname("somefile.txt")).
   if not path:
     return
   
+  if knownDirectories is not None:
+    key = knownDirectories.getKey(path)
+    if knownDirectories.contains(key):
+      return
+  
   # Don't try to create directory at the root level, eg: 'C:\\'.
   if cake.path.isMount(path):
     return
@@ -119,10 +308,19 @@ def makeDirs(path):
   head, tail = os.path.split(path)
   if not tail:
     head, tail = os.path.split(head)
-  if head and tail and not os.path.exists(head):
-    makeDirs(head)
-    if tail == os.curdir: # xxx/newdir/. exists if xxx/newdir exists.
-      return
+  if head and tail:
+    if knownDirectories is not None:
+      headKey = knownDirectories.getKey(head)
+      isKnown = knownDirectories.contains(headKey)
+    else:
+      isKnown = False
+    if not isKnown:
+      if not os.path.isdir(head):
+        makeDirs(head, knownDirectories)
+        if tail == os.curdir: # xxx/newdir/. exists if xxx/newdir exists.
+          return
+      elif knownDirectories is not None:
+        knownDirectories.add(headKey)
 
   try:
     os.mkdir(path)
@@ -131,6 +329,73 @@ def makeDirs(path):
     if not os.path.isdir(path):
       raise
 
+  if knownDirectories is not None:
+    knownDirectories.add(key)
+
+def walkTreeEntries(path, recursive=True, includeMatch=None):
+  """Walk a directory for file and directory entries.
+
+  The entries come from os.scandir() so whether an entry is a directory
+  is known without another system call, and its stat result is only
+  fetched once (and on Windows comes for free).
+
+  @param path: The path of the directory to search under.
+  @type path: string
+   
+  @param recursive: Whether or not to recursively walk through
+  sub-directories.
+  @type recursive: bool
+
+  @param includeMatch: A callable used to decide whether to include
+  certain files in the result. This could be a python callable that
+  returns True to include the file or False to exclude it, or a regular
+  expression function such as re.compile().match or re.match.
+  @type includeMatch: any callable 
+
+  @return: A sequence of (path, entry) tuples where path is relative to
+  the specified directory path and entry is the os.DirEntry of the file
+  or directory.
+  """
+  return _walkTreeEntries("", path, recursive, includeMatch)
+
+def _walkTreeEntries(relDir, absDir, recursive, includeMatch):
+  try:
+    entries = list(os.scandir(absDir))
+  except EnvironmentError:
+    if not recursive:
+      raise # Like os.listdir()
+    return # Like os.walk()
+
+  dirs = []
+  files = []
+  for entry in entries:
+    try:
+      isDir = entry.is_dir()
+    except EnvironmentError:
+      isDir = False
+    if isDir:
+      dirs.append(entry)
+    else:
+      files.append(entry)
+
+  subDirs = []
+  for entry in dirs:
+    path = os.path.join(relDir, entry.name)
+    if includeMatch is None or includeMatch(path):
+      subDirs.append((path, entry))
+      yield path, entry
+  for entry in files:
+    path = os.path.join(relDir, entry.name)
+    if includeMatch is None or includeMatch(path):
+      yield path, entry
+
+  if recursive:
+    # Don't recurse through symbolic links to directories.
+    for path, dirEntry in subDirs:
+      if not dirEntry.is_symlink():
+        for subPath, entry in _walkTreeEntries(path, dirEntry.path, True, includeMatch):
+          yield subPath, entry
+
 def walkTree(path, recursive=True, includeMatch=None):
   """Walk a directory for file and directory names.
 
@@ -150,27 +415,8 @@ def walkTree(path, recursive=True, includeMatch=None):
   @return: A sequence of file and directory paths relative
   to the specified directory path.
   """
-  if recursive:
-    firstChar = len(path) + 1
-    for dirPath, dirNames, fileNames in os.walk(path):
-      dirPath = dirPath[firstChar:] # Make dirPath relative to path
-
-      newDirNames = []
-      for name in dirNames:
-        path = os.path.join(dirPath, name)
-        if includeMatch is None or includeMatch(path):
-          newDirNames.append(name)
-          yield path
-      dirNames[:] = newDirNames # Modify dirNames so we don't recurse into excluded directories.
-
-      for name in fileNames:
-        path = os.path.join(dirPath, name)
-        if includeMatch is None or includeMatch(path):
-          yield path
-  else:
-    for name in os.listdir(path):
-      if includeMatch is None or includeMatch(name):
-        yield name
+  for path, _ in walkTreeEntries(path, recursive, includeMatch):
+    yield path
 
 def readFile(path):
   """Read data from a file.
@@ -5,9 +5,86 @@
 @license: Licensed under the MIT license.
 """
 
+import re
+
+# A token is a run of non-whitespace characters where a backslash always
+# consumes the character that follows it, so escaped spaces ('\ ') don't
+# end the token but an escaped backslash followed by a space ('\\ ') does.
+_tokenRegex = re.compile(r'(?:\\.|[^\s\\])+|\\\Z')
+
+# An odd number of backslashes escapes a following space or '#'.
+_escapeRegex = re.compile(r'(\\+)([ #])|\$\$')
+
+def _unescape(m):
+  backslashes, char = m.groups()
+  if backslashes is None:
+    return '$' # '$$' -> '$'
+  count = len(backslashes)
+  if count % 2:
+    return '\\' * (count // 2) + char
+  else:
+    return m.group(0)
+
+def _isRuleSeparator(token):
+  # A ':' followed by a path is part of a drive letter, eg. 'C:\path.h',
+  # so only a ':' at the end of a token separates targets from dependencies.
+  return token.endswith(':') and not token.endswith('\\:')
+
+def parseDependencyText(text, targetSuffix):
+  """Parse the contents of a .d file and return the list of dependencies.
+
+  Runs in time linear in the length of the text. Handles line
+  continuations, escaped spaces and '#' characters, '$$' and multiple
+  rules (eg. the phony header rules generated by GCC's -MP option).
+
+  @param text: The contents of the dependency file.
+  @type text: string
+  @param targetSuffix: Suffix used by targets. Only the dependencies of
+  rules with a target ending in this suffix are returned.
+  @type targetSuffix: string
+  @return: A list of unique dependencies in the order they were found.
+  @rtype: list of string
+  """
+  dependencies = []
+  uniqueDeps = set()
+
+  text = text.replace('\\\r\n', ' ').replace('\\\n', ' ') # join escaped lines
+
+  findTokens = _tokenRegex.findall
+  unescape = _escapeRegex.sub
+  for line in text.splitlines():
+    tokens = findTokens(line)
+    if not tokens:
+      continue
+
+    # Find the end of the targets.
+    for i, token in enumerate(tokens):
+      if _isRuleSeparator(token):
+        break
+    else:
+      continue # Not a rule
+
+    targets = tokens[:i]
+    lastTarget = tokens[i][:-1]
+    if lastTarget:
+      targets.append(lastTarget)
+
+    for target in targets:
+      if unescape(_unescape, target).endswith(targetSuffix):
+        break
+    else:
+      continue # Not a rule for the target we're interested in
+
+    for token in tokens[i+1:]:
+      if token not in uniqueDeps:
+        uniqueDeps.add(token)
+        dependencies.append(unescape(_unescape, token))
+
+  return dependencies
+
 def parseDependencyFile(path, targetSuffix):
   """Parse a .d file and return the list of dependencies.
-  
+
   @param path: The path to the dependency file.
   @type path: string
   @param targetSuffix: Suffix used by targets.
@@ -15,41 +92,10 @@ def parseDependencyFile(path, targetSuffix):
   @return: A list of dependencies.
   @rtype: list of string
   """
-  dependencies = []
-  uniqueDeps = set()
-
-  def addPath(path):
-    if path and path not in uniqueDeps:
-      uniqueDeps.add(path)
-      path = path.replace('\\ ', ' ') # fix escaped spaces
-      dependencies.append(path)
-
   f = open(path, 'rt')
   try:
     text = f.read()
-    text = text.replace('\\\n', ' ') # join escaped lines
-    text = text.replace('\n', ' ') # join other lines
-    text = text.lstrip() # strip leading whitespace
-
-    # Find the 'target:' rule
-    i = text.find(targetSuffix + ':')
-    if i != -1:
-      text = text[i+len(targetSuffix)+1:] # strip target + ':'
-
-      while True:
-        text = text.lstrip() # strip leading whitespace
-
-        i = text.find(' ')
-        while i != -1 and text[i-1] == '\\': # Skip escaped spaces
-          i = text.find(' ', i+1)
-        
-        if i == -1:
-          addPath(text)
-          break
-        else:
-          addPath(text[:i])
-          text = text[i:]
   finally:
     f.close()
-  
-  return dependencies
+
+  return parseDependencyText(text, targetSuffix)
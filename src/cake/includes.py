@@ -0,0 +1,173 @@
+"""Utilities for scanning C/C++ #include directives.
+
+@see: Cake Build System (http://sourceforge.net/projects/cake-build)
+@copyright: Copyright (c) 2010 Lewis Baker, Stuart McMahon.
+@license: Licensed under the MIT license.
+"""
+
+import os
+import os.path
+import re
+
+_includeRegex = re.compile(
+  br'^[ \t]*#[ \t]*include[ \t]*([<"])([^">\r\n]+)[">]',
+  re.MULTILINE,
+  )
+
+def parseIncludes(data):
+  """Find the #include directives in the contents of a source file.
+
+  Includes whose name is computed by a macro are ignored. Includes inside
+  conditional blocks or comments are not excluded.
+
+  @param data: The contents of the source file.
+  @type data: bytes
+
+  @return: A list of (name, angled) tuples in the order they appear,
+  where 'angled' is True for an #include <name> directive.
+  @rtype: list of tuple(string, bool)
+  """
+  includes = []
+  for m in _includeRegex.finditer(data):
+    delimiter, name = m.groups()
+    includes.append((name.decode("utf8", "replace"), delimiter == b'<'))
+  return includes
+
+class IncludeScanner(object):
+  """Finds the headers included by source files without compiling them.
+
+  The scanner is an approximation of the preprocessor. It follows every
+  #include it finds regardless of any surrounding conditional blocks and
+  ignores includes it cannot resolve against the include paths (such as
+  system headers that are found by the compiler's built-in search paths).
+
+  The list of includes of each file is memoised by its path and
+  modification time so that headers shared between sources are only
+  read once.
+  """
+
+  def __init__(self, getTimestamp=None):
+    """Construct an include scanner.
+
+    @param getTimestamp: A function used to get the modification time of a
+    file, eg. L{Engine.getTimestamp}. If None then os.stat() is used.
+    @type getTimestamp: any callable
+    """
+    if getTimestamp is None:
+      getTimestamp = lambda path: os.stat(path).st_mtime_ns
+    self._getTimestamp = getTimestamp
+    self._includesCache = {}
+    self._isFileCache = {}
+
+  def getIncludes(self, path):
+    """Get the #include directives of a file.
+
+    @param path: The absolute path of the file.
+    @type path: string
+
+    @return: A list of (name, angled) tuples.
+    @rtype: list of tuple(string, bool)
+
+    @raise EnvironmentError: If the file could not be read.
+    """
+    timestamp = self._getTimestamp(path)
+    cached = self._includesCache.get(path, None)
+    if cached is not None and cached[0] == timestamp:
+      return cached[1]
+
+    f = open(path, "rb")
+    try:
+      includes = parseIncludes(f.read())
+    finally:
+      f.close()
+    self._includesCache[path] = (timestamp, includes)
+    return includes
+
+  def _isFile(self, path):
+    result = self._isFileCache.get(path, None)
+    if result is None:
+      result = self._isFileCache[path] = os.path.isfile(path)
+    return result
+
+  def resolve(self, name, angled, includingDir, includePaths):
+    """Resolve an #include directive to the path of a file.
+
+    Quoted includes are searched for relative to the including file's
+    directory first, then in the include paths. Angled includes are only
+    searched for in the include paths.
+
+    @return: The normalised absolute path of the included file or None if
+    it could not be found.
+    @rtype: string or None
+    """
+    if os.path.isabs(name):
+      candidate = os.path.normpath(name)
+      if self._isFile(candidate):
+        return candidate
+      return None
+
+    if not angled and includingDir is not None:
+      candidate = os.path.normpath(os.path.join(includingDir, name))
+      if self._isFile(candidate):
+        return candidate
+
+    for includePath in includePaths:
+      candidate = os.path.normpath(os.path.join(includePath, name))
+      if self._isFile(candidate):
+        return candidate
+
+    return None
+
+  def scan(self, source, includePaths, forcedIncludes=[]):
+    """Find all headers included directly or indirectly by a source file.
+
+    @param source: The absolute path of the source file.
+    @type source: string
+
+    @param includePaths: The absolute include paths in search order.
+    @type includePaths: list of string
+
+    @param forcedIncludes: Headers included before the source as if by
+    a quoted #include directive.
+    @type forcedIncludes: list of string
+
+    @return: The normalised absolute paths of included files, in the order
+    they were found. The source file itself is not included.
+    @rtype: list of string
+    """
+    source = os.path.normpath(source)
+    includePaths = list(includePaths)
+    visited = set([source])
+    headers = []
+    pending = []
+
+    def visit(name, angled, includingDir):
+      path = self.resolve(name, angled, includingDir, includePaths)
+      if path is not None and path not in visited:
+        visited.add(path)
+        headers.append(path)
+        pending.append(path)
+
+    for name in forcedIncludes:
+      visit(name, False, None)
+    pending.append(source)
+
+    while pending:
+      path = pending.pop()
+      try:
+        includes = self.getIncludes(path)
+      except EnvironmentError:
+        continue
+      includingDir = os.path.dirname(path)
+      for name, angled in includes:
+        visit(name, angled, includingDir)
+
+    return headers
+
+  def clearFileCache(self):
+    """Forget which files were found to exist.
+
+    Call this if headers may have been generated since they were last
+    searched for.
+    """
+    self._isFileCache.clear()
@@ -5,6 +5,8 @@
 @license: Licensed under the MIT license.
 """
 
+import threading
+
 class ToolMetaclass(type):
   """This metaclass ensures that new instance variables can only be added to
   an instance during its __init__.
@@ -29,30 +31,67 @@ class ToolMetaclass(type):
       oldSetattr(self, name, value)
     cls.__setattr__ = __setattr__
 
-def memoise(func):
+class _Recording(threading.local):
+  calls = ()
+
+_recording = _Recording()
+_toolLock = threading.RLock()
+
+def memoise(*names):
   """Decorator that can be placed on Tool methods to memoise the result.
   
-  The result cache is invalidated whenever an attribute is set on the
-  instance.
+  Used without arguments the result is invalidated whenever any attribute
+  is set on the instance. Otherwise the names of the attributes the method
+  depends on are given, including those read by any non-memoised methods
+  it calls, and only setting (or clearing with L{Tool._clearCache}) one
+  of those attributes invalidates the result. Attributes that are only
+  set by __init__ need not be given::
+
+    @memoise('debugSymbols', 'defines')
+    def _getCompileArgs(self):
+      ...
+
+  A result also depends on the results of any memoised methods of the same
+  instance it calls.
   
-  @param func: The function to memoise.
-  @type func: function
+  @param names: The names of the attributes the method depends on.
+  @type names: tuple of string
   """
+  if len(names) == 1 and callable(names[0]):
+    return _memoise(names[0], None)
+  else:
+    return lambda func: _memoise(func, frozenset(names))
+
+def _memoise(func, depends):
   
   undefined = object()
   def run(*args, **kwargs):
     kwargsTuple = tuple((k,v) for k, v in kwargs.items())
     
     self = args[0]
-    key = (func, args[1:], kwargsTuple)
+    key = (args[1:], kwargsTuple)
+
+    calls = _recording.calls
+    if calls:
+      caller, callerFunc = calls[-1]
+      if caller is self:
+        self._Tool__addUser(run, callerFunc)
+
+    results = self._Tool__memoise.get(run, None)
+    if results is not None:
+      result = results.get(key, undefined)
+      if result is not undefined:
+        return result
 
-    cache = self._Tool__memoise
-    result = cache.get(key, undefined)
-    if result is undefined:
+    _recording.calls = calls + ((self, run),)
+    try:
       result = func(*args, **kwargs)
-      cache[key] = result
+    finally:
+      _recording.calls = calls
+    self._Tool__storeResult(run, key, result)
     return result
   
+  run.depends = depends
   try:
     run.func_name = func.func_name
     run.func_doc = func.func_doc
@@ -77,20 +116,99 @@ class Tool(object):
   @type: bool
   """
   
+  __shared = frozenset()
+  
   def __init__(self, configuration):
     self.__memoise = {}
+    self.__memoiseUsers = {}
     self.configuration = configuration
     self.engine = configuration.engine
   
   def __setattr__(self, name, value):
-    if name != '_Tool__memoise' and hasattr(self, '_Tool__memoise'):
-      self._clearCache()
+    if not name.startswith('_Tool__'):
+      if hasattr(self, '_Tool__memoise'):
+        self._clearCache(name)
+      if name in self.__shared:
+        _toolLock.acquire()
+        try:
+          self.__shared = self.__shared.difference([name])
+        finally:
+          _toolLock.release()
     super(Tool, self).__setattr__(name, value)
   
-  def _clearCache(self):
+  def _unshare(self, *names):
+    """Copy values shared with a clone before they are modified in place.
+    
+    Methods that modify the value of an attribute in place, rather than
+    setting the attribute, must call this first.
+    
+    @param names: The names of the attributes about to be modified.
+    @type names: tuple of string
+    """
+    if self.__shared.isdisjoint(names):
+      return
+    _toolLock.acquire()
+    try:
+      values = self.__dict__
+      for name in names:
+        if name in self.__shared:
+          values[name] = cloneTools(values[name])
+      self.__shared = self.__shared.difference(names)
+    finally:
+      _toolLock.release()
+  
+  def __unshareMemoise(self):
+    # The dicts are copied but the results and users in them are never
+    # modified so are still shared.
+    if '_Tool__memoise' in self.__shared:
+      _toolLock.acquire()
+      try:
+        if '_Tool__memoise' in self.__shared:
+          self.__memoise = dict(self.__memoise)
+          self.__memoiseUsers = dict(self.__memoiseUsers)
+          self.__shared = self.__shared.difference(['_Tool__memoise'])
+      finally:
+        _toolLock.release()
+  
+  def __addUser(self, func, user):
+    users = self.__memoiseUsers.get(func, frozenset())
+    if user not in users:
+      self.__unshareMemoise()
+      self.__memoiseUsers[func] = users.union([user])
+
+  def __storeResult(self, func, key, result):
+    self.__unshareMemoise()
+    results = dict(self.__memoise.get(func, ()))
+    results[key] = result
+    self.__memoise[func] = results
+
+  def _clearCache(self, *names):
     """Clear the memoise cache due to some change.
+    
+    @param names: The names of the attributes that have changed. Only
+    results that depend on one of these attributes are cleared. If no
+    names are given the whole cache is cleared.
+    @type names: tuple of string
     """
-    self.__memoise.clear()
+    if not names:
+      self.__memoise = {}
+      self.__memoiseUsers = {}
+      return
+    
+    pending = [
+      func for func in self.__memoise
+      if func.depends is None or not func.depends.isdisjoint(names)
+      ]
+    if not pending:
+      return
+    
+    self.__unshareMemoise()
+    memoise = self.__memoise
+    users = self.__memoiseUsers
+    while pending:
+      func = pending.pop()
+      memoise.pop(func, None)
+      pending.extend(users.pop(func, ()))
   
   def clone(self):
     """Return an independent clone of this tool.
@@ -99,9 +217,31 @@ class Tool(object):
     types, and a clone of any Tool-derived objects. Everything else
     will be shallow copied. You should override this method if you
     need a more sophisticated clone.
+    
+    Builtin containers and memoised results are shared by the tool and
+    its clone, and copied by whichever of them first sets or modifies
+    them (see L{_unshare}), so cloning only costs as much as the number
+    of attributes.
     """
     new = object.__new__(self.__class__)
-    new.__dict__ = cloneTools(self.__dict__)
+    _toolLock.acquire()
+    try:
+      values = dict(self.__dict__)
+      shared = set(self.__shared)
+      for name, value in values.items():
+        if isinstance(value, Tool):
+          values[name] = value.clone()
+        elif isinstance(value, (dict, list, tuple, set)):
+          if not name.startswith('_Tool__'):
+            shared.add(name)
+      if '_Tool__memoise' in values:
+        shared.add('_Tool__memoise')
+      shared = frozenset(shared)
+      values['_Tool__shared'] = shared
+      self.__shared = shared
+      new.__dict__ = values
+    finally:
+      _toolLock.release()
     return new
 
 def cloneTools(obj):
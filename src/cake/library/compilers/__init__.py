@@ -13,6 +13,7 @@ import datetime
 import tempfile
 import subprocess
 import itertools
+import threading
 try:
   import cPickle as pickle
 except ImportError:
@@ -21,9 +22,11 @@ except ImportError:
 import cake.filesys
 import cake.hash
 import cake.path
+import cake.pchanalysis
 import cake.system
 import cake.zipping
 
+from cake.engine import DependencyInfoError
 from cake.gnu import parseDependencyFile
 from cake.async_util import AsyncResult, waitForAsyncResult, flatten, getResult
 from cake.target import FileTarget, getPath, getPaths, getTask, getTasks
@@ -31,6 +34,9 @@ from cake.task import Task
 from cake.library import Tool, memoise
 from cake.script import Script
 
+# Options that are joined to the path of the object they write.
+_targetOptions = ('-o', '/Fo', '-Fo')
+
 def _totalSeconds(td):
   """Return the total number of seconds for a datetime.timedelta value.
   """
@@ -80,20 +86,27 @@ class ObjectTarget(CompilerTarget):
 
   @ivar object: The object file target.
   @type object: L{FileTarget}
+  @ivar unityFile: The path of the generated unity source file the
+  object was compiled from, or None if it was not part of a unity build.
+  @type unityFile: string or None
   """
-  def __init__(self, path, task, compiler):
+  def __init__(self, path, task, compiler, unityFile=None):
     CompilerTarget.__init__(self, path, task, compiler)
     self.object = FileTarget(path, task)
+    self.unityFile = unityFile
   
 class LibraryTarget(CompilerTarget):
   """A library target.
 
   @ivar library: The library file target.
   @type library: L{FileTarget}
+  @ivar objects: The paths of the objects in the library.
+  @type objects: list of string
   """
-  def __init__(self, path, task, compiler):
+  def __init__(self, path, task, compiler, objects=None):
     CompilerTarget.__init__(self, path, task, compiler)
     self.library = FileTarget(path, task)
+    self.objects = list(objects or ())
 
 class ModuleTarget(CompilerTarget):
   """A module target.
@@ -104,8 +117,12 @@ class ModuleTarget(CompilerTarget):
   @type library: L{FileTarget}
   @ivar manifest: An optional manifest file target.
   @type manifest: L{FileTarget}
+  @ivar interfaceStub: The interface stub file target if the module was
+  built with L{Compiler.interfaceStubs} enabled. The stub is only written
+  for modules whose interface the compiler can read.
+  @type interfaceStub: L{FileTarget}
   """
-  def __init__(self, path, task, compiler, library, manifest):
+  def __init__(self, path, task, compiler, library, manifest, interfaceStub=None):
     CompilerTarget.__init__(self, path, task, compiler)
     self.module = FileTarget(path, task)
     if library is None:
@@ -116,6 +133,10 @@ class ModuleTarget(CompilerTarget):
       self.manifest = None
     else:
       self.manifest = FileTarget(manifest, task)
+    if interfaceStub is None:
+      self.interfaceStub = None
+    else:
+      self.interfaceStub = FileTarget(interfaceStub, task)
 
 class ProgramTarget(CompilerTarget):
   """A program target.
@@ -145,12 +166,18 @@ class ResourceTarget(CompilerTarget):
 
 def getLinkPaths(files):
   paths = []
+  unityPaths = set()
   for f in files:
     while isinstance(f, AsyncResult):
       f = f.result
     if isinstance(f, PchTarget):
       if f.object is not None:
         paths.append(f.object.path)
+    elif isinstance(f, ObjectTarget) and f.unityFile is not None:
+      # All sources in a unity file share the same object.
+      if f.path not in unityPaths:
+        unityPaths.add(f.path)
+        paths.append(f.path)
     elif isinstance(f, FileTarget):
       paths.append(f.path)
     else:
@@ -198,6 +225,70 @@ def _escapeArg(arg):
 def _escapeArgs(args):
   return [_escapeArg(arg) for arg in args]
 
+def _getCommandLineLength(args):
+  return sum(len(arg) + 1 for arg in args)
+
+def _prefixLines(prefix, text):
+  if not prefix:
+    return text
+  return "".join(prefix + line for line in text.splitlines(True))
+
+def _splitBatchOutput(text, sources):
+  """Split the output of a GNU-style compile of several sources into the
+  output for each source.
+
+  The compiler reports each source in turn. Every diagnostic names the
+  source it is for, either at the start of its first line or in the
+  'In file included from' lines before it, so the output moves on to a
+  later source at the first diagnostic that names it.
+
+  @return: A list of the output text of each source.
+  @rtype: list of string
+  """
+  outputs = [[] for _ in sources]
+  index = 0
+  includeLines = []
+
+  def findSource(line):
+    line = line.lstrip()
+    for prefix in ("In file included from ", "from "):
+      if line.startswith(prefix):
+        line = line[len(prefix):]
+        break
+    for i in range(index + 1, len(sources)):
+      if line.startswith(sources[i] + ":"):
+        return i
+    return index
+
+  for line in text.splitlines(True):
+    stripped = line.lstrip()
+    if stripped.startswith("In file included from ") or \
+       (includeLines and stripped.startswith("from ")):
+      includeLines.append(line)
+      continue
+    for includeLine in includeLines + [line]:
+      index = findSource(includeLine)
+    outputs[index].extend(includeLines)
+    outputs[index].append(line)
+    includeLines = []
+  outputs[index].extend(includeLines)
+
+  return ["".join(output) for output in outputs]
+
+_batchOutputs = set()
+_batchOutputsCondition = threading.Condition()
+
+def _readLines(stream, callback, task=None):
+  # Output read on another thread belongs to the task that started the
+  # process, so that the logger can group it with the task's other output.
+  if task is not None:
+    Task._current.value = task
+  try:
+    for line in iter(stream.readline, ''):
+      callback(line)
+  finally:
+    stream.close()
+
 class Compiler(Tool):
   """Base class for C/C++ compiler tools.
   """
@@ -291,6 +382,29 @@ class Compiler(Tool):
   If the value is None the compiler default output is used.
   @type: enum or None
   """
+  prefixOutput = False
+  """Prefix each line of compiler output with the name of its target.
+
+  Enabling this makes it possible to tell which target each line is
+  for, eg::
+    [foo.o] foo.c:3:1: error: expected ';' before '}' token
+
+  The prefix is always added if L{streamOutput} is enabled, and never
+  added if L{messageStyle} is L{MSVS_CLICKABLE}.
+  @type: bool
+  """
+  streamOutput = False
+  """Show compiler output a line at a time as it is produced.
+
+  By default the output of each compiler process is shown all at once
+  when the process exits, so the output of targets built in parallel
+  doesn't interleave. If enabled the output of parallel builds is
+  interleaved line by line, so each line is prefixed with the name of
+  its target as if L{prefixOutput} were enabled.
+
+  Compilers whose messages span several lines ignore this.
+  @type: bool
+  """
   enableRtti = None
   """Enable Run-Time Type Information for C++ compilation.
   
@@ -382,7 +496,8 @@ class Compiler(Tool):
   
   If enabled a response file will be generated containing the compiler
   command line options, and this file will be passed to the compiler
-  rather than the options themselves.
+  rather than the options themselves. A response file is only used for
+  command lines longer than L{responseFileThreshold} characters.
   
   This enables you to compile large projects on systems that have
   restrictive command line length limits.
@@ -391,6 +506,14 @@ class Compiler(Tool):
   turning it on may prevent compilation from succeeding.
   @type: bool
   """
+  responseFileThreshold = 8000
+  """The command line length above which a response file is used.
+
+  Only used if L{useResponseFile} is enabled. The default is below the
+  8191 character limit of the Windows command interpreter. Set it to 0 to
+  always use a response file.
+  @type: int
+  """
   useIncrementalLinking = None
   """Use incremental linking.
   
@@ -481,6 +604,183 @@ class Compiler(Tool):
   files referring to paths in the wrong workspace.
   @type: string or None
   """
+  objectCachePreprocessorMode = None
+  """Use the preprocessed source as an additional object cache key.
+
+  By default objects are looked up in the object cache using the
+  dependencies recorded by previous compiles of the same target path.
+  A target that has never been built at this path (eg. a fresh workspace
+  at a different root or a renamed output directory) will never find a
+  cached object.
+
+  If enabled, and no cached object is found that way, the source file is
+  run through the preprocessor and the object is looked up by the digest
+  of the preprocessed output and the compiler arguments instead. The
+  target and source paths are excluded from the digest and any paths
+  under L{objectCacheWorkspaceRoot} are made relative to it.
+
+  This costs one preprocessor run per object that is rebuilt, so it is
+  best suited to cold builds such as CI workspaces. Only compilers that
+  support preprocessing to stdout (eg. GCC/Clang) use this mode and
+  objects built using a precompiled header are not looked up this way.
+
+  Related compiler options::
+    GCC:  -E
+  @type: bool
+  """
+  objectCachePrewarm = False
+  """Look up objects in the object cache ahead of compiling.
+
+  If enabled, the object cache is searched for out of date objects on a
+  separate pool of L{objectCachePrewarmWindow} threads as soon as they
+  are known to be needed, rather than on the thread that schedules
+  compiles. This keeps many lookups in flight at once, which hides the
+  latency of an object cache on a network drive, and an object is only
+  compiled once its lookup misses.
+  @type: bool
+  """
+  objectCachePrewarmWindow = 8
+  """The maximum number of object cache lookups in flight at once.
+
+  Only the first value used in a build takes effect.
+  @type: int
+  """
+  unityBuild = False
+  """Compile sources in groups using generated unity source files.
+
+  If enabled, L{objects} and L{sharedObjects} combine C and C++ sources
+  into generated unity source files that #include up to L{unitySize}
+  sources each, and compile each unity file to a single object. This
+  avoids parsing common headers once per source and can greatly reduce
+  total build time, but sources must not define conflicting static
+  functions or variables.
+
+  A unity file is only rewritten when the list of sources it includes
+  changes. Each source still returns its own L{ObjectTarget}, whose path
+  is the path of the unity object it was compiled into.
+  @type: bool
+  """
+  unitySize = 8
+  """The maximum number of sources in each unity source file.
+
+  @type: int
+  """
+  unityMaxBytes = None
+  """The maximum combined size in bytes of the sources in each unity
+  source file.
+
+  If None the number of sources in a unity file is only limited by
+  L{unitySize}.
+  @type: int or None
+  """
+  batchCompile = False
+  """Compile several sources with a single compiler invocation.
+
+  If enabled, L{objects} and L{sharedObjects} compile out of date sources
+  that share the same compiler arguments together, up to L{batchSize} at a
+  time, saving the cost of starting the compiler for each source. The
+  compiler's output is split up and reported against each object, and
+  objects that compiled are kept if others in the batch fail.
+
+  Batches are compiled in the same directory and with the same arguments
+  as single compiles. The compiler writes each object to that directory,
+  named after its source, before it is moved to its target, so sources
+  are only batched if no such file already exists there. Only compilers
+  that support multiple sources per invocation (eg. GCC/Clang) batch
+  compiles, and objects using a precompiled header or an object cache
+  are not batched.
+  @type: bool
+  """
+  batchSize = 16
+  """The maximum number of sources compiled by each batch.
+
+  @type: int
+  """
+  incrementalArchive = False
+  """Update libraries in place when only some of their objects change.
+
+  If enabled, a library that is out of date only because some of its
+  objects were rebuilt, added or removed is updated by replacing and
+  deleting just those members rather than being archived again from all
+  of its objects. If anything else about the library changed it is
+  rebuilt from scratch as usual.
+
+  Archivers identify members by file name, so libraries containing
+  objects with the same file name are always rebuilt. Only compilers
+  that use a GNU-style archiver (eg. GCC/Clang) update libraries in place.
+
+  Related compiler options::
+    GCC:  ar -rs, ar -ds
+  @type: bool
+  """
+  thinArchive = False
+  """Build thin archives.
+
+  A thin archive stores the paths of its objects rather than copies of
+  them, which makes archiving much faster and saves disk space. The
+  library can only be used while its objects exist at the same paths,
+  so thin archives are not suitable for distribution.
+
+  Related compiler options::
+    GCC:  ar -T
+  @type: bool
+  """
+  interfaceStubs = False
+  """Only relink against modules whose interface has changed.
+
+  If enabled, building a module also writes an interface stub file next
+  to it containing the module's soname and exported symbols, and programs
+  and modules that link against the module depend on the stub instead of
+  the module itself. The stub is only rewritten when the interface
+  changes, so changes to the implementation of a module don't cause
+  everything that links against it to be relinked. The stub is one of the
+  module's targets, available as L{ModuleTarget.interfaceStub}.
+
+  Both the module and the programs and modules linking against it must
+  be built with this enabled. Only compilers producing ELF modules (eg.
+  GCC/Clang on Linux) write interface stubs.
+  @type: bool
+  """
+  autoPch = False
+  """Automatically use a precompiled header for the sources of objects.
+
+  If enabled, L{objects} uses the dependencies recorded when its objects
+  were last built to find the headers included directly by at least
+  L{pchMinFraction} of its C and C++ sources. If precompiling them is
+  estimated to save parsing at least L{autoPchThreshold} bytes of headers,
+  a header including them is generated in the target directory and
+  precompiled, and every C and C++ source is compiled using it.
+
+  Objects are compiled without a precompiled header until they have been
+  built once. The chosen headers are included before the rest of each
+  source, so sources must not define macros that change their meaning.
+  Only compilers that can force the use of a precompiled header (eg. GCC)
+  use this, and it is ignored if a pch is given or if L{unityBuild} is
+  enabled.
+  @type: bool
+  """
+  autoPchThreshold = 4 * 1024 * 1024
+  """The estimated number of bytes of headers a precompiled header must
+  save parsing before L{autoPch} uses it.
+
+  @type: int
+  """
+  pchMinFraction = 0.5
+  """The fraction of sources that must include a header directly for it
+  to be put in an automatic or suggested precompiled header.
+
+  @type: float
+  """
+  shareCompiles = False
+  """Share the result of identical compiles.
+
+  If enabled, an object whose compiler arguments (apart from the target
+  path) and source are identical to those of another object compiled
+  during the same build, eg. by another variant or script, is copied from
+  that object instead of being compiled again. Objects whose compile
+  produces other files, such as a program database, are always compiled.
+  @type: bool
+  """
   language = None
   """Set the compilation language.
   
@@ -626,6 +926,11 @@ class Compiler(Tool):
 
   @type: string or None
   """
+  interfaceStubSuffix = '.ifs'
+  """The suffix to use for module interface stub files.
+
+  @type: string
+  """
   resourceSuffix = '.o'
   """The suffix to use for resource files.
 
@@ -635,6 +940,14 @@ class Compiler(Tool):
   # The name of this compiler
   _name = 'unknown'
 
+  # Whether process output can be passed on a line at a time as it is
+  # produced rather than all at once when the process exits.
+  _canStreamOutput = True
+
+  # Whether objects compiled with a pch include its header implicitly,
+  # which is required to use automatic precompiled headers.
+  _pchIsForcedInclude = False
+
   # Map of engine to map of library path to list of object paths
   __libraryObjects = weakref.WeakKeyDictionary()
   
@@ -693,8 +1006,9 @@ class Compiler(Tool):
     @param flag: The flag to add.
     @type flag: string
     """
+    self._unshare('cFlags')
     self.cFlags.append(flag)
-    self._clearCache()
+    self._clearCache('cFlags')
     
   def addCppFlag(self, flag):
     """Add a flag to be used during .cpp compilation.
@@ -702,8 +1016,9 @@ class Compiler(Tool):
     @param flag: The flag to add.
     @type flag: string
     """
+    self._unshare('cppFlags')
     self.cppFlags.append(flag)
-    self._clearCache()
+    self._clearCache('cppFlags')
 
   def addMFlag(self, flag):
     """Add a flag to be used during Objective C compilation.
@@ -711,8 +1026,9 @@ class Compiler(Tool):
     @param flag: The flag to add.
     @type flag: string
     """
+    self._unshare('mFlags')
     self.mFlags.append(flag)
-    self._clearCache()
+    self._clearCache('mFlags')
 
   def addMmFlag(self, flag):
     """Add a flag to be used during Objective C++ compilation.
@@ -720,8 +1036,9 @@ class Compiler(Tool):
     @param flag: The flag to add.
     @type flag: string
     """
+    self._unshare('mmFlags')
     self.mmFlags.append(flag)
-    self._clearCache()
+    self._clearCache('mmFlags')
     
   def addLibraryFlag(self, flag):
     """Add a flag to be used during library compilation.
@@ -729,8 +1046,9 @@ class Compiler(Tool):
     @param flag: The flag to add.
     @type flag: string
     """
+    self._unshare('libraryFlags')
     self.libraryFlags.append(flag)
-    self._clearCache()
+    self._clearCache('libraryFlags')
     
   def addModuleFlag(self, flag):
     """Add a flag to be used during linking of modules.
@@ -738,8 +1056,9 @@ class Compiler(Tool):
     @param flag: The flag to add.
     @type flag: string
     """
+    self._unshare('moduleFlags')
     self.moduleFlags.append(flag)
-    self._clearCache()
+    self._clearCache('moduleFlags')
     
   def addProgramFlag(self, flag):
     """Add a flag to be used during linking of programs.
@@ -747,8 +1066,9 @@ class Compiler(Tool):
     @param flag: The flag to add.
     @type flag: string
     """
+    self._unshare('programFlags')
     self.programFlags.append(flag)
-    self._clearCache()
+    self._clearCache('programFlags')
 
   def addResourceFlag(self, flag):
     """Add a flag to be used during resource compilation.
@@ -756,8 +1076,9 @@ class Compiler(Tool):
     @param flag: The flag to add.
     @type flag: string
     """
+    self._unshare('resourceFlags')
     self.resourceFlags.append(flag)
-    self._clearCache()
+    self._clearCache('resourceFlags')
     
   def addIncludePath(self, path):
     """Add an include path to the preprocessor search path.
@@ -768,8 +1089,9 @@ class Compiler(Tool):
     @param path: The path to add.
     @type path: string
     """
+    self._unshare('includePaths')
     self.includePaths.append(self.configuration.basePath(path))
-    self._clearCache()
+    self._clearCache('includePaths')
     
   def insertIncludePath(self, index, path):
     """Insert an include path into the preprocessor search paths.
@@ -782,8 +1104,9 @@ class Compiler(Tool):
     @param path: The path to add.
     @type path: string
     """
+    self._unshare('includePaths')
     self.includePaths.insert(index, self.configuration.basePath(path))
-    self._clearCache()
+    self._clearCache('includePaths')
         
   def getIncludePaths(self):
     """Get an iterator for include paths.
@@ -804,11 +1127,12 @@ class Compiler(Tool):
     @param value: An optional value for the define.
     @type value: string or None
     """
+    self._unshare('defines')
     if value is None:
       self.defines.append(name)
     else:
       self.defines.append("%s=%s" % (name, value))
-    self._clearCache()
+    self._clearCache('defines')
     
   def insertDefine(self, index, name, value=None):
     """Insert a define into the preprocessor command-line.
@@ -823,11 +1147,12 @@ class Compiler(Tool):
     @param value: An optional value for the define.
     @type value: string or None
     """
+    self._unshare('defines')
     if value is None:
       self.defines.insert(index, name)
     else:
       self.defines.insert(index, "%s=%s" % (name, value))
-    self._clearCache()
+    self._clearCache('defines')
 
   def getDefines(self):
     """Get an iterator for preprocessor defines.
@@ -848,8 +1173,9 @@ class Compiler(Tool):
     to be relative to a previously defined includePath. 
     @type path: string
     """
+    self._unshare('forcedIncludes')
     self.forcedIncludes.append(self.configuration.basePath(path))
-    self._clearCache()
+    self._clearCache('forcedIncludes')
   
   def insertForcedInclude(self, index, path):
     """Insert a forcibly included file into the command-line.
@@ -862,8 +1188,9 @@ class Compiler(Tool):
     to be relative to a previously defined includePath. 
     @type path: string
     """
+    self._unshare('forcedIncludes')
     self.forcedIncludes.insert(index, self.configuration.basePath(path))
-    self._clearCache()
+    self._clearCache('forcedIncludes')
     
   def getForcedIncludes(self):
     """Get an iterator for forced includes.
@@ -872,7 +1199,56 @@ class Compiler(Tool):
     should be included.
     """
     return self.forcedIncludes
-  
+
+  def scanIncludes(self, source):
+    """Find the headers a source file includes without compiling it.
+
+    The headers are found by following #include directives using the
+    current include paths and forced includes. This is an approximation
+    of what the compiler will include: conditional includes are always
+    followed and headers that can't be found in the include paths (such
+    as system headers) are ignored.
+
+    Results are memoised engine-wide by each file's path and modification
+    time, so scanning many sources that share headers is cheap.
+
+    @param source: Path of the source file to scan.
+    @type source: string or L{FileTarget}
+
+    @return: The absolute paths of the headers included directly or
+    indirectly by the source.
+    @rtype: list of string
+    """
+    abspath = self.configuration.abspath
+    return self.engine.includeScanner.scan(
+      abspath(getPath(source)),
+      [abspath(p) for p in getPaths(self.getIncludePaths())],
+      [abspath(p) for p in getPaths(self.getForcedIncludes())],
+      )
+
+  def findSourcesIncluding(self, header, sources):
+    """Find which source files include a header without compiling them.
+
+    @param header: Path of the header file.
+    @type header: string or L{FileTarget}
+
+    @param sources: The source files to search.
+    @type sources: list of string or L{FileTarget}
+
+    @return: The source files, as passed in, that include the header
+    directly or indirectly.
+    @rtype: list of string or L{FileTarget}
+
+    @see: L{scanIncludes}
+    """
+    absHeader = os.path.normpath(self.configuration.abspath(getPath(header)))
+    absHeader = os.path.normcase(absHeader)
+    normcase = os.path.normcase
+    return [
+      s for s in sources
+      if absHeader in set(normcase(h) for h in self.scanIncludes(s))
+      ]
+
   def addObjectPrerequisites(self, prerequisites):
     """Add a prerequisite that must complete before building object files.
     
@@ -898,8 +1274,9 @@ class Compiler(Tool):
     @param name: Name/path of the library to link with.
     @type name: string
     """
+    self._unshare('libraries')
     self.libraries.append(name)
-    self._clearCache()
+    self._clearCache('libraries')
 
   def insertLibrary(self, index, name):
     """Insert a library into the list of libraries to link with.
@@ -912,8 +1289,9 @@ class Compiler(Tool):
     @param name: Name/path of the library to link with.
     @type name: string
     """
+    self._unshare('libraries')
     self.libraries.insert(index, name)
-    self._clearCache()
+    self._clearCache('libraries')
     
   def getLibraries(self):
     """Get an iterator for libraries.
@@ -932,8 +1310,9 @@ class Compiler(Tool):
     @param path: The path to add.
     @type path: string
     """
+    self._unshare('libraryPaths')
     self.libraryPaths.append(self.configuration.basePath(path))
-    self._clearCache()
+    self._clearCache('libraryPaths')
 
   def insertLibraryPath(self, index, path):
     """Insert a path into the list of library search paths.
@@ -946,8 +1325,9 @@ class Compiler(Tool):
     @param path: The path to add.
     @type path: string
     """
+    self._unshare('libraryPaths')
     self.libraryPaths.insert(index, self.configuration.basePath(path))
-    self._clearCache()
+    self._clearCache('libraryPaths')
       
   def getLibraryPaths(self):
     """Get an iterator for library paths.
@@ -963,8 +1343,9 @@ class Compiler(Tool):
     @param path: Path of the module to copy.
     @type path: string
     """
+    self._unshare('modules')
     self.modules.append(self.configuration.basePath(path))
-    self._clearCache()
+    self._clearCache('modules')
     
   def copyModulesTo(self, targetDir, **kwargs):
     """Copy modules to the given target directory.
@@ -1012,7 +1393,10 @@ class Compiler(Tool):
       engine.logger.outputInfo("Copying %s to %s\n" % (source, target))
       
       try:
-        cake.filesys.makeDirs(cake.path.dirName(targetAbsPath))
+        cake.filesys.makeDirs(
+          cake.path.dirName(targetAbsPath),
+          self.engine.knownDirectories,
+          )
         cake.filesys.copyFile(sourceAbsPath, targetAbsPath)
       except EnvironmentError as e:
         engine.raiseError("%s: %s\n" % (target, str(e)))
@@ -1259,7 +1643,7 @@ class Compiler(Tool):
       
     return run(target, source, pch, allPrerequisites)
     
-  @memoise
+  @memoise('forcedIncludes')
   def _getObjectPrerequisiteTasks(self):
     """Return a list of the tasks that are prerequisites for
     building an object file.
@@ -1293,6 +1677,12 @@ class Compiler(Tool):
     
     @waitForAsyncResult
     def run(targetDir, sources, prerequisites):
+      if compiler.unityBuild:
+        return compiler._unityObjects(targetDir, sources, pch, prerequisites)
+      if compiler.autoPch and compiler._pchIsForcedInclude and pch is None:
+        return compiler._autoPchObjects(targetDir, sources, prerequisites)
+      if compiler.batchCompile and pch is None:
+        return compiler._batchObjects(targetDir, sources, prerequisites)
       results = []
       for source in sources:
         sourcePath = getPath(source)
@@ -1306,6 +1696,315 @@ class Compiler(Tool):
     
     return run(basePath(targetDir), basePath(flatten(sources)), prerequisites)
 
+  def suggestPchHeaders(self, objects):
+    """Rank the headers that could be put in a precompiled header for
+    a set of objects.
+
+    The ranking uses the dependencies recorded when the objects were last
+    built, so objects that haven't been built yet are ignored.
+
+    @param objects: The paths of the objects.
+    @type objects: list of string
+
+    @return: A tuple of the headers sorted from the most to the least
+    total cost, and the number of objects that were analysed. Use
+    L{cake.pchanalysis.selectHeaders} to choose which of them to
+    precompile.
+    @rtype: tuple of (list of L{cake.pchanalysis.HeaderCandidate}, int)
+    """
+    engine = self.engine
+    abspath = self.configuration.abspath
+    pchSuffix = os.path.normcase(self.pchSuffix)
+
+    dependencyLists = []
+    for objectPath in objects:
+      try:
+        dependencyInfo = engine.getDependencyInfo(abspath(objectPath))
+      except DependencyInfoError:
+        continue # Not built yet
+
+      # The first dependency is the compiler and the second the source.
+      paths = dependencyInfo.depPaths
+      if len(paths) < 2:
+        continue
+      headers = [
+        abspath(p) for p in paths[2:]
+        if not os.path.normcase(p).endswith(pchSuffix)
+        ]
+      dependencyLists.append((abspath(paths[1]), headers))
+
+    candidates = cake.pchanalysis.rankHeaders(
+      dependencyLists,
+      engine.includeScanner.getIncludes,
+      os.path.getsize,
+      )
+    return candidates, len(dependencyLists)
+
+  def _autoPchObjects(self, targetDir, sources, prerequisites):
+    # C and C++ sources need separate precompiled headers.
+    groups = {}
+    results = []
+    for source in sources:
+      sourcePath = getPath(source)
+      suffix = cake.path.extension(sourcePath)
+      if suffix in self.cSuffixes:
+        key = '.h'
+      elif suffix in self.cppSuffixes:
+        key = '.hpp'
+      else:
+        key = None
+      sourceName = cake.path.baseNameWithoutExtension(sourcePath)
+      targetPath = cake.path.join(targetDir, sourceName)
+      groups.setdefault(key, []).append((len(results), targetPath, source))
+      results.append(None)
+
+    for key, group in groups.items():
+      pch = None
+      if key is not None:
+        objectPaths = [t + self.objectSuffix for _, t, _ in group]
+        pch = self._autoPch(targetDir, key, objectPaths, prerequisites)
+      for index, targetPath, source in group:
+        results[index] = self._object(targetPath, source, pch=pch,
+                                      prerequisites=prerequisites)
+    return results
+
+  def _autoPch(self, targetDir, headerSuffix, objectPaths, prerequisites):
+    """Get the automatic precompiled header for some objects.
+
+    @return: The L{PchTarget} to use or None if a precompiled header
+    isn't worthwhile.
+    """
+    candidates, objectCount = self.suggestPchHeaders(objectPaths)
+    headers, saving = cake.pchanalysis.selectHeaders(
+      candidates,
+      objectCount,
+      self.pchMinFraction,
+      )
+    if not headers or saving < self.autoPchThreshold:
+      return None
+
+    headerPath = cake.path.join(targetDir, 'cake-pch' + headerSuffix)
+    lines = [h.getIncludeDirective() for h in headers]
+
+    if self.enabled:
+      headerTask = self.engine.createTask(
+        lambda h=headerPath, l=lines, c=self: c._writePchHeader(h, l)
+        )
+      headerTask.lazyStart(threadPool=self.engine.scriptThreadPool)
+    else:
+      headerTask = None
+
+    header = FileTarget(headerPath, headerTask)
+    return self._pch(headerPath, header, headerPath, prerequisites)
+
+  def _writePchHeader(self, path, lines):
+    """Write a generated precompiled header if its contents have changed.
+    """
+    data = "".join(
+      ["/* Generated by Cake. Do not edit. */\n"] +
+      [line + "\n" for line in lines]
+      ).encode("utf8")
+
+    absPath = self.configuration.abspath(path)
+    try:
+      if cake.filesys.readFile(absPath) == data:
+        return
+    except EnvironmentError:
+      pass
+
+    self.engine.logger.outputDebug(
+      "reason",
+      "Generating '%s' because its headers have changed.\n" % path,
+      )
+    cake.filesys.makeDirs(cake.path.dirName(absPath), self.engine.knownDirectories)
+    cake.filesys.writeFile(absPath, data)
+    self.engine.notifyFileChanged(absPath)
+
+  def _getUnityGroups(self, sources):
+    """Group sources into the sources of each unity file.
+
+    @return: A list of groups in the order they were found, where each
+    group is a list of (index, source) tuples. Sources that can't be
+    included in a unity file are put in a group of their own.
+    """
+    groups = []
+    openGroups = {}
+    for index, source in enumerate(sources):
+      sourcePath = getPath(source)
+      suffix = cake.path.extension(sourcePath)
+      if suffix in self.cSuffixes:
+        key = 'c'
+      elif suffix in self.cppSuffixes:
+        key = 'c++'
+      else:
+        groups.append([(index, source)])
+        continue
+
+      size = 0
+      if self.unityMaxBytes is not None:
+        try:
+          size = os.path.getsize(self.configuration.abspath(sourcePath))
+        except EnvironmentError:
+          pass # Generated sources may not exist yet
+
+      entries, groupSize = openGroups.get(key, (None, 0))
+      if entries is None or len(entries) >= self.unitySize or (
+        self.unityMaxBytes is not None and
+        groupSize + size > self.unityMaxBytes
+        ):
+        entries, groupSize = [], 0
+        groups.append(entries)
+      entries.append((index, source))
+      openGroups[key] = (entries, groupSize + size)
+    return groups
+
+  def _unityObjects(self, targetDir, sources, pch, prerequisites,
+                    shared=False):
+    results = [None] * len(sources)
+    for group in self._getUnityGroups(sources):
+      if len(group) == 1:
+        index, source = group[0]
+        sourcePath = getPath(source)
+        sourceName = cake.path.baseNameWithoutExtension(sourcePath)
+        targetPath = cake.path.join(targetDir, sourceName)
+        results[index] = self._object(targetPath, source, pch=pch,
+                                      prerequisites=prerequisites,
+                                      shared=shared)
+        continue
+
+      # Name the unity file after its first source so that its path only
+      # changes if the first source of the group changes.
+      groupSources = [source for _, source in group]
+      firstPath = getPath(groupSources[0])
+      unityName = cake.path.baseNameWithoutExtension(firstPath) + '.unity'
+      unityPath = cake.path.join(
+        targetDir,
+        unityName + cake.path.extension(firstPath),
+        )
+      sourcePaths = [
+        self.configuration.abspath(getPath(s)) for s in groupSources
+        ]
+
+      if self.enabled:
+        unityTask = self.engine.createTask(
+          lambda u=unityPath, s=sourcePaths, c=self: c._writeUnityFile(u, s)
+          )
+        unityTask.lazyStart(threadPool=self.engine.scriptThreadPool)
+      else:
+        unityTask = None
+
+      unityObject = self._object(
+        cake.path.join(targetDir, unityName),
+        FileTarget(unityPath, unityTask),
+        pch=pch,
+        prerequisites=[groupSources, prerequisites],
+        shared=shared,
+        )
+      for index, source in group:
+        results[index] = self._makeUnityMember(unityObject, unityPath,
+                                               getPath(source))
+    return results
+
+  @waitForAsyncResult
+  def _makeUnityMember(self, unityObject, unityPath, sourcePath):
+    objectTarget = ObjectTarget(
+      path=unityObject.path,
+      task=unityObject.task,
+      compiler=self,
+      unityFile=unityPath,
+      )
+    currentScript = Script.getCurrent()
+    currentScript.getTarget(cake.path.baseName(sourcePath)).addTarget(objectTarget)
+    return objectTarget
+
+  def _writeUnityFile(self, path, sourcePaths):
+    """Write a unity source file if its contents have changed.
+    """
+    lines = ["/* Generated by Cake. Do not edit. */\n"]
+    for sourcePath in sourcePaths:
+      lines.append('#include "%s"\n' % sourcePath.replace('\\', '/'))
+    data = "".join(lines).encode("utf8")
+
+    absPath = self.configuration.abspath(path)
+    try:
+      if cake.filesys.readFile(absPath) == data:
+        return
+    except EnvironmentError:
+      pass
+
+    self.engine.logger.outputDebug(
+      "reason",
+      "Generating '%s' because its sources have changed.\n" % path,
+      )
+    cake.filesys.writeFile(absPath, data)
+    self.engine.notifyFileChanged(absPath)
+
+  def _batchObjects(self, targetDir, sources, prerequisites, shared=False):
+    # Sources with the same suffix are compiled with the same arguments.
+    batches = []
+    openBatches = {}
+    for index, source in enumerate(sources):
+      sourcePath = getPath(source)
+      suffix = cake.path.extension(sourcePath)
+      batch = openBatches.get(suffix, None)
+      if batch is None or len(batch) >= self.batchSize:
+        batch = openBatches[suffix] = []
+        batches.append(batch)
+      batch.append((index, source))
+
+    results = [None] * len(sources)
+    for batch in batches:
+      indices = [index for index, _ in batch]
+      batch = [source for _, source in batch]
+      targets = []
+      for source in batch:
+        sourcePath = getPath(source)
+        sourceName = cake.path.baseNameWithoutExtension(sourcePath)
+        targetPath = cake.path.join(targetDir, sourceName)
+        targets.append(cake.path.forceExtension(targetPath, self.objectSuffix))
+
+      if len(batch) == 1 or self.objectCachePath is not None:
+        for index, target, source in zip(indices, targets, batch):
+          results[index] = self._object(target, source,
+                                        prerequisites=prerequisites,
+                                        shared=shared)
+        continue
+
+      sourcePaths = [getPath(source) for source in batch]
+      if self.enabled:
+        batchTask = self.engine.createTask(
+          lambda t=targets, s=sourcePaths, h=shared, c=self:
+            c.buildObjectBatch(t, s, h)
+          )
+        self._startBatchTask(batchTask, flatten([
+          batch,
+          prerequisites,
+          self.objectPrerequisites,
+          self._getObjectPrerequisiteTasks(),
+          ]))
+      else:
+        batchTask = None
+
+      currentScript = Script.getCurrent()
+      for index, target, sourcePath in zip(indices, targets, sourcePaths):
+        objectTarget = ObjectTarget(
+          path=target,
+          task=batchTask,
+          compiler=self,
+          )
+        currentScript.getDefaultTarget().addTarget(objectTarget)
+        currentScript.getTarget("objects").addTarget(objectTarget)
+        currentScript.getTarget(cake.path.baseName(target)).addTarget(objectTarget)
+        currentScript.getTarget(cake.path.baseName(sourcePath)).addTarget(objectTarget)
+        results[index] = objectTarget
+
+    return results
+
+  @waitForAsyncResult
+  def _startBatchTask(self, batchTask, prerequisites):
+    tasks = getTasks(prerequisites)
+    batchTask.lazyStartAfter(tasks, threadPool=self.engine.scriptThreadPool)
+
   def sharedObjects(self, targetDir, sources, pch=None, prerequisites=[],
                     **kwargs):
     """Build a collection of objects used by a shared library/module to a target directory.
@@ -1334,6 +2033,12 @@ class Compiler(Tool):
 
     @waitForAsyncResult
     def run(targetDir, sources, prerequisites):
+      if compiler.unityBuild:
+        return compiler._unityObjects(targetDir, sources, pch, prerequisites,
+                                      shared=True)
+      if compiler.batchCompile and pch is None:
+        return compiler._batchObjects(targetDir, sources, prerequisites,
+                                      shared=True)
       results = []
       for source in sources:
         sourcePath = getPath(source)
@@ -1437,6 +2142,7 @@ class Compiler(Tool):
         path=target,
         task=libraryTask,
         compiler=self,
+        objects=getLinkPaths(sources),
         )
       currentScript = Script.getCurrent()
       currentScript.getDefaultTarget().addTarget(libraryTarget)
@@ -1552,6 +2258,11 @@ class Compiler(Tool):
       else:
         manifest = target + self.manifestSuffix
   
+      if self.interfaceStubs:
+        interfaceStub = target + self.interfaceStubSuffix
+      else:
+        interfaceStub = None
+
       if self.enabled:
         def build():
           paths = getLinkPaths(sources)
@@ -1571,6 +2282,7 @@ class Compiler(Tool):
         compiler=self,
         library=importLibrary,
         manifest=manifest,
+        interfaceStub=interfaceStub,
         )
 
       currentScript = Script.getCurrent()
@@ -1840,7 +2552,7 @@ class Compiler(Tool):
     else:
       return None
         
-  @memoise
+  @memoise()
   def _getProcessEnv(self):
     temp = os.environ.get('TMP', os.environ.get('TEMP', os.getcwd()))
     env = {
@@ -1867,6 +2579,18 @@ class Compiler(Tool):
       
     return env
 
+  def _getOutputPrefix(self, target):
+    """Get the prefix to add to each line of output when building a target.
+    """
+    if (self.prefixOutput or self._isStreamingOutput()) and \
+       target is not None and \
+       self.messageStyle != self.MSVS_CLICKABLE:
+      return "[%s] " % cake.path.baseName(target)
+    return ""
+
+  def _isStreamingOutput(self):
+    return self.streamOutput and self._canStreamOutput
+
   def _outputStderr(self, text):
     text = text.replace("\r\n", "\n")
     self.engine.logger.outputError(text)
@@ -1914,25 +2638,25 @@ class Compiler(Tool):
     processStderr=None,
     processExitCode=None,
     allowResponseFile=True,
+    cwd=None,
     ):
 
     if target is not None:
       absTarget = self.configuration.abspath(target)
       try:
-        cake.filesys.makeDirs(cake.path.dirName(absTarget))
+        cake.filesys.makeDirs(
+          cake.path.dirName(absTarget),
+          self.engine.knownDirectories,
+          )
       except Exception as e:
         msg = "cake: Error creating target directory %s: %s\n" % (
           cake.path.dirName(target), str(e))
         self.engine.raiseError(msg, targets=[target])
 
-    stdout = None
-    stderr = None
     argsPath = None
     try:
-      stdout = tempfile.TemporaryFile(mode="w+t")
-      stderr = tempfile.TemporaryFile(mode="w+t")
-      
-      if allowResponseFile and self.useResponseFile:
+      if allowResponseFile and self.useResponseFile and \
+         _getCommandLineLength(args) > self.responseFileThreshold:
         argsTemp, argsPath = tempfile.mkstemp(text=True)
         argsFileString = "\n".join(_escapeArgs(args[1:]))
         argsFile = os.fdopen(argsTemp, "wt")
@@ -1956,34 +2680,61 @@ class Compiler(Tool):
         start = datetime.datetime.utcnow()
         
       if cake.system.isWindows():
-        # Use shell=False to avoid command line length limits.
         executable = self.configuration.abspath(args[0])
-        shell = False
       else:
-        # Use shell=True to allow arguments to be escaped exactly as they
-        # would be on the command line.
         executable = None
-        shell = True
       
+      prefix = self._getOutputPrefix(target)
+      if processStdout is None:
+        processStdout = lambda text: self._outputStdout(_prefixLines(prefix, text))
+      if processStderr is None:
+        processStderr = lambda text: self._outputStderr(_prefixLines(prefix, text))
+
+      isStreaming = self._isStreamingOutput()
+      if isStreaming:
+        onStdout, onStderr = processStdout, processStderr
+      else:
+        stdoutLines = []
+        stderrLines = []
+        onStdout, onStderr = stdoutLines.append, stderrLines.append
+
+      # Execute the program directly from the argument list rather than
+      # through a shell, and read its output through pipes rather than
+      # temporary files.
       try:
         p = subprocess.Popen(
-          args=argsString,
+          args=args,
           executable=executable,
-          shell=shell,
-          cwd=self.configuration.baseDir,
+          cwd=cwd or self.configuration.baseDir,
           env=self._getProcessEnv(),
-          stdin=subprocess.PIPE,
-          stdout=stdout,
-          stderr=stderr,
+          stdin=subprocess.DEVNULL,
+          stdout=subprocess.PIPE,
+          stderr=subprocess.PIPE,
+          universal_newlines=True,
+          errors="replace",
           )
       except EnvironmentError as e:
         self.engine.raiseError(
           "cake: failed to launch %s: %s\n" % (args[0], str(e)),
           targets=[target],
           )
-      p.stdin.close()
   
-      exitCode = p.wait()
+      # Pass on output a line at a time as it is produced. Both pipes
+      # must be drained at once or the process may block writing to one.
+      stderrThread = threading.Thread(
+        target=_readLines,
+        args=(p.stderr, onStderr, Task.getCurrent()),
+        )
+      stderrThread.daemon = True
+      stderrThread.start()
+      try:
+        _readLines(p.stdout, onStdout)
+      except BaseException:
+        p.kill()
+        raise
+      finally:
+        stderrThread.join()
+        exitCode = p.wait()
   
       if isTiming:
         elapsed = (datetime.datetime.utcnow() - start)
@@ -1992,31 +2743,15 @@ class Compiler(Tool):
           "time",
           "time: %.3fs %s\n" % (totalSeconds, debugString[5:]),
           )
-  
-      stdout.seek(0)
-      stderr.seek(0)
-  
-      stdoutText = stdout.read() 
-      stderrText = stderr.read()
     finally:
-      if stdout is not None:
-        stdout.close()
-      if stderr is not None:
-        stderr.close()
       if argsPath is not None:
         os.remove(argsPath)
     
-    if stdoutText:
-      if processStdout is not None:
-        processStdout(stdoutText)
-      else:
-        self._outputStdout(stdoutText)
-    
-    if stderrText:
-      if processStderr is not None:
-        processStderr(stderrText)
-      else:
-        self._outputStderr(stderrText)
+    if not isStreaming:
+      if stdoutLines:
+        processStdout("".join(stdoutLines))
+      if stderrLines:
+        processStderr("".join(stderrLines))
       
     if processExitCode is not None:
       processExitCode(exitCode)
@@ -2054,6 +2789,244 @@ class Compiler(Tool):
       
     return dependencies
 
+  def _runPreprocessor(self, args, target):
+    """Run a GNU-style preprocessor that writes its output to stdout.
+
+    @param args: The preprocessor command-line, not including the '-MF'
+    dependency file argument.
+    @type args: list of string
+
+    @param target: Path of the object file the output is for.
+    @type target: string
+
+    @return: A (text, dependencies) tuple containing the preprocessed
+    output and the list of paths it depends on, or None if the
+    preprocessor failed. Failures are not reported as the subsequent
+    compile will report them.
+    @rtype: tuple of (string, list of string) or None
+    """
+    fd, depPath = tempfile.mkstemp(prefix='CakeGccDep')
+    os.close(fd)
+
+    output = []
+    exitCodes = []
+    try:
+      self._runProcess(
+        args + ['-MF', depPath],
+        target,
+        processStdout=output.append,
+        processStderr=lambda text: None,
+        processExitCode=exitCodes.append,
+        allowResponseFile=False,
+        )
+      if exitCodes[0] != 0:
+        return None
+      dependencies = [args[0]]
+      dependencies.extend(parseDependencyFile(depPath, cake.path.extension(target)))
+    finally:
+      try:
+        os.remove(depPath)
+      except Exception:
+        pass
+
+    return "".join(output), dependencies
+
+  def _canBatchCompile(self, sources):
+    """Determine whether a GNU-style compiler can compile several sources
+    with L{_runBatchCompile}.
+
+    The compiler names each object after its source, in the directory it
+    is run from, so the names must be unique, use the default object
+    suffix and not overwrite any existing file.
+    """
+    if self.objectSuffix != '.o':
+      return False
+    baseNames = set(cake.path.baseNameWithoutExtension(s) for s in sources)
+    if len(baseNames) != len(sources):
+      return False
+    abspath = self.configuration.abspath
+    for baseName in baseNames:
+      if os.path.lexists(abspath(baseName + '.o')) or \
+         os.path.lexists(abspath(baseName + '.d')):
+        return False
+    return True
+
+  def _runBatchCompile(self, args, targets, sources):
+    """Compile several sources with a single run of a GNU-style compiler.
+
+    The compiler is run from the same directory as a single compile,
+    where it writes an object file and a '-MD' dependency file for each
+    source. Objects that compiled are then moved to their targets. The
+    output of each source is reported against its target.
+
+    @param args: The compiler command-line, not including the sources.
+    @type args: list of string
+
+    @return: A list containing, for each source, the list of its
+    dependencies or None if it failed to compile.
+    @rtype: list of (list of string or None)
+    """
+    configuration = self.configuration
+    outputPaths = [
+      configuration.abspath(cake.path.baseNameWithoutExtension(s))
+      for s in sources
+      ]
+    keys = [os.path.normcase(p) for p in outputPaths]
+
+    # Wait for any other batch writing the same object names to finish.
+    _batchOutputsCondition.acquire()
+    try:
+      while _batchOutputs.intersection(keys):
+        _batchOutputsCondition.wait()
+      _batchOutputs.update(keys)
+    finally:
+      _batchOutputsCondition.release()
+
+    try:
+      output = []
+      exitCodes = []
+      self._runProcess(
+        args + list(sources),
+        targets[0],
+        processStdout=output.append,
+        processStderr=output.append,
+        processExitCode=exitCodes.append,
+        )
+
+      outputs = _splitBatchOutput("".join(output), sources)
+      results = []
+      for target, outputPath, text in zip(targets, outputPaths, outputs):
+        if text:
+          self._outputStderr(_prefixLines(self._getOutputPrefix(target), text))
+        objectPath = outputPath + '.o'
+        if exitCodes[0] != 0 and not cake.filesys.isFile(objectPath):
+          results.append(None)
+          continue
+        dependencies = [args[0]]
+        dependencies.extend(parseDependencyFile(outputPath + '.d', '.o'))
+        absTarget = configuration.abspath(target)
+        cake.filesys.makeDirs(
+          cake.path.dirName(absTarget),
+          self.engine.knownDirectories,
+          )
+        os.replace(objectPath, absTarget)
+        self.engine.notifyFileChanged(absTarget)
+        results.append(dependencies)
+    finally:
+      for outputPath in outputPaths:
+        cake.filesys.remove(outputPath + '.o')
+        cake.filesys.remove(outputPath + '.d')
+      _batchOutputsCondition.acquire()
+      try:
+        _batchOutputs.difference_update(keys)
+        _batchOutputsCondition.notify_all()
+      finally:
+        _batchOutputsCondition.release()
+
+    return results
+
+  def _getObjectCacheFilePath(self, digest):
+    """Get the absolute path of an object in the object cache.
+
+    @param digest: The digest the object is stored under.
+    @type digest: string of 20 bytes
+
+    @return: The absolute path of the cached object file.
+    @rtype: string
+    """
+    digestStr = cake.hash.hexlify(digest)
+    return self.configuration.abspath(cake.path.join(
+      self.objectCachePath,
+      digestStr[0],
+      digestStr[1],
+      digestStr,
+      ))
+
+  def _calculatePreprocessorDigest(self, target, source, args, text):
+    """Calculate the object cache digest of a preprocessed source.
+
+    The digest is independent of the target and source paths. Any
+    paths under the object cache workspace root are made relative to
+    it so that workspaces at different paths will share digests.
+
+    @return: The digest of the compile.
+    @rtype: string of 20 bytes
+    """
+    configuration = self.configuration
+
+    if self.objectCacheWorkspaceRoot is not None:
+      workspaceRoot = configuration.abspath(self.objectCacheWorkspaceRoot)
+      workspaceRoot = os.path.normpath(workspaceRoot) + os.path.sep
+      normalise = lambda s: s.replace(workspaceRoot, "")
+    else:
+      normalise = lambda s: s
+
+    hasher = cake.hash.sha1()
+    hasher.update("cake-preprocessed\0".encode("utf8"))
+
+    # Different compiler executables at the same path must not share
+    # objects.
+    try:
+      hasher.update(self.engine.getFileDigest(configuration.abspath(args[0])))
+    except EnvironmentError:
+      hasher.update(args[0].encode("utf8"))
+
+    for arg in args[1:]:
+      if arg == target or arg == source:
+        continue
+      hasher.update(normalise(arg).encode("utf8"))
+      hasher.update("\0".encode("utf8"))
+
+    hasher.update(normalise(text).encode("utf8"))
+    return hasher.digest()
+
+  def _findObjectByPreprocessorDigest(self, target, source, args, preprocess, digestResult):
+    """Attempt to restore an object from the cache by preprocessor digest.
+
+    @param preprocess: A function returned by L{getPreprocessCommand}.
+    @type preprocess: any callable
+
+    @param digestResult: A single element list that will be set to the
+    preprocessor digest if one could be calculated, so the object can be
+    stored under it once compiled.
+    @type digestResult: list
+
+    @return: The dependencies of the restored object, or None if the object
+    was not found in the cache.
+    @rtype: list of string or None
+    """
+    result = preprocess()
+    if result is None:
+      return None
+    text, dependencies = result
+
+    digest = self._calculatePreprocessorDigest(target, source, args, text)
+    digestResult[0] = digest
+
+    if self.engine.forceBuild:
+      return None
+
+    cachedObjectPath = self._getObjectCacheFilePath(digest)
+    if not cake.filesys.isFile(cachedObjectPath):
+      return None
+
+    self.engine.logger.outputDebug(
+      "cache",
+      "cache: Found '%s' by preprocessor digest %s\n" % (
+        target,
+        cake.hash.hexlify(digest),
+        ),
+      )
+
+    absTarget = self.configuration.abspath(target)
+    try:
+      cake.zipping.decompressFile(cachedObjectPath, absTarget)
+    except EnvironmentError:
+      return None # Invalid cache file
+    self.engine.notifyFileChanged(absTarget)
+
+    return dependencies
+
   def _scanForLibraries(self, libraries, flagMissing=False):
     paths = []
     for library in libraries:
@@ -2171,7 +3144,13 @@ class Compiler(Tool):
       )
 
     useCacheForThisObject = canBeCached and self.objectCachePath is not None
-    cacheDepMagic = "CKCH" 
+    cacheDepMagic = "CKCH".encode('latin-1') # We need bytes for Python 3.x
+
+    if useCacheForThisObject and self.objectCachePreprocessorMode:
+      preprocessCommand = self.getPreprocessCommand(target, source, pch, shared)
+    else:
+      preprocessCommand = None
+    preprocessorDigest = [None]
     
     if useCacheForThisObject:
       #######################
@@ -2204,7 +3183,8 @@ class Compiler(Tool):
         targetDigestStr
         )
       targetCacheDir = configuration.abspath(targetCacheDir)
-      
+
+    def restoreFromCache():
       # Find all entries in the directory
       entries = set()
       
@@ -2286,16 +3266,32 @@ class Compiler(Tool):
             continue # Invalid cache file
           configuration.storeDependencyInfo(newDependencyInfo)
           # Successfully restored object file and saved new dependency info file.
-          return
+          return True
+      return False
 
     # Else, if we get here we didn't find the object in the cache so we need
     # to actually execute the build.
     def command():
+      if preprocessCommand is not None:
+        # Try the preprocessor digest before compiling. This runs on a
+        # worker thread as it needs to spawn the preprocessor.
+        dependencies = self._findObjectByPreprocessorDigest(
+          target,
+          source,
+          args,
+          preprocessCommand,
+          preprocessorDigest,
+          )
+        if dependencies is not None:
+          message = self.objectMessage(target, source, pch=getPath(pch), shared=shared, cached=True)
+          self.engine.logger.outputInfo(message)
+          return dependencies
+
       message = self.objectMessage(target, source, pch=getPath(pch), shared=shared, cached=False)
       self.engine.logger.outputInfo(message)
       return compile()
     
-    def storeDependencyInfoAndCache():
+    def storeDependencyInfoAndCache(compileTask):
       # Since we are sharing this object in the object cache we need to
       # make any paths in this workspace relative to the current workspace.
       abspath = configuration.abspath
@@ -2356,22 +3352,210 @@ class Compiler(Tool):
           cake.zipping.compressFile(configuration.abspath(target), cacheObjectPath)
           
           if not cake.filesys.isFile(cacheDepPath):
-            dependencyString = pickle.dumps(dependencies, pickle.HIGHEST_PROTOCOL)       
+            dependencyString = pickle.dumps(dependencies, pickle.HIGHEST_PROTOCOL)
             cake.filesys.writeFile(cacheDepPath, dependencyString + cacheDepMagic)
-            
+
+          # Also store the object under its preprocessor digest so that
+          # workspaces at other paths can find it.
+          if preprocessorDigest[0] is not None:
+            cachePreprocessedPath = self._getObjectCacheFilePath(preprocessorDigest[0])
+            if not cake.filesys.isFile(cachePreprocessedPath):
+              cake.zipping.compressFile(configuration.abspath(target), cachePreprocessedPath)
+
         except EnvironmentError:
           # Don't worry if we can't put the object in the cache
           # The build shouldn't fail.
           pass
     
+    def startCompile():
+      # Identical compiles, eg. of the same source by another variant, share
+      # the result of the first compile.
+      compileTask = self.engine.createTask(command)
+      sharedCompile = None
+      if self.shareCompiles and canBeCached:
+        absTarget = configuration.abspath(target)
+        compileKey = self._getCompileKey(target, source, args)
+        if compileKey is not None:
+          sharedCompile = self.engine.shareCompile(
+            compileKey,
+            compileTask,
+            absTarget,
+            )
+
+      if sharedCompile is None:
+        compileTask.parent.completeAfter(compileTask)
+        compileTask.start(immediate=True)
+      else:
+        sharedTask, sharedTarget = sharedCompile
+
+        def copyCommand():
+          message = self.objectMessage(target, source, pch=getPath(pch), shared=shared, cached=True)
+          self.engine.logger.outputInfo(message)
+          self.engine.logger.outputDebug(
+            "reason",
+            "Copying '%s' from an identical compile of '%s'.\n" % (
+              target, sharedTarget),
+            )
+          cake.filesys.makeDirs(
+            cake.path.dirName(absTarget),
+            self.engine.knownDirectories,
+            )
+          cake.filesys.copyFile(sharedTarget, absTarget)
+          self.engine.notifyFileChanged(absTarget)
+          return sharedTask.result
+
+        compileTask = self.engine.createTask(copyCommand)
+        compileTask.parent.completeAfter(compileTask)
+        compileTask.startAfter(sharedTask, immediate=True)
+
+      storeDependencyTask = self.engine.createTask(
+        lambda t=compileTask: storeDependencyInfoAndCache(t)
+        )
+      storeDependencyTask.parent.completeAfter(storeDependencyTask)
+      storeDependencyTask.startAfter(compileTask, immediate=True)
+
+    if not useCacheForThisObject:
+      startCompile()
+    elif self.objectCachePrewarm:
+      # Look up the cache on the cache thread pool so that the lookups of
+      # many objects are in flight at once and overlap with compiles.
+      def lookupAndCompile():
+        if not restoreFromCache():
+          startCompile()
+
+      lookupTask = self.engine.createTask(lookupAndCompile)
+      lookupTask.parent.completeAfter(lookupTask)
+      lookupTask.start(
+        threadPool=self.engine.getCacheThreadPool(self.objectCachePrewarmWindow),
+        )
+    elif not restoreFromCache():
+      startCompile()
+
+  def _getCompileKey(self, target, source, args):
+    """Get the key identifying compiles that produce identical objects.
+
+    @return: The arguments with the target argument replaced, the
+    absolute path of the source and the digest of its contents, or None
+    if the source couldn't be read.
+    @rtype: tuple or None
+    """
+    configuration = self.configuration
+    absSource = configuration.abspath(source)
+    try:
+      sourceDigest = self.engine.getFileDigest(absSource)
+    except EnvironmentError:
+      return None # Let the compile report the error
+
+    # Only replace arguments that are exactly the target or an output
+    # option joined to it, eg. '/Fo<target>'. Other arguments that merely
+    # contain the target path, eg. a '-MF' file next to it, must differ.
+    keyArgs = []
+    for arg in args:
+      arg = str(arg)
+      if arg == target:
+        arg = '<target>'
+      else:
+        for option in _targetOptions:
+          if arg == option + target:
+            arg = option + '<target>'
+            break
+      keyArgs.append(arg)
+
+    return (
+      configuration.baseDir,
+      tuple(keyArgs),
+      absSource,
+      sourceDigest,
+      )
+  
+  def buildObjectBatch(self, targets, sources, shared):
+    """Perform the actual build of several objects with one compile.
+
+    Sources that can't be compiled together are built individually by
+    L{buildObject}.
+
+    @param targets: Paths of the target object files.
+    @type targets: list of string
+
+    @param sources: Paths of the source files.
+    @type sources: list of string
+    """
+    commands = self.getBatchObjectCommands(targets, sources, shared)
+    if commands is None:
+      for target, source in zip(targets, sources):
+        self.buildObject(target, source, None, shared)
+      return
+
+    configuration = self.configuration
+
+    _, argsList = commands
+    pending = []
+    for target, source, args in zip(targets, sources, argsList):
+      _, reasonToBuild = configuration.checkDependencyInfo(target, args)
+      if reasonToBuild is None:
+        continue # Target is up to date
+      self.engine.logger.outputDebug(
+        "reason",
+        "Rebuilding '" + target + "' because " + reasonToBuild + ".\n",
+        )
+      pending.append((target, source, args))
+
+    if len(pending) <= 1:
+      for target, source, _ in pending:
+        self.buildObject(target, source, None, shared)
+      return
+
+    commands = self.getBatchObjectCommands(
+      [target for target, _, _ in pending],
+      [source for _, source, _ in pending],
+      shared,
+      )
+    if commands is None:
+      for target, source, _ in pending:
+        self.buildObject(target, source, None, shared)
+      return
+    compile, _ = commands
+
+    def command():
+      for target, source, _ in pending:
+        message = self.objectMessage(target, source, shared=shared, cached=False)
+        self.engine.logger.outputInfo(message)
+      return compile()
+
+    def storeDependencyInfo():
+      abspath = configuration.abspath
+      normpath = os.path.normpath
+      failed = []
+      for (target, source, args), dependencies in zip(pending, compileTask.result):
+        if dependencies is None:
+          failed.append((target, source, args))
+          continue
+
+        newDependencyInfo = configuration.createDependencyInfo(
+          targets=[target],
+          args=args,
+          dependencies=[normpath(abspath(p)) for p in dependencies],
+          )
+        configuration.storeDependencyInfo(newDependencyInfo)
+
+      if failed:
+        # The compiler's output for each source has already been reported.
+        self.engine.raiseError(
+          "".join(
+            "%s: failed to compile %s\n" % (args[0], source)
+            for _, source, args in failed
+            ),
+          targets=[target for target, _, _ in failed],
+          )
+
     compileTask = self.engine.createTask(command)
     compileTask.parent.completeAfter(compileTask)
     compileTask.start(immediate=True)
 
-    storeDependencyTask = self.engine.createTask(storeDependencyInfoAndCache)
+    storeDependencyTask = self.engine.createTask(storeDependencyInfo)
     storeDependencyTask.parent.completeAfter(storeDependencyTask)
     storeDependencyTask.startAfter(compileTask, immediate=True)
-  
+
   def getPchCommands(self, target, source, header, object):
     """Get the command-lines for compiling a precompiled header.
     
@@ -2397,7 +3581,35 @@ class Compiler(Tool):
     file can be safely cached or not.
     """
     self.engine.raiseError("Don't know how to compile %s\n" % source, targets=[target])
-  
+
+  def getPreprocessCommand(self, target, source, pch, shared):
+    """Get the command for preprocessing a source to compute its object
+    cache digest.
+
+    Override this in compilers that support L{objectCachePreprocessorMode}.
+
+    @return: A function that takes no arguments and returns a
+    (text, dependencies) tuple where 'text' is the preprocessed output
+    and 'dependencies' is the list of paths the output depends on, or
+    None if preprocessing failed. Returns None if the source can't be
+    preprocessed by this compiler.
+    """
+    return None
+
+  def getBatchObjectCommands(self, targets, sources, shared):
+    """Get the command for compiling several sources at once.
+
+    Override this in compilers that support L{batchCompile}.
+
+    @return: A (compile, argsList) tuple where 'compile' is a function that
+    takes no arguments and returns a list containing, for each source, the
+    list of paths of its dependencies or None if it failed to compile.
+    'argsList' is the list of arguments of each target, which must be the
+    same as the args returned by L{getObjectCommands}. Returns None if the
+    sources can't be compiled together by this compiler.
+    """
+    return None
+
   def buildLibrary(self, target, sources):
     """Perform the actual build of a library.
     
@@ -2416,7 +3628,7 @@ class Compiler(Tool):
     args = repr(archive)
     
     # Check if the target needs building
-    _, reasonToBuild = self.configuration.checkDependencyInfo(target, args)
+    oldDependencyInfo, reasonToBuild = self.configuration.checkDependencyInfo(target, args)
     if not reasonToBuild:
       return # Target is up to date
     self.engine.logger.outputDebug(
@@ -2424,11 +3636,18 @@ class Compiler(Tool):
       "Rebuilding '" + target + "' because " + reasonToBuild + ".\n",
       )
 
+    update = None
+    if self.incrementalArchive and oldDependencyInfo is not None:
+      update = self._getLibraryUpdate(target, sources, oldDependencyInfo)
+
     def command():
       message = self.libraryMessage(target, sources, cached=False)
       self.engine.logger.outputInfo(message)
       
-      archive()
+      if update is not None:
+        update()
+      else:
+        archive()
       
       targets, dependencies = scan()
       
@@ -2452,6 +3671,73 @@ class Compiler(Tool):
     (targets, dependencies) tuple. 
     """
     self.engine.raiseError("Don't know how to archive %s\n" % target, targets=[target])
+
+  def _getLibraryUpdate(self, target, sources, oldDependencyInfo):
+    """Get the command for updating an existing library in place.
+
+    @return: The function to call to update the library, or None if the
+    library must be rebuilt from scratch.
+    """
+    configuration = self.configuration
+    engine = self.engine
+    if engine.forceBuild:
+      return None
+
+    # Only the objects may have changed since the library was built.
+    oldSources = oldDependencyInfo.depPaths[1:]
+    oldArchive, _ = self.getLibraryCommand(target, oldSources)
+    if repr(oldArchive) != oldDependencyInfo.args:
+      return None
+
+    abspath = configuration.abspath
+    if not cake.filesys.isFile(abspath(target)):
+      return None
+
+    getTimestamp = engine.getTimestamp
+    oldTimestamps = dict(zip(oldDependencyInfo.depPaths, oldDependencyInfo.depTimestamps))
+    try:
+      # A new archiver must rebuild the whole library.
+      archiver = oldDependencyInfo.depPaths[0]
+      if getTimestamp(abspath(archiver)) != oldTimestamps[archiver]:
+        return None
+
+      changed = [
+        s for s in sources
+        if oldTimestamps.get(s, None) != getTimestamp(abspath(s))
+        ]
+    except EnvironmentError:
+      return None # Let the full rebuild report the missing file
+
+    sourceSet = set(sources)
+    removed = [s for s in oldSources if s not in sourceSet]
+    if not changed and not removed:
+      return None # Only the order of the objects changed
+
+    update = self.getLibraryUpdateCommand(target, sources, changed, removed)
+    if update is not None:
+      engine.logger.outputDebug(
+        "reason",
+        "Updating '%s' in place: %i changed, %i removed.\n" % (
+          target, len(changed), len(removed)),
+        )
+    return update
+
+  def getLibraryUpdateCommand(self, target, sources, changed, removed):
+    """Get the command for updating the members of an existing library.
+
+    @param target: Path of the library to update.
+    @type target: string
+    @param sources: All the objects the library should contain.
+    @type sources: list of string
+    @param changed: The objects that are new or have changed.
+    @type changed: list of string
+    @param removed: The objects that should be removed.
+    @type removed: list of string
+
+    @return: The function to call to update the library, or None if this
+    compiler can't update libraries in place.
+    """
+    return None
   
   def buildModule(self, target, sources, importLibrary, installName):
     """Perform the actual build of a module.
@@ -2474,8 +3760,12 @@ class Compiler(Tool):
       self.engine.logger.outputInfo(message)
       
       link()
+      stub = self._writeInterfaceStub(target)
     
       targets, dependencies = scan()
+      if stub is not None:
+        # Rebuild if the stub is deleted.
+        targets = list(targets) + [stub]
       
       newDependencyInfo = self.configuration.createDependencyInfo(
         targets=targets,
@@ -2489,6 +3779,82 @@ class Compiler(Tool):
     moduleTask.parent.completeAfter(moduleTask)
     moduleTask.start(immediate=True)
   
+  def _writeInterfaceStub(self, target):
+    """Write the interface stub of a module if its interface has changed.
+
+    @return: The path of the stub, or None if the module has no stub.
+    @rtype: string or None
+    """
+    stubPath = target + self.interfaceStubSuffix
+    absStubPath = self.configuration.abspath(stubPath)
+
+    interface = None
+    if self.interfaceStubs:
+      interface = self.getModuleInterface(target)
+    if interface is None:
+      # Don't leave a stale stub for consumers to depend on.
+      cake.filesys.remove(absStubPath)
+      return None
+
+    data = interface.encode("utf8")
+    try:
+      if cake.filesys.readFile(absStubPath) == data:
+        return stubPath
+    except EnvironmentError:
+      pass
+
+    self.engine.logger.outputDebug(
+      "reason",
+      "Generating '%s' because the interface of '%s' has changed.\n" % (
+        stubPath, target),
+      )
+    cake.filesys.writeFile(absStubPath, data)
+    self.engine.notifyFileChanged(absStubPath)
+    return stubPath
+
+  def _getInterfaceStubPaths(self, paths):
+    """Replace the paths of modules that have interface stubs with the
+    paths of their stubs.
+
+    @param paths: The paths of the objects, libraries and modules being
+    linked.
+    @type paths: list of string
+
+    @return: The paths to depend on when linking.
+    @rtype: list of string
+    """
+    if not self.interfaceStubs:
+      return list(paths)
+
+    abspath = self.configuration.abspath
+    isFile = cake.filesys.isFile
+    stubSuffix = self.interfaceStubSuffix
+    moduleSuffixes = set(
+      os.path.normcase(suffix) for _, suffix in self.modulePrefixSuffixes
+      )
+
+    results = []
+    for path in paths:
+      if os.path.normcase(cake.path.extension(path)) in moduleSuffixes:
+        stubPath = path + stubSuffix
+        if isFile(abspath(stubPath)):
+          path = stubPath
+      results.append(path)
+    return results
+
+  def getModuleInterface(self, path):
+    """Get the interface a module exports to the programs and modules
+    that link against it.
+
+    @param path: Path of the module.
+    @type path: string
+
+    @return: The interface as text, or None if this compiler can't read
+    the interface of its modules.
+    @rtype: string or None
+    """
+    return None
+
   def getModuleCommands(self, target, sources, importLibrary, installName):
     """Get the commands for linking a module.
     
@@ -10,14 +10,25 @@ from cake.target import getPaths, getPath
 from cake.library.compilers import Compiler, makeCommand, CompilerNotFoundError
 
 import cake.path
+import cake.elf
 import cake.filesys
+import cake.probe
 
 import os.path
 import subprocess
 
 def _getClangVersion(clangExe):
   """Returns the Clang version number given an executable.
+
+  The result is cached between runs until the executable changes.
   """
+  return cake.probe.cachedProbe(
+    'clang-version',
+    [getPath(clangExe)],
+    lambda: _probeClangVersion(clangExe),
+    )
+
+def _probeClangVersion(clangExe):
   args = [getPath(clangExe), '--version']
   try:
     p = subprocess.Popen(
@@ -88,7 +99,10 @@ class ClangCompiler(Compiler):
 
     return language
 
-  @memoise
+  @memoise(
+    'language', 'cSuffixes', 'cppSuffixes', 'debugSymbols', 'cFlags',
+    'cppFlags', 'defines', 'includePaths', 'forcedIncludes',
+    )
   def _getCommonCompileArgs(self, suffix, shared=False, pch=False):
     args = [self._clangExe, '-c', '-MD']
 
@@ -131,9 +145,37 @@ class ClangCompiler(Compiler):
     canBeCached = True
     return compile, args, canBeCached
 
-  @memoise
+  def getPreprocessCommand(self, target, source, pch, shared):
+    args = list(self._getCommonCompileArgs(cake.path.extension(source), shared))
+    args[1] = '-E' # Replace '-c'
+    args.extend([source, '-MT', target])
+
+    def preprocess():
+      return self._runPreprocessor(args, target)
+
+    return preprocess
+
+  def getBatchObjectCommands(self, targets, sources, shared):
+    if not self._canBatchCompile(sources):
+      return None
+
+    commonArgs = self._getCommonCompileArgs(cake.path.extension(sources[0]), shared)
+    argsList = [
+      list(commonArgs) + [source, '-o', target]
+      for target, source in zip(targets, sources)
+      ]
+
+    def compile():
+      return self._runBatchCompile(list(commonArgs), targets, sources)
+
+    return compile, argsList
+
+  @memoise('thinArchive', 'libraryFlags')
   def _getCommonLibraryArgs(self):
-    args = [self._llvmArExe, 'qcs']
+    if self.thinArchive:
+      args = [self._llvmArExe, 'qcsT']
+    else:
+      args = [self._llvmArExe, 'qcs']
     args.extend(self.libraryFlags)
     return args
 
@@ -153,9 +195,47 @@ class ClangCompiler(Compiler):
 
     return archive, scan
 
+  def getLibraryUpdateCommand(self, target, sources, changed, removed):
+    # llvm-ar identifies members by file name.
+    names = set(cake.path.baseName(p) for p in sources)
+    if len(names) != len(sources):
+      return None
+
+    # Deleting members of a thin archive doesn't work with all versions of
+    # llvm-ar, but rebuilding a thin archive is cheap anyway.
+    if removed and self.thinArchive:
+      return None
+
+    if self.thinArchive:
+      replaceArgs = [self._llvmArExe, 'rsT']
+    else:
+      replaceArgs = [self._llvmArExe, 'rs']
+    replaceArgs.extend(self.libraryFlags)
+    replaceArgs.append(target)
+    replaceArgs.extend(changed)
+
+    deleteArgs = [self._llvmArExe, 'ds']
+    deleteArgs.extend(self.libraryFlags)
+    deleteArgs.append(target)
+    deleteArgs.extend(removed)
+
+    def update():
+      if removed:
+        self._runProcess(deleteArgs, target)
+      if changed:
+        self._runProcess(replaceArgs, target)
+
+    return update
+
   def getProgramCommands(self, target, sources):
     return self._getLinkCommands(target, sources, dll=False)
 
+  def getModuleInterface(self, path):
+    try:
+      return cake.elf.readInterfaceStub(self.configuration.abspath(path))
+    except ValueError:
+      return None # Not an ELF module
+
   def getModuleCommands(self, target, sources, importLibrary, installName):
     return self._getLinkCommands(target,
                                  sources,
@@ -163,7 +243,7 @@ class ClangCompiler(Compiler):
                                  installName,
                                  dll=True)
 
-  @memoise
+  @memoise('moduleFlags', 'programFlags')
   def _getCommonLinkArgs(self, dll):
     args = [self._clangExe]
     if dll:
@@ -206,9 +286,11 @@ class ClangCompiler(Compiler):
       if dll and importLibrary:
         targets.append(importLibrary)
       dependencies = [args[0]]
-      dependencies += sources
+      dependencies += self._getInterfaceStubPaths(sources)
       dependencies += objects
-      dependencies += self._scanForLibraries(libraries)
+      dependencies += self._getInterfaceStubPaths(
+        self._scanForLibraries(libraries)
+        )
       return targets, dependencies
 
     return link, scan
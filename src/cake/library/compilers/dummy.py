@@ -23,7 +23,10 @@ class DummyCompiler(Compiler):
   def __init__(self, configuration):
     Compiler.__init__(self, configuration)
 
-  @memoise
+  @memoise(
+    'debugSymbols', 'optimisation', 'enableRtti', 'enableExceptions',
+    'language', 'includePaths', 'defines', 'forcedIncludes',
+    )
   def _getCompileArgs(self):
     args = ['cc', '/c']
     if self.debugSymbols:
@@ -8,8 +8,10 @@
 from cake.library import memoise
 from cake.target import getPaths
 from cake.library.compilers import Compiler, makeCommand, CompilerNotFoundError
+import cake.elf
 import cake.filesys
 import cake.path
+import cake.probe
 import cake.system
 import os
 import os.path
@@ -47,7 +49,16 @@ def _getMinGWInstallDir():
 
 def _getGccVersion(gccExe):
   """Returns the Gcc version number given an executable.
+
+  The result is cached between runs until the executable changes.
   """
+  return cake.probe.cachedProbe(
+    'gcc-version',
+    [gccExe],
+    lambda: _probeGccVersion(gccExe),
+    )
+
+def _probeGccVersion(gccExe):
   stdout = tempfile.TemporaryFile(mode="w+t")
   try:
     try:
@@ -192,6 +203,7 @@ def findGccCompiler(configuration, platform=None):
 class GccCompiler(Compiler):
   
   _name = 'gcc'
+  _pchIsForcedInclude = True
 
   def __init__(
     self,
@@ -243,7 +255,13 @@ class GccCompiler(Compiler):
   def _outputStderr(self, text):
     Compiler._outputStderr(self, self._formatMessage(text))
   
-  @memoise
+  @memoise(
+    'language', 'cSuffixes', 'cppSuffixes', 'mSuffixes', 'mmSuffixes',
+    'sSuffixes', 'warningsAsErrors', 'warningLevel', 'debugSymbols',
+    'cFlags', 'cppFlags', 'mFlags', 'mmFlags', 'enableRtti',
+    'enableExceptions', 'useFunctionLevelLinking', 'optimisation', 'useSse',
+    'includePaths', 'defines', 'forcedIncludes',
+    )
   def _getCompileArgs(self, suffix, shared=False, pch=False):
     args = [self._gccExe, '-c', '-MD']
 
@@ -378,12 +396,44 @@ class GccCompiler(Compiler):
     canBeCached = True
     return compile, args, canBeCached
 
-  @memoise
+  def getPreprocessCommand(self, target, source, pch, shared):
+    if pch is not None:
+      return None
+
+    args = list(self._getCompileArgs(cake.path.extension(source), shared))
+    args[1] = '-E' # Replace '-c'
+    args.extend([source, '-MT', target])
+
+    def preprocess():
+      return self._runPreprocessor(args, target)
+
+    return preprocess
+
+  def getBatchObjectCommands(self, targets, sources, shared):
+    if not self._canBatchCompile(sources):
+      return None
+
+    commonArgs = self._getCompileArgs(cake.path.extension(sources[0]), shared)
+    argsList = [
+      list(commonArgs) + [source, '-o', target]
+      for target, source in zip(targets, sources)
+      ]
+
+    def compile():
+      return self._runBatchCompile(list(commonArgs), targets, sources)
+
+    return compile, argsList
+
+  @memoise('thinArchive', 'libraryFlags')
   def _getCommonLibraryArgs(self):
     # q - Quick append file to the end of the archive
     # c - Don't warn if we had to create a new file
     # s - Build an index
-    args = [self._arExe, '-qcs']
+    # T - Make a thin archive
+    if self.thinArchive:
+      args = [self._arExe, '-qcsT']
+    else:
+      args = [self._arExe, '-qcs']
     args.extend(self.libraryFlags)
     return args
 
@@ -404,7 +454,43 @@ class GccCompiler(Compiler):
 
     return archive, scan
 
-  @memoise
+  def getLibraryUpdateCommand(self, target, sources, changed, removed):
+    # ar identifies members by file name.
+    names = set(cake.path.baseName(p) for p in sources)
+    if len(names) != len(sources):
+      return None
+
+    # Deleting members of a thin archive doesn't work with all versions of
+    # ar, but rebuilding a thin archive is cheap anyway.
+    if removed and self.thinArchive:
+      return None
+
+    # r - Replace existing members or add new ones
+    # d - Delete members
+    # s - Build an index
+    # T - Make a thin archive
+    if self.thinArchive:
+      replaceArgs = [self._arExe, '-rsT']
+    else:
+      replaceArgs = [self._arExe, '-rs']
+    replaceArgs.extend(self.libraryFlags)
+    replaceArgs.append(target)
+    replaceArgs.extend(changed)
+
+    deleteArgs = [self._arExe, '-ds']
+    deleteArgs.extend(self.libraryFlags)
+    deleteArgs.append(target)
+    deleteArgs.extend(removed)
+
+    def update():
+      if removed:
+        self._runProcess(deleteArgs, target)
+      if changed:
+        self._runProcess(replaceArgs, target)
+
+    return update
+
+  @memoise('moduleFlags', 'programFlags', 'libraryPaths')
   def _getCommonLinkArgs(self, dll):
     args = [self._gccExe]
     if dll:
@@ -422,6 +508,12 @@ class GccCompiler(Compiler):
   def getProgramCommands(self, target, sources):
     return self._getLinkCommands(target, sources, dll=False)
   
+  def getModuleInterface(self, path):
+    try:
+      return cake.elf.readInterfaceStub(self.configuration.abspath(path))
+    except ValueError:
+      return None # Not an ELF module
+  
   def getModuleCommands(self, target, sources, importLibrary, installName):
     return self._getLinkCommands(target, sources, importLibrary, installName, dll=True)
 
@@ -452,7 +544,10 @@ class GccCompiler(Compiler):
       if dll and importLibrary:
         # Since the target .dylib is also the import library, copy it to the
         # .a 'importLibrary' filename the user expects
-        cake.filesys.makeDirs(cake.path.dirName(importLibrary))
+        cake.filesys.makeDirs(
+          cake.path.dirName(importLibrary),
+          self.engine.knownDirectories,
+          )
         cake.filesys.copyFile(self.configuration.abspath(target), importLibrary)      
     
     @makeCommand("link-scan")
@@ -464,9 +559,11 @@ class GccCompiler(Compiler):
       if dll and importLibrary:
         targets.append(importLibrary)
       dependencies = [args[0]]
-      dependencies += sources
+      dependencies += self._getInterfaceStubPaths(sources)
       dependencies += objects
-      dependencies += self._scanForLibraries(libraries)
+      dependencies += self._getInterfaceStubPaths(
+        self._scanForLibraries(libraries)
+        )
       return targets, dependencies
     
     return link, scan
@@ -498,7 +595,7 @@ class WindowsGccCompiler(GccCompiler):
       )
     self.__rcExe = rcExe
     
-  @memoise
+  @memoise('importLibrary', 'useFunctionLevelLinking')
   def _getCommonLinkArgs(self, dll):
     args = GccCompiler._getCommonLinkArgs(self, dll)
 
@@ -510,7 +607,7 @@ class WindowsGccCompiler(GccCompiler):
 
     return args
 
-  @memoise
+  @memoise('resourceFlags', 'defines', 'includePaths')
   def _getCommonResourceArgs(self):
     args = [self.__rcExe]
     args.extend(self.resourceFlags)
@@ -541,7 +638,7 @@ class WindowsMinGWCompiler(WindowsGccCompiler):
 
   _name = 'mingw'
 
-  @memoise
+  @memoise('subSystem')
   def _getCommonLinkArgs(self, dll):
     args = WindowsGccCompiler._getCommonLinkArgs(self, dll)
 
@@ -556,7 +653,7 @@ class MacGccCompiler(GccCompiler):
 
   modulePrefixSuffixes = [('lib', '.dylib')]
 
-  @memoise
+  @memoise('libraryFlags')
   def _getCommonLibraryArgs(self):
     args = [self._libtoolExe]
     args.extend(self.libraryFlags)
@@ -580,7 +677,10 @@ class MacGccCompiler(GccCompiler):
 
     return archive, scan
     
-  @memoise
+  def getLibraryUpdateCommand(self, target, sources, changed, removed):
+    return None # libtool can't update libraries in place
+    
+  @memoise()
   def _getCommonLinkArgs(self, dll):
     args = GccCompiler._getCommonLinkArgs(self, dll)
  
@@ -627,7 +727,10 @@ class MacGccCompiler(GccCompiler):
       if dll and importLibrary:
         # Since the target .dylib is also the import library, copy it to the
         # .a 'importLibrary' filename the user expects
-        cake.filesys.makeDirs(cake.path.dirName(importLibrary))
+        cake.filesys.makeDirs(
+          cake.path.dirName(importLibrary),
+          self.engine.knownDirectories,
+          )
         cake.filesys.copyFile(self.configuration.abspath(target), importLibrary)
         
     @makeCommand("link-scan")
@@ -650,7 +753,7 @@ class Ps3GccCompiler(GccCompiler):
   modulePrefixSuffixes = [('', '.sprx')]
   programSuffix = '.self'
 
-  @memoise
+  @memoise('useFunctionLevelLinking')
   def _getCommonLinkArgs(self, dll):
     args = GccCompiler._getCommonLinkArgs(self, dll)
 
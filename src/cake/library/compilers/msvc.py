@@ -758,8 +758,9 @@ class MsvcCompiler(Compiler):
     @param assembly: A path or FileTarget or ScriptResult that results
     in a path or FileTarget.
     """
+    self._unshare('forcedUsings')
     self.forcedUsings.append(self.configuration.basePath(assembly))
-    self._clearCache()
+    self._clearCache('forcedUsings')
     
   def _formatMessage(self, inputText):
     """Format errors to be clickable in MS Visual Studio.
@@ -792,7 +793,7 @@ class MsvcCompiler(Compiler):
   def _outputStderr(self, text):
     Compiler._outputStderr(self, self._formatMessage(text))
     
-  @memoise
+  @memoise('language', 'forcedUsings')
   def _getObjectPrerequisiteTasks(self):
     tasks = super(MsvcCompiler, self)._getObjectPrerequisiteTasks()
     
@@ -804,7 +805,15 @@ class MsvcCompiler(Compiler):
     
     return tasks
     
-  @memoise
+  @memoise(
+    'errorReport', 'outputFullPath', 'useBigObjects', 'memoryLimit',
+    'runtimeLibraries', 'useFunctionLevelLinking', 'useStringPooling',
+    'language', 'cSuffixes', 'cppSuffixes', 'cFlags', 'cppFlags',
+    'enableRtti', 'enableExceptions', 'clrMode', 'forcedUsings',
+    'optimisation', 'warningLevel', 'warningsAsErrors', 'useEditAndContinue',
+    'debugSymbols', 'useMinimalRebuild', 'defines', 'includePaths',
+    'forcedIncludes',
+    )
   def _getCompileCommonArgs(self, suffix):
     args = [
       self.__clExe,
@@ -913,7 +922,9 @@ class MsvcCompiler(Compiler):
     return language
       
   @property
-  @memoise
+  @memoise(
+    'pdbFile', 'debugSymbols', 'useMinimalRebuild', 'useEditAndContinue',
+    )
   def _needPdbFile(self):
     if self.pdbFile is not None and self.debugSymbols:
       return True
@@ -989,6 +1000,8 @@ class MsvcCompiler(Compiler):
         dependencies.extend(getPaths(self.forcedUsings))
       dependenciesSet = set()
 
+      outputPrefix = self._getOutputPrefix(target)
+
       def processStdout(text):
         includePrefix = ('Note: including file:')
         includePrefixLen = len(includePrefix)
@@ -1008,7 +1021,7 @@ class MsvcCompiler(Compiler):
             outputLines.append(line)
         
         if outputLines:
-          self._outputStdout("\n".join(outputLines) + "\n")
+          self._outputStdout("".join(outputPrefix + l + "\n" for l in outputLines))
 
       self._runProcess(
         args=args,
@@ -1048,7 +1061,7 @@ class MsvcCompiler(Compiler):
     else:
       return compileWhenPdbIsFree, args, canBeCached
 
-  @memoise
+  @memoise('optimisation', 'warningsAsErrors', 'libraryFlags')
   def _getCommonLibraryArgs(self):
     args = [self.__libExe, '/NOLOGO']
     
@@ -1086,7 +1099,12 @@ class MsvcCompiler(Compiler):
 
     return archive, scan
 
-  @memoise
+  @memoise(
+    'useIncrementalLinking', 'clrMode', 'moduleFlags', 'programFlags',
+    'useFunctionLevelLinking', 'moduleVersion', 'stackSize', 'heapSize',
+    'optimisation', 'debugSymbols', 'pdbFile', 'strippedPdbFile',
+    'warningsAsErrors', 'libraryPaths',
+    )
   def _getLinkCommonArgs(self, dll):
     
     args = [self.__linkExe, '/NOLOGO']
@@ -1254,7 +1272,10 @@ class MsvcCompiler(Compiler):
     @makeCommand(args)
     def link():
       if dll and importLibrary:
-        cake.filesys.makeDirs(cake.path.dirName(importLibrary))
+        cake.filesys.makeDirs(
+          cake.path.dirName(importLibrary),
+          self.engine.knownDirectories,
+          )
       self._runProcess(args, target)
        
     @makeCommand(args) 
@@ -1317,7 +1338,7 @@ class MsvcCompiler(Compiler):
         self.engine.logger.outputInfo(
           "Creating dummy manifest: %s\n" % embeddedManifest
           )
-        cake.filesys.makeDirs(absTargetDir)
+        cake.filesys.makeDirs(absTargetDir, self.engine.knownDirectories)
         open(absEmbeddedManifest, 'wb').close()
       
       # Generate .embed.manifest.rc
@@ -1404,7 +1425,7 @@ class MsvcCompiler(Compiler):
     else:
       return link, scan
 
-  @memoise
+  @memoise('resourceFlags', 'defines', 'includePaths')
   def _getCommonResourceArgs(self):
     args = [self.__rcExe] # Cannot use '/nologo' due to WindowsSDK 6.0A rc.exe not supporting it.
     args.extend(self.resourceFlags)
@@ -1439,13 +1460,13 @@ class MsvcCompiler(Compiler):
     We use this rather than /nologo as the /nologo flag isn't supported on all
     versions of rc.exe.
     """
-    outputLines = text.splitlines()
-
-    # Skip any leading logo output by some of the later versions of rc.exe
-    if len(outputLines) >= 2 and \
-       outputLines[0].startswith('Microsoft (R) Windows (R) Resource Compiler Version ') and \
-       outputLines[1].startswith('Copyright (C) Microsoft Corporation.  All rights reserved.'):
-      outputLines = outputLines[2:]
+    # Output is passed on a line at a time so skip the logo lines output by
+    # some of the later versions of rc.exe wherever they appear.
+    outputLines = [
+      line for line in text.splitlines()
+      if not line.startswith('Microsoft (R) Windows (R) Resource Compiler Version ') and
+         not line.startswith('Copyright (C) Microsoft Corporation.  All rights reserved.')
+      ]
       
     if outputLines:
       self._outputStdout("\n".join(outputLines) + "\n")
@@ -21,6 +21,9 @@ class MwcwCompiler(Compiler):
   pchSuffix = '.mch'
   _name = 'mwcw'
 
+  # Messages span several lines so format the output all at once.
+  _canStreamOutput = False
+
   def __init__(
     self,
     configuration,
@@ -104,7 +107,7 @@ class MwcwCompiler(Compiler):
   def _outputStderr(self, text):
     Compiler._outputStderr(self, self._formatMessage(text))
     
-  @memoise
+  @memoise('warningsAsErrors', 'debugSymbols')
   def _getCommonArgs(self):
     args = [
       '-msgstyle', 'parseable',  # Use parseable message output
@@ -119,7 +122,11 @@ class MwcwCompiler(Compiler):
     
     return args
   
-  @memoise
+  @memoise(
+    'language', 'cSuffixes', 'cppSuffixes', 'mSuffixes', 'cFlags',
+    'cppFlags', 'mFlags', 'enableRtti', 'enableExceptions', 'optimisation',
+    'includePaths', 'defines', 'forcedIncludes',
+    )
   def _getCompileArgs(self, suffix):
     args = [
       self.__ccExe,
@@ -241,7 +248,7 @@ class MwcwCompiler(Compiler):
     canBeCached = True
     return compile, args, canBeCached    
 
-  @memoise
+  @memoise('libraryFlags')
   def _getCommonLibraryArgs(self):
     args = [self.__ldExe, '-library']
     args.extend(self._getCommonArgs())
@@ -268,7 +275,9 @@ class MwcwCompiler(Compiler):
 
     return archive, scan
 
-  @memoise
+  @memoise(
+    'moduleFlags', 'programFlags', 'linkerScript', 'libraryPaths',
+    )
   def _getCommonLinkArgs(self, dll):
     args = [self.__ldExe, '-application']
     args.extend(self._getCommonArgs())
@@ -328,7 +337,7 @@ class MwcwCompiler(Compiler):
 
 class WiiMwcwCompiler(MwcwCompiler):
 
-  @memoise
+  @memoise()
   def _getCommonArgs(self):
     args = MwcwCompiler._getCommonArgs(self)
     args.extend([
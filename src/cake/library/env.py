@@ -40,6 +40,7 @@ class EnvironmentTool(Tool):
     @param key: The key of the environment variable to set.
     @param value: The value to set the environment variable to.
     """
+    self._unshare('vars')
     self.vars[key] = value
     
   def __delitem__(self, key):
@@ -47,6 +48,7 @@ class EnvironmentTool(Tool):
     
     @param key: The key of the environment variable to delete. 
     """
+    self._unshare('vars')
     del self.vars[key]
 
   def __contains__(self, key):
@@ -67,6 +69,7 @@ class EnvironmentTool(Tool):
   def setDefault(self, key, default=None):
     """Set a value only if it doesn't already exist.
     """
+    self._unshare('vars')
     return self.vars.setdefault(key, default)
       
   def update(self, *values, **kwargs):
@@ -89,6 +92,7 @@ class EnvironmentTool(Tool):
         )
     @param values: An iterable sequence of key/value pairs to update from.
     """
+    self._unshare('vars')
     self.vars.update(*values, **kwargs)
     
   def expand(self, value):
@@ -119,6 +123,7 @@ class EnvironmentTool(Tool):
         MESSAGE="Added /O1 flag. ",
         )
     """
+    self._unshare('vars')
     for k, v in kwargs.items():
       try:
         old = self.vars[k]
@@ -140,6 +145,7 @@ class EnvironmentTool(Tool):
         MESSAGE="Added /O1 flag. ",
         )
     """
+    self._unshare('vars')
     for k, v in kwargs.items():
       try:
         old = self.vars[k]
@@ -161,4 +167,5 @@ class EnvironmentTool(Tool):
         ART_PATH="C:/art",
         )
     """
+    self._unshare('vars')
     self.vars.update(kwargs)
@@ -6,18 +6,92 @@
 """
 
 import glob
+import os
+import os.path
+import pickle
 import cake.path
 import cake.filesys
+import cake.hash
 
 from cake.async_util import flatten, waitForAsyncResult
 from cake.target import DirectoryTarget, FileTarget, getPath, getTask
+from cake.engine import BuildError
 from cake.library import Tool
 from cake.script import Script
 
+_MIRROR_MANIFEST_MAGIC = b"CKMM"
+_MIRROR_MANIFEST_VERSION = 1
+
+def _getMirrorManifestPath(engine, absSourceDir, absTargetDir):
+  # There is one manifest for each source mirrored to each directory.
+  sourceDigest = cake.hash.sha1(
+    os.path.normcase(absSourceDir).encode("utf8")
+    ).digest()
+  target = "%s.mirror-%s" % (
+    os.path.normpath(absTargetDir),
+    cake.hash.hexlify(sourceDigest)[:8],
+    )
+  return engine.getDependencyInfoPath(target)
+
+def _readMirrorManifest(path):
+  try:
+    contents = cake.filesys.readFile(path)
+  except EnvironmentError:
+    return {}
+
+  magicLength = len(_MIRROR_MANIFEST_MAGIC)
+  if contents[-magicLength:] != _MIRROR_MANIFEST_MAGIC:
+    return {}
+  try:
+    version, entries = pickle.loads(contents[:-magicLength])
+  except Exception:
+    return {}
+  if version != _MIRROR_MANIFEST_VERSION or not isinstance(entries, dict):
+    return {}
+  return entries
+
+def _writeMirrorManifest(path, entries):
+  data = pickle.dumps(
+    (_MIRROR_MANIFEST_VERSION, entries),
+    pickle.HIGHEST_PROTOCOL,
+    )
+  cake.filesys.writeFile(path, data + _MIRROR_MANIFEST_MAGIC)
+
+def _scanMirror(path, includeMatch=None):
+  """Find the files and directories under a directory.
+
+  @return: A dictionary mapping the normalised relative path of each file
+  and directory to a tuple of its relative path and either the size and
+  modification time of the file or None for a directory.
+  """
+  found = {}
+  for relPath, entry in cake.filesys.walkTreeEntries(
+    path,
+    includeMatch=includeMatch,
+    ):
+    try:
+      if entry.is_dir():
+        state = None
+      else:
+        stat = entry.stat()
+        state = (stat.st_size, stat.st_mtime_ns)
+    except EnvironmentError:
+      continue
+    found[os.path.normcase(relPath)] = (relPath, state)
+  return found
+
 class FileSystemTool(Tool):
   """Tool that provides file system related utilities. 
   """
 
+  mirrorWorkers = 4
+  """The number of tasks used to copy the files of a mirrored directory.
+
+  If greater than 1 the files that need copying by L{mirrorDirectory}
+  are spread across this many tasks so they are copied in parallel.
+  @type: int
+  """
+
   def findFiles(self, path, recursive=True, includeMatch=None):
     """Find files and directories given a directory path.
     
@@ -40,6 +114,14 @@ class FileSystemTool(Tool):
     basePath = configuration.basePath(path)
     absPath = configuration.abspath(basePath)
     
+    listingCache = self.engine.getListingCache()
+    if listingCache is not None:
+      return listingCache.walkTree(
+        path=absPath,
+        recursive=recursive,
+        includeMatch=includeMatch,
+        )
+    
     return cake.filesys.walkTree(
       path=absPath,
       recursive=recursive,
@@ -58,7 +140,13 @@ class FileSystemTool(Tool):
     absPath = configuration.abspath(basePath)
     offset = len(absPath) - len(pathname)
     
-    return [p[offset:] for p in glob.iglob(absPath)]
+    listingCache = self.engine.getListingCache()
+    if listingCache is not None:
+      paths = listingCache.glob(absPath)
+    else:
+      paths = glob.iglob(absPath)
+    
+    return [p[offset:] for p in paths]
       
   def copyFile(self, source, target, onlyNewer=True):
     """Copy a file from one location to another.
@@ -117,7 +205,10 @@ class FileSystemTool(Tool):
       engine.logger.outputInfo("Copying %s to %s\n" % (sourcePath, target))
       
       try:
-        cake.filesys.makeDirs(cake.path.dirName(targetAbsPath))
+        cake.filesys.makeDirs(
+          cake.path.dirName(targetAbsPath),
+          self.engine.knownDirectories,
+          )
         cake.filesys.copyFile(sourceAbsPath, targetAbsPath)
       except EnvironmentError as e:
         engine.raiseError("%s: %s\n" % (target, str(e)), targets=[target])
@@ -231,43 +322,52 @@ class FileSystemTool(Tool):
       
       engine.logger.outputInfo("Creating Directory %s\n" % path)
       try:
-        cake.filesys.makeDirs(targetAbsPath)
+        cake.filesys.makeDirs(targetAbsPath, self.engine.knownDirectories)
       except EnvironmentError as e:
         engine.raiseError("%s: %s\n" % (targetDir, str(e)))
 
     def doDelete(paths):
-      for path in paths:
+      for path, isDir in paths:
         targetPath = cake.path.join(targetDir, path)
         absTargetPath = abspath(targetPath)
         engine.logger.outputInfo("Deleting %s\n" % targetPath)
-        if cake.path.isDir(absTargetPath):
-          cake.filesys.removeTree(absTargetPath)
-        elif cake.path.isFile(absTargetPath):
-          cake.filesys.remove(absTargetPath)
+        if isDir:
+          if cake.path.isDir(absTargetPath):
+            cake.filesys.removeTree(absTargetPath, self.engine.knownDirectories)
         else:
-          pass # Skip files that may have been deleted already due to iteration order.
+          # Fails silently for files that may have been deleted already
+          # due to iteration order.
+          cake.filesys.remove(absTargetPath, self.engine.knownDirectories)
     
     @waitForAsyncResult
     def run(sourceDir):
-      sources = set(cake.filesys.walkTree(
+      sources = dict(cake.filesys.walkTreeEntries(
         path=abspath(sourceDir),
         recursive=recursive,
         includeMatch=includeMatch,
         ))
         
       if removeStale:
-        targets = set(cake.filesys.walkTree(path=abspath(targetDir), recursive=recursive))
-        oldFiles = targets.difference(sources)
+        targets = cake.filesys.walkTreeEntries(path=abspath(targetDir), recursive=recursive)
+        oldFiles = [
+          (path, entry.is_dir())
+          for path, entry in targets
+          if path not in sources
+          ]
         removeTask = self.engine.createTask(lambda f=oldFiles: doDelete(f))
         removeTask.lazyStart()
       else:
         removeTask = None
       
+      # The timestamps of source files are only needed to check whether
+      # they are newer than the targets.
+      primeTimestamps = onlyNewer and not engine.forceBuild
+
       results = []
-      for source in sources:
+      for source, entry in sources.items():
         sourcePath = cake.path.join(sourceDir, source)
         targetPath = cake.path.join(targetDir, source)
-        if cake.path.isDir(abspath(sourcePath)):
+        if entry.is_dir():
           if self.enabled:  
             dirTask = self.engine.createTask(lambda t=targetPath: doMakeDir(t))
             dirTask.completeAfter(removeTask)
@@ -276,6 +376,11 @@ class FileSystemTool(Tool):
             dirTask = None
           results.append(DirectoryTarget(path=source, task=dirTask))
         else:
+          if primeTimestamps:
+            try:
+              engine.updateTimestampCache(abspath(sourcePath), entry.stat())
+            except EnvironmentError:
+              pass # Let the copy report the error.
           fileTarget = self._copyFile(source=sourcePath, target=targetPath, onlyNewer=onlyNewer)
           if fileTarget.task:
             fileTarget.task.completeAfter(removeTask)
@@ -286,3 +391,262 @@ class FileSystemTool(Tool):
       return results
     
     return run(sourceDir)
+
+  def mirrorDirectory(
+    self,
+    sourceDir,
+    targetDir,
+    removeStale=True,
+    includeMatch=None,
+    useHardLinks=False,
+    compareDigests=False,
+    ):
+    """Make a target directory a mirror of a source directory.
+    
+    Unlike L{copyDirectory} the whole tree is synchronised by a single
+    task. The source and target trees are each scanned once, the files
+    that have changed are copied in parallel by L{mirrorWorkers} tasks
+    and the state of the target is recorded in a single manifest rather
+    than being checked file by file.
+    
+    A file is copied again if the source or target file's size or
+    modification time has changed since it was last copied.
+    
+    @param sourceDir: The source directory to copy from.
+    @type sourceDir: string or L{DirectoryTarget}
+    
+    @param targetDir: The target directory to copy to. It will be
+    created if it doesn't exist.
+    @type targetDir: string
+    
+    @param removeStale: Remove files and directories in the target
+    directory that don't exist in the source directory.
+    @type removeStale: bool
+    
+    @param includeMatch: A callable used to decide whether to include
+    certain files when mirroring. This could be a python callable that
+    returns True to copy the file or False to exclude it, or a regular
+    expression function such as re.compile().match or re.match.
+    @type includeMatch: any callable 
+    
+    @param useHardLinks: Make hard links to the source files instead of
+    copying them. Files are copied if a link can't be made, eg. because
+    the directories are on different file systems.
+    @type useHardLinks: bool
+    
+    @param compareDigests: When a source file's size or modification
+    time has changed, compare a digest of its contents with the one
+    recorded when it was last copied and only copy it if they differ.
+    @type compareDigests: bool
+    
+    @return: A DirectoryTarget that will complete when the target
+    directory is up to date.
+    @rtype: L{DirectoryTarget}
+    """
+    if not isinstance(targetDir, str):
+      raise TypeError("targetDir must be a string")
+    
+    engine = self.engine
+    configuration = self.configuration
+    basePath = configuration.basePath
+    abspath = configuration.abspath
+    
+    sourceDir = basePath(sourceDir)
+    targetDir = basePath(targetDir)
+    
+    mirrorWorkers = self.mirrorWorkers
+
+    def _run(func, *args):
+      try:
+        return func(*args)
+      except BuildError:
+        raise
+      except Exception as e:
+        msg = "cake: Error mirroring %s to %s: %s\n" % (
+          getPath(sourceDir), targetDir, str(e))
+        engine.raiseError(msg, targets=[targetDir])
+
+    def _copyFiles(sourcePath, files):
+      absSourceDir = abspath(sourcePath)
+      absTargetDir = abspath(targetDir)
+      entries = {}
+      for key, path, digest in files:
+        sourceFile = os.path.join(sourcePath, path)
+        targetFile = os.path.join(targetDir, path)
+        absSourceFile = os.path.join(absSourceDir, path)
+        absTargetFile = os.path.join(absTargetDir, path)
+        linked = False
+        try:
+          sourceStat = os.stat(absSourceFile)
+          if useHardLinks:
+            try:
+              cake.filesys.linkFile(absSourceFile, absTargetFile)
+              linked = True
+            except EnvironmentError:
+              pass # Fall back to copying the file.
+          if linked:
+            engine.logger.outputInfo(
+              "Linking %s to %s\n" % (sourceFile, targetFile)
+              )
+          else:
+            engine.logger.outputInfo(
+              "Copying %s to %s\n" % (sourceFile, targetFile)
+              )
+            cake.filesys.copyFileData(absSourceFile, absTargetFile)
+          targetStat = os.stat(absTargetFile)
+        except EnvironmentError as e:
+          engine.raiseError(
+            "%s: %s\n" % (targetFile, str(e)),
+            targets=[targetFile],
+            )
+        engine.notifyFileChanged(absTargetFile)
+        entries[key] = (
+          sourceStat.st_size,
+          sourceStat.st_mtime_ns,
+          digest,
+          targetStat.st_size,
+          targetStat.st_mtime_ns,
+          linked,
+          )
+      return entries
+
+    def _getDigest(absSourceDir, path):
+      if not compareDigests:
+        return None
+      return engine.getFileDigest(os.path.join(absSourceDir, path))
+
+    def _mirror():
+      sourcePath = getPath(sourceDir)
+      absSourceDir = os.path.normpath(abspath(sourcePath))
+      absTargetDir = os.path.normpath(abspath(targetDir))
+
+      # A single pass over each tree finds the state of all files.
+      sources = _scanMirror(absSourceDir, includeMatch)
+      existing = _scanMirror(absTargetDir)
+
+      removedDirs = []
+      def remove(key):
+        path, state = existing.pop(key)
+        engine.logger.outputInfo(
+          "Deleting %s\n" % os.path.join(targetDir, path),
+          )
+        absPath = os.path.join(absTargetDir, path)
+        if state is None:
+          cake.filesys.removeTree(absPath, self.engine.knownDirectories)
+          removedDirs.append(key + os.path.sep)
+        else:
+          cake.filesys.remove(absPath, self.engine.knownDirectories)
+
+      for key in sorted(existing):
+        # Skip files in directories that have already been deleted.
+        if any(key.startswith(d) for d in removedDirs):
+          existing.pop(key)
+          continue
+        source = sources.get(key, None)
+        if source is None:
+          if removeStale:
+            remove(key)
+        elif (source[1] is None) != (existing[key][1] is None):
+          # A file has replaced a directory or vice versa.
+          remove(key)
+
+      manifestPath = _getMirrorManifestPath(engine, absSourceDir, absTargetDir)
+      manifest = _readMirrorManifest(manifestPath)
+      newManifest = {}
+      toCopy = []
+      if not cake.path.isDir(absTargetDir):
+        engine.logger.outputInfo("Creating Directory %s\n" % targetDir)
+        cake.filesys.makeDirs(absTargetDir, self.engine.knownDirectories)
+      for key in sorted(sources):
+        path, state = sources[key]
+        if state is None:
+          if key not in existing:
+            engine.logger.outputInfo(
+              "Creating Directory %s\n" % os.path.join(targetDir, path),
+              )
+            cake.filesys.makeDirs(
+              os.path.join(absTargetDir, path),
+              self.engine.knownDirectories,
+              )
+          continue
+
+        digest = None
+        entry = manifest.get(key, None)
+        found = existing.get(key, None)
+        if engine.forceBuild:
+          reasonToBuild = "rebuild has been forced"
+        elif found is None:
+          reasonToBuild = "it doesn't exist"
+        elif entry is None:
+          reasonToBuild = "it isn't in the mirror manifest"
+        elif entry[5] != useHardLinks:
+          reasonToBuild = "useHardLinks has changed"
+        elif entry[3:5] != found[1]:
+          reasonToBuild = "it has been changed"
+        elif entry[:2] == state:
+          reasonToBuild = None
+        else:
+          digest = _getDigest(absSourceDir, path)
+          if digest is not None and digest == entry[2]:
+            # Only the source's timestamp has changed.
+            reasonToBuild = None
+            entry = state + entry[2:]
+          else:
+            reasonToBuild = "'%s' has changed" % os.path.join(sourcePath, path)
+
+        if reasonToBuild is None:
+          newManifest[key] = entry
+          continue
+
+        engine.logger.outputDebug(
+          "reason",
+          "Copying '" + os.path.join(targetDir, path) +
+          "' because " + reasonToBuild + ".\n",
+          )
+        if digest is None:
+          digest = _getDigest(absSourceDir, path)
+        toCopy.append((key, path, digest, state[0]))
+
+      def storeManifest(tasks):
+        for task in tasks:
+          newManifest.update(task.result)
+        if newManifest != manifest:
+          _writeMirrorManifest(manifestPath, newManifest)
+
+      # Spread the largest files evenly between the workers.
+      toCopy.sort(key=lambda f: f[3], reverse=True)
+      toCopy = [f[:3] for f in toCopy]
+
+      workers = min(mirrorWorkers, len(toCopy))
+      if workers <= 1:
+        if toCopy:
+          newManifest.update(_copyFiles(sourcePath, toCopy))
+        storeManifest([])
+        return
+
+      copyTasks = []
+      for i in range(workers):
+        copyTask = engine.createTask(
+          lambda f=toCopy[i::workers]: _run(_copyFiles, sourcePath, f)
+          )
+        copyTask.parent.completeAfter(copyTask)
+        copyTask.start(immediate=True)
+        copyTasks.append(copyTask)
+
+      manifestTask = engine.createTask(
+        lambda: _run(storeManifest, copyTasks)
+        )
+      manifestTask.parent.completeAfter(manifestTask)
+      manifestTask.startAfter(copyTasks, immediate=True)
+
+    if self.enabled:
+      task = engine.createTask(lambda: _run(_mirror))
+      task.lazyStartAfter(getTask(sourceDir))
+    else:
+      task = None
+
+    directoryTarget = DirectoryTarget(path=targetDir, task=task)
+
+    Script.getCurrent().getDefaultTarget().addTarget(directoryTarget)
+
+    return directoryTarget
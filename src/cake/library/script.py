@@ -5,20 +5,55 @@
 @license: Licensed under the MIT license.
 """
 
+import marshal
 import os.path
 
+import cake.hash
+import cake.outputcache
 from cake.target import Target, FileTarget, getPaths, getTask
 from cake.library import Tool
 from cake.script import Script
 
+def _getFunctionKey(engine, func):
+  """Get a value identifying a function for the output cache.
+
+  @return: The function's qualified name and a digest of the script
+  that defines it, or of its code if the script can't be read, or None
+  if the function has no code, eg. a builtin or functools.partial.
+  """
+  code = getattr(func, "__code__", None)
+  if code is None:
+    return None
+  name = "%s.%s" % (
+    getattr(func, "__module__", None),
+    getattr(func, "__qualname__", code.co_name),
+    )
+  try:
+    digest = engine.getFileDigest(code.co_filename)
+  except EnvironmentError:
+    digest = cake.hash.sha1(marshal.dumps(code)).digest()
+  return name, cake.hash.hexlify(digest)
+
 class ScriptTool(Tool):
   """Tool that provides utilities for performing Script operations.
   """
   
+  objectCachePath = None
+  """Set the path to the cache used by cacheable functions.
+  
+  Functions run with cacheable=True store their targets in this cache,
+  keyed by a digest of their args and the contents of their sources,
+  and restore them from it rather than running again. This is usually
+  set to the same path as the compilers' objectCachePath.
+  
+  If the value is None then cacheable functions are always run.
+  @type: string or None
+  """
+
   def __init__(self, *args, **kwargs):
     Tool.__init__(self, *args, **kwargs)
     self._included = {}
-  
+
   @property
   def path(self):
     """The path of the currently executing script.
@@ -272,13 +307,24 @@ class ScriptTool(Tool):
     else:
       return [_execute(path) for path in scripts]
 
-  def run(self, func, args=None, targets=None, sources=[]):
+  def run(self, func, args=None, targets=None, sources=[], cacheable=False):
     """Execute the specified python function as a task.
 
     Only executes the function after the sources have been built and only
     if the target exists, args is the same as last run and the sources
     haven't changed.
 
+    If cacheable is True and L{objectCachePath} is set then the targets
+    are restored from the cache if the function has been run before with
+    the same args and sources with the same contents, in which case the
+    function isn't called and the task's result is None. The cache key
+    includes the function's qualified name and a digest of the script
+    that defines it. The repr() of args must identify everything else the
+    function does apart from reading the sources, eg. the values of
+    variables it refers to, and the function must only write the
+    targets. Functions without code, eg. a functools.partial, aren't
+    cached.
+
     @note: I couldn't think of a better class to put this function in so
     for now it's here although it doesn't really belong.
     """
@@ -290,6 +336,11 @@ class ScriptTool(Tool):
     targets = basePath(targets)
     sources = basePath(sources)
 
+    if cacheable and self.objectCachePath is not None:
+      cachePath = configuration.abspath(self.objectCachePath)
+    else:
+      cachePath = None
+
     def _run():
       sourcePaths = getPaths(sources)
       if targets:
@@ -310,6 +361,38 @@ class ScriptTool(Tool):
         except EnvironmentError:
           pass
 
+      cacheKey = None
+      functionKey = None
+      if targets and cachePath is not None:
+        functionKey = _getFunctionKey(engine, func)
+      if functionKey is not None:
+        absTargets = [configuration.abspath(t) for t in targets]
+        try:
+          cacheKey = cake.outputcache.calculateKey(
+            engine,
+            "script",
+            (functionKey, args),
+            [configuration.abspath(s) for s in sourcePaths],
+            len(targets),
+            )
+        except EnvironmentError:
+          pass # Let the function report missing sources.
+
+        if cacheKey is not None and cake.outputcache.restoreTargets(
+          engine,
+          cachePath,
+          cacheKey,
+          absTargets,
+          ):
+          engine.logger.outputInfo("Restoring %s from cache\n" % targets[0])
+          newDependencyInfo = configuration.createDependencyInfo(
+            targets=targets,
+            args=buildArgs,
+            dependencies=sourcePaths,
+            )
+          configuration.storeDependencyInfo(newDependencyInfo)
+          return None
+
       try:
         result = func()
       except Exception:
@@ -326,6 +409,9 @@ class ScriptTool(Tool):
           dependencies=sourcePaths,
           )
         configuration.storeDependencyInfo(newDependencyInfo)
+
+        if cacheKey is not None:
+          cake.outputcache.storeTargets(cachePath, cacheKey, absTargets)
         
       return result
 
@@ -338,9 +424,10 @@ class ScriptTool(Tool):
     currentScript = Script.getCurrent()
 
     if targets is not None:
-      targets = [FileTarget(path=t, task=task) for t in targets]
-      currentScript.getDefaultTarget().addTargets(targets)
-      return targets
+      # Don't rebind targets, _run() still needs the paths.
+      fileTargets = [FileTarget(path=t, task=task) for t in targets]
+      currentScript.getDefaultTarget().addTargets(fileTargets)
+      return fileTargets
     else:
       target = Target(task)
       currentScript.getDefaultTarget().addTarget(target)
@@ -6,9 +6,12 @@
 """
 
 import os
+import shutil
 import subprocess
 import cake.filesys
+import cake.outputcache
 import cake.path
+from cake.gnu import parseDependencyFile
 from cake.async_util import waitForAsyncResult, flatten
 from cake.target import Target, FileTarget, getPaths, getTasks
 from cake.library import Tool
@@ -18,6 +21,18 @@ _undefined = object()
 
 class ShellTool(Tool):
 
+  objectCachePath = None
+  """Set the path to the cache used by cacheable commands.
+  
+  Commands run with cacheable=True store their targets in this cache,
+  keyed by a digest of their arguments and the contents of their
+  sources, and restore them from it rather than running again. This is
+  usually set to the same path as the compilers' objectCachePath.
+  
+  If the value is None then cacheable commands are always run.
+  @type: string or None
+  """
+
   def __init__(self, configuration, env=None):
     Tool.__init__(self, configuration)
     if env is None:
@@ -25,7 +40,17 @@ class ShellTool(Tool):
     else:
       self._env = dict(env)
 
-  def run(self, args, targets=[], sources=[], cwd=None, shell=False, removeTargets=False):
+  def run(
+    self,
+    args,
+    targets=[],
+    sources=[],
+    cwd=None,
+    shell=False,
+    removeTargets=False,
+    cacheable=False,
+    depfile=None,
+    ):
     """Run a shell command to build specified targets.
 
     @param args: The command-line to run.
@@ -47,16 +72,47 @@ class ShellTool(Tool):
 
     @param removeTargets: If specified then the target files will be removed
     before running the command if they already exist.
+
+    @param cacheable: If True and L{objectCachePath} is set then the
+    targets are restored from the cache if the command has been run
+    before with the same args and sources with the same contents. The
+    command must only read the sources and must only write the targets.
+    The cache key also includes the environment and the contents of the
+    executable, if args is a list and args[0] can be found. If args is a
+    string the programs it runs must be listed in sources.
+    It is ignored if depfile is specified as the inputs the command
+    reads aren't known until it has run.
+
+    @param depfile: If specified then the path of a Make-style
+    dependency file written by the command that lists the files it read
+    other than the sources, eg. the headers included by a code
+    generator. If any of those files change then the command will be
+    re-executed. Relative paths in the file are relative to cwd. Only
+    used if targets are specified.
+    @type depfile: string or None
     """
     tool = self.clone()
     
     basePath = self.configuration.basePath
    
-    return tool._run(args, basePath(targets), basePath(sources), basePath(cwd), shell, removeTargets)
+    return tool._run(
+      args,
+      basePath(targets),
+      basePath(sources),
+      basePath(cwd),
+      shell,
+      removeTargets,
+      cacheable,
+      basePath(depfile),
+      )
   
-  def _run(self, args, targets, sources, cwd, shell, removeTargets):
+  def _run(self, args, targets, sources, cwd, shell, removeTargets, cacheable, depfile):
 
     engine = self.engine
+    if cacheable and depfile is None and self.objectCachePath is not None:
+      cachePath = self.configuration.abspath(self.objectCachePath)
+    else:
+      cachePath = None
     
     def spawnProcess(targets, sources, cwd):
 
@@ -98,7 +154,7 @@ class ShellTool(Tool):
           absT = abspath(t)
           
           try:
-            cake.filesys.makeDirs(cake.path.dirName(absT))
+            cake.filesys.makeDirs(cake.path.dirName(absT), self.engine.knownDirectories)
           except Exception as e:
             msg = "cake: Error creating target directory %s: %s\n" % (
               cake.path.dirName(t), str(e))
@@ -112,6 +168,53 @@ class ShellTool(Tool):
                 t, str(e))
               engine.raiseError(msg, targets=targets)
 
+      if targets and depfile is not None:
+        # Don't pick up the dependencies of a previous run if the
+        # command fails to write the file.
+        absDepfile = abspath(depfile)
+        try:
+          cake.filesys.makeDirs(
+            cake.path.dirName(absDepfile),
+            self.engine.knownDirectories,
+            )
+          cake.filesys.remove(absDepfile)
+        except Exception as e:
+          msg = "cake: Error removing old depfile %s: %s\n" % (
+            depfile, str(e))
+          engine.raiseError(msg, targets=targets)
+
+      cacheKey = None
+      if targets and cachePath is not None:
+        absTargets = [abspath(t) for t in targets]
+        keySources = [abspath(s) for s in sourcePaths]
+        if executable is not None:
+          keySources.append(self._findExecutable(argsList[0]))
+        try:
+          cacheKey = cake.outputcache.calculateKey(
+            engine,
+            "shell",
+            (argsList, shell, cwd, sorted(self._env.items())),
+            [p for p in keySources if p is not None],
+            len(targets),
+            )
+        except EnvironmentError:
+          pass # Let the command report missing sources.
+
+        if cacheKey is not None and cake.outputcache.restoreTargets(
+          engine,
+          cachePath,
+          cacheKey,
+          absTargets,
+          ):
+          engine.logger.outputInfo("Restoring %s from cache\n" % targets[0])
+          newDependencyInfo = configuration.createDependencyInfo(
+            targets=targets,
+            args=buildArgs,
+            dependencies=sourcePaths,
+            )
+          configuration.storeDependencyInfo(newDependencyInfo)
+          return
+
       if cwd is None:
         cwd = configuration.baseDir
       else:
@@ -146,13 +249,24 @@ class ShellTool(Tool):
         engine.raiseError(msg, targets=targets)
 
       if targets:
+        dependencies = list(sourcePaths)
+        if depfile is not None:
+          dependencies.extend(self._readDepfile(
+            absDepfile,
+            cwd,
+            sourcePaths,
+            targets,
+            ))
         newDependencyInfo = configuration.createDependencyInfo(
           targets=targets,
           args=buildArgs,
-          dependencies=sourcePaths,
+          dependencies=dependencies,
           )
         configuration.storeDependencyInfo(newDependencyInfo)
 
+        if cacheKey is not None:
+          cake.outputcache.storeTargets(cachePath, cacheKey, absTargets)
+
     @waitForAsyncResult
     def _run(targets, sources, cwd):
       if self.enabled:
@@ -172,6 +286,55 @@ class ShellTool(Tool):
     
     return _run(flatten(targets), flatten(sources), cwd)
 
+  def _findExecutable(self, program):
+    """Find the path of the program a command runs.
+
+    @return: The absolute path of the program or None if it can't be
+    found.
+    @rtype: string or None
+    """
+    path = self.configuration.abspath(program)
+    if cake.filesys.isFile(path):
+      return path
+    path = shutil.which(program, path=self._env.get('PATH', None))
+    if path is not None:
+      path = os.path.abspath(path)
+    return path
+
+  def _readDepfile(self, path, cwd, sourcePaths, targets):
+    """Read the dependencies listed in a depfile written by a command.
+
+    @return: The absolute paths of the dependencies that aren't already
+    sources. Files that don't exist, eg. temporary files, are left out
+    as their timestamps can't be checked.
+    @rtype: list of string
+    """
+    engine = self.engine
+    abspath = self.configuration.abspath
+
+    engine.logger.outputDebug(
+      "scan",
+      "scan: %s\n" % path,
+      )
+    try:
+      paths = parseDependencyFile(path, "")
+    except EnvironmentError as e:
+      msg = "cake: Error reading depfile %s: %s\n" % (path, str(e))
+      engine.raiseError(msg, targets=targets)
+
+    known = set(os.path.normcase(abspath(p)) for p in sourcePaths)
+    known.update(os.path.normcase(abspath(t)) for t in targets)
+    dependencies = []
+    for p in paths:
+      p = os.path.normpath(os.path.join(cwd, p))
+      key = os.path.normcase(p)
+      if key in known:
+        continue
+      known.add(key)
+      if cake.filesys.isFile(p):
+        dependencies.append(p)
+    return dependencies
+
   def __iter__(self):
     return iter(self._env)
 
@@ -182,6 +345,7 @@ class ShellTool(Tool):
     return self._env.items()
 
   def update(self, value):
+    self._unshare('_env')
     return self._env.update(value)
 
   def get(self, key, default=_undefined):
@@ -194,9 +358,11 @@ class ShellTool(Tool):
     return self._env[key]
 
   def __setitem__(self, key, value):
+    self._unshare('_env')
     self._env[key] = value
 
   def __delitem__(self, key):
+    self._unshare('_env')
     del self._env[key]
 
   def appendPath(self, path):
@@ -10,95 +10,81 @@ from cake.target import getPath, getTask, getTasks, DirectoryTarget, FileTarget
 from cake.engine import BuildError
 from cake.script import Script
 import cake.filesys
+import cake.hash
 import cake.zipping
 import zipfile
 import os
 import os.path
-import calendar
 import time
 
-def _shouldExtractFile(engine, absTargetFile, zipTime, onlyNewer):
-  
+def _scanDirectory(path):
+  """Find the files and directories under a directory.
+
+  @return: A dictionary mapping the normalised relative path of each file
+  and directory to a tuple of its relative path and either the size and
+  modification time of the file or None for a directory.
+  """
+  found = {}
+  for relPath, entry in cake.filesys.walkTreeEntries(path):
+    try:
+      if entry.is_dir():
+        state = None
+      else:
+        stat = entry.stat()
+        state = (stat.st_size, stat.st_mtime)
+    except EnvironmentError:
+      continue
+    found[os.path.normcase(relPath)] = (relPath, state)
+  return found
+
+def _getManifestPath(engine, absSourcePath, absTargetDir):
+  # There is one manifest for each zip extracted to each directory.
+  sourceDigest = cake.hash.sha1(
+    os.path.normcase(absSourcePath).encode("utf8")
+    ).digest()
+  target = "%s.zip-%s" % (
+    os.path.normpath(absTargetDir),
+    cake.hash.hexlify(sourceDigest)[:8],
+    )
+  return engine.getDependencyInfoPath(target)
+
+def _getReasonToExtract(engine, zipInfo, key, manifest, existing, onlyNewer):
   if not onlyNewer:
     return "onlyNewer is False" # Always rebuild
 
-  try:
-    mtime = os.stat(absTargetFile).st_mtime
-  except EnvironmentError:
-    return "it doesn't exist" 
+  if engine.forceBuild:
+    return "rebuild has been forced"
 
-  if zipTime != mtime:
-    # Assume the zip and the extract are the same file.
-    return "it has been changed"
-    
-  return None
+  found = existing.get(key, None)
+  if found is None or found[1] is None:
+    return "it doesn't exist"
 
-def _extractFile(configuration, zipFile, zipPath, zipInfo, targetDir, absTargetDir, onlyNewer):
-  """Extract the ZipInfo object to a physical file at targetDir.
-  """
-  engine = configuration.engine
-  targetFile = os.path.join(targetDir, zipInfo.filename)
-  absTargetFile = os.path.join(absTargetDir, zipInfo.filename)
-  
-  if cake.zipping.isDirectoryInfo(zipInfo):
-    # The zip info corresponds to a directory.
-    cake.filesys.makeDirs(absTargetFile)
-  else:
-    # The zip info corresponds to a file.
-    year, month, day, hour, minute, second = zipInfo.date_time
-    zipTime = calendar.timegm((year, month, day, hour, minute, second, 0, 0, 0))
-    
-    buildArgs = []
-    _, reasonToBuild = configuration.checkDependencyInfo(targetFile, buildArgs)
+  entry = manifest.get(key, None)
+  if entry is None:
+    return "it isn't in the extraction manifest"
 
-    if reasonToBuild is None:
-      reasonToBuild = _shouldExtractFile(engine, absTargetFile, zipTime, onlyNewer)
-      if reasonToBuild is None:
-        return # Target is up to date
+  zipTime = cake.zipping.getZipTime(zipInfo)
+  if entry[:3] != (zipInfo.CRC, zipInfo.file_size, zipTime):
+    return "it has changed in the zip"
 
-    engine.logger.outputDebug(
-      "reason",
-      "Extracting '" + targetFile + "' because " + reasonToBuild + ".\n",
-      )
-    
-    engine.logger.outputInfo("Extracting %s\n" % targetFile)
-    
-    try:
-      cake.filesys.writeFile(absTargetFile, zipFile.read(zipInfo.filename))
-    except Exception as e:
-      engine.raiseError(
-        "Failed to extract file %s from zip %s: %s\n" % (
-          zipInfo.filename,
-          zipPath,
-          str(e),
-          ),
-        targets=[targetFile],
-        )
-      
-    # Now that the file has been written successfully, save the new dependency file 
-    newDependencyInfo = configuration.createDependencyInfo(
-      targets=[targetFile],
-      args=buildArgs,
-      dependencies=[],
-      )
-    configuration.storeDependencyInfo(newDependencyInfo)
+  if entry[3:] != found[1]:
+    return "it has been changed"
 
-    # Set the file modification time to match the zip time
-    os.utime(absTargetFile, (zipTime, zipTime))
+  return None
 
 def _shouldCompress(
   configuration,
   sourcePath,
   targetPath,
   toZip,
+  entries,
   onlyNewer,
   removeStale,
   ):
 
   if not onlyNewer:
-    return None, "onlyNewer is False" # Always rebuild
+    return None, None, "onlyNewer is False" # Always rebuild
   
-  absSourcePath = configuration.abspath(sourcePath)
   absTargetPath = configuration.abspath(targetPath)
 
   # Try to open an existing zip file
@@ -114,46 +100,78 @@ def _shouldCompress(
     for zipInfo in zipInfos:
       path = os.path.normpath(os.path.normcase(zipInfo.filename))
       fromZip[path] = zipInfo
-  except EnvironmentError:
+  except (EnvironmentError, zipfile.BadZipfile):
     # File doesn't exist or is invalid
-    return None, "'" + targetPath + "' doesn't exist" 
+    return None, None, "'" + targetPath + "' doesn't exist" 
 
   # Check modification times of source files against those in the zip
+  toAppend = []
+  toRemove = []
+  reasonToBuild = None
   for casedPath, originalPath in toZip.items():
     zipInfo = fromZip.get(casedPath, None)
-
-    # Not interested in modified directories
-    if zipInfo is not None and not cake.zipping.isDirectoryInfo(zipInfo):
-      absSourceFilePath = os.path.join(absSourcePath, originalPath)
-      utcTime = time.gmtime(os.stat(absSourceFilePath).st_mtime)
+    sourceFilePath = os.path.join(sourcePath, originalPath)
+    if zipInfo is None:
+      toAppend.append(originalPath)
+      if reasonToBuild is None:
+        reasonToBuild = "'" + sourceFilePath + "' is not in zip"
+    elif not cake.zipping.isDirectoryInfo(zipInfo):
+      # Not interested in modified directories
+      utcTime = time.gmtime(entries[casedPath].stat().st_mtime)
       zipTime = utcTime[0:5] + (
         utcTime[5] & 0xFE, # Zip only saves 2 second resolution
         )              
       if zipTime != zipInfo.date_time:
-        sourceFilePath = os.path.join(sourcePath, originalPath)
-        # We must recreate the entire zip to update files
-        return None, "'" + sourceFilePath + "' has been changed"
+        # Replace the entry with the changed file
+        toAppend.append(originalPath)
+        toRemove.append(zipInfo.filename)
+        if reasonToBuild is None:
+          reasonToBuild = "'" + sourceFilePath + "' has been changed"
       
   if removeStale:
     for path, zipInfo in fromZip.items():
       if path not in toZip:
-        # We must recreate the zip to remove files
-        sourceFilePath = os.path.join(sourcePath, zipInfo.filename)
-        return None, "'" + sourceFilePath + "' has been removed"
-  
-  toAppend = []
-  reasonToBuild = None
-  for casedPath, originalPath in toZip.items():
-    if casedPath not in fromZip:
-      toAppend.append(originalPath)
-      if reasonToBuild is None:
-        sourceFilePath = os.path.join(sourcePath, originalPath)
-        reasonToBuild = "'" + sourceFilePath + "' is not in zip"
+        toRemove.append(zipInfo.filename)
+        if reasonToBuild is None:
+          sourceFilePath = os.path.join(sourcePath, zipInfo.filename)
+          reasonToBuild = "'" + sourceFilePath + "' has been removed"
       
-  return toAppend, reasonToBuild
+  return toAppend, toRemove, reasonToBuild
 
 class ZipTool(Tool):
   
+  extractWorkers = 1
+  """The number of tasks used to extract the files of a zip.
+
+  If greater than 1 the files that need extracting are spread across
+  this many tasks, each reading from its own handle to the zip, so that
+  large zips are extracted in parallel.
+  @type: int
+  """
+
+  compressWindow = cake.zipping.COMPRESS_WINDOW
+  """The maximum number of chunks of files being compressed at once.
+
+  Files are split into chunks of L{compressChunkSize} bytes that are
+  compressed in parallel by a pool of threads and written to the zip in
+  order. This bounds the memory used while compressing.
+  @type: int
+  """
+  compressChunkSize = cake.zipping.COMPRESS_CHUNK_SIZE
+  """The size of the chunks files are split into when compressing.
+
+  @type: int
+  """
+  compactRatio = cake.zipping.COMPACT_RATIO
+  """The fraction of a zip that may be unused before it is compacted.
+
+  Zips are updated in place. Entries for files that are changed or
+  removed are dropped from the zip's directory but their data is left
+  behind. Once it takes up more than this fraction of the zip the zip
+  is rewritten without it.
+  @type: float
+  """
+
   def extract(
     self,
     targetDir,
@@ -164,6 +182,10 @@ class ZipTool(Tool):
     ):
     """Extract all files in a Zip to the specified path.
   
+    The state of the extracted files is recorded in a single manifest
+    for each zip and target directory. A file is extracted again if its
+    entry in the zip or the extracted file has changed since.
+  
     @param targetDir: The directory to extract files to.
     @type targetDir: string
     
@@ -197,59 +219,165 @@ class ZipTool(Tool):
     targetDir = basePath(targetDir)
     source = basePath(source)
         
+    extractWorkers = self.extractWorkers
+
+    def _run(func, *args):
+      try:
+        return func(*args)
+      except BuildError:
+        raise
+      except Exception as e:
+        msg = "cake: Error extracting %s to %s: %s\n" % (
+          getPath(source), targetDir, str(e))
+        engine.raiseError(msg, targets=[targetDir])
+
+    def _extractFiles(sourcePath, zipInfos):
+      absTargetDir = configuration.abspath(targetDir)
+      entries = {}
+      zipFile = zipfile.ZipFile(configuration.abspath(sourcePath), "r")
+      try:
+        for zipInfo in zipInfos:
+          targetFile = os.path.join(targetDir, zipInfo.filename)
+          absTargetFile = os.path.join(absTargetDir, zipInfo.filename)
+          engine.logger.outputInfo("Extracting %s\n" % targetFile)
+          try:
+            cake.zipping.extractFile(zipFile, zipInfo, absTargetFile)
+            stat = os.stat(absTargetFile)
+          except Exception as e:
+            engine.raiseError(
+              "Failed to extract file %s from zip %s: %s\n" % (
+                zipInfo.filename,
+                sourcePath,
+                str(e),
+                ),
+              targets=[targetFile],
+              )
+          key = os.path.normcase(os.path.normpath(zipInfo.filename))
+          entries[key] = (
+            zipInfo.CRC,
+            zipInfo.file_size,
+            cake.zipping.getZipTime(zipInfo),
+            stat.st_size,
+            stat.st_mtime,
+            )
+      finally:
+        zipFile.close()
+      return entries
+
     def _extract():
       sourcePath = getPath(source)
+      absSourcePath = configuration.abspath(sourcePath)
       absTargetDir = configuration.abspath(targetDir)
-      zipFile = zipfile.ZipFile(configuration.abspath(sourcePath), "r")
+      zipFile = zipfile.ZipFile(absSourcePath, "r")
       try:
         zipInfos = zipFile.infolist()
+      finally:
+        zipFile.close()
         
-        if includeMatch is not None:
-          zipInfos = [z for z in zipInfos if includeMatch(z.filename)]
+      if includeMatch is not None:
+        zipInfos = [z for z in zipInfos if includeMatch(z.filename)]
+
+      # A single pass over the target directory finds the state of all
+      # files previously extracted.
+      searchDir = os.path.normpath(absTargetDir)
+      existing = _scanDirectory(searchDir)
+      
+      if removeStale:
+        filesInZip = set()
+        for zipInfo in zipInfos:
+          filesInZip.add(os.path.normcase(os.path.normpath(zipInfo.filename)))
         
-        if removeStale:
-          filesInZip = set()
-          for zipInfo in zipInfos:
-            filesInZip.add(os.path.normcase(os.path.normpath(zipInfo.filename)))
-          
-          searchDir = os.path.normpath(absTargetDir)
-          for path in cake.filesys.walkTree(searchDir):
-            normPath = os.path.normcase(path)
-            # Skip files that also exist in the zip.
-            if normPath in filesInZip:
+        removedDirs = []
+        for normPath in sorted(existing):
+          # Skip files that also exist in the zip.
+          if normPath in filesInZip:
+            continue
+          if engine.dependencyInfoPath is None:
+            # Skip .dep files that match a file in the zip.
+            p, e = os.path.splitext(normPath)
+            if e == ".dep" and p in filesInZip:
               continue
-            if engine.dependencyInfoPath is None:
-              # Skip .dep files that match a file in the zip.
-              p, e = os.path.splitext(normPath)
-              if e == ".dep" and p in filesInZip:
-                continue
-            
-            absPath = os.path.join(searchDir, path)
-            engine.logger.outputInfo(
-              "Deleting %s\n" % os.path.join(targetDir, path),
+          # Skip files in directories that have already been deleted.
+          if any(normPath.startswith(d) for d in removedDirs):
+            continue
+          
+          path, state = existing.pop(normPath)
+          absPath = os.path.join(searchDir, path)
+          engine.logger.outputInfo(
+            "Deleting %s\n" % os.path.join(targetDir, path),
+            )
+          if state is None:
+            cake.filesys.removeTree(absPath, self.engine.knownDirectories)
+            removedDirs.append(normPath + os.path.sep)
+          else:
+            cake.filesys.remove(absPath, self.engine.knownDirectories)
+
+      manifestPath = _getManifestPath(engine, absSourcePath, absTargetDir)
+      manifest = cake.zipping.readManifest(manifestPath)
+      newManifest = {}
+      toExtract = []
+      for zipInfo in zipInfos:
+        key = os.path.normcase(os.path.normpath(zipInfo.filename))
+        if cake.zipping.isDirectoryInfo(zipInfo):
+          # The zip info corresponds to a directory.
+          if key not in existing:
+            cake.filesys.makeDirs(
+              os.path.join(absTargetDir, zipInfo.filename),
+              self.engine.knownDirectories,
               )
-            if os.path.isdir(absPath):
-              cake.filesys.removeTree(absPath)
-            else:
-              cake.filesys.remove(absPath)
-        
-        for zipinfo in zipInfos:
-          _extractFile(configuration, zipFile, sourcePath, zipinfo, targetDir, absTargetDir, onlyNewer)   
-      finally:
-        zipFile.close()
+          continue
 
-    def _run():
-      try:
-        _extract()
-      except BuildError:
-        raise
-      except Exception as e:
-        msg = "cake: Error extracting %s to %s: %s\n" % (
-          getPath(source), targetDir, str(e))
-        engine.raiseError(msg, targets=[targetDir])
+        reasonToBuild = _getReasonToExtract(
+          engine,
+          zipInfo,
+          key,
+          manifest,
+          existing,
+          onlyNewer,
+          )
+        if reasonToBuild is None:
+          newManifest[key] = manifest[key]
+          continue
         
+        engine.logger.outputDebug(
+          "reason",
+          "Extracting '" + os.path.join(targetDir, zipInfo.filename) +
+          "' because " + reasonToBuild + ".\n",
+          )
+        toExtract.append(zipInfo)
+
+      def storeManifest(tasks):
+        for task in tasks:
+          newManifest.update(task.result)
+        if newManifest != manifest:
+          cake.zipping.writeManifest(manifestPath, newManifest)
+
+      workers = min(extractWorkers, len(toExtract))
+      if workers <= 1:
+        if toExtract:
+          newManifest.update(_extractFiles(sourcePath, toExtract))
+        storeManifest([])
+        return
+
+      # Spread the largest files evenly between the workers.
+      toExtract.sort(key=lambda z: z.file_size, reverse=True)
+      extractTasks = []
+      for i in range(workers):
+        extractTask = engine.createTask(
+          lambda z=toExtract[i::workers]: _run(_extractFiles, sourcePath, z)
+          )
+        extractTask.parent.completeAfter(extractTask)
+        extractTask.start(immediate=True)
+        extractTasks.append(extractTask)
+
+      manifestTask = engine.createTask(
+        lambda: _run(storeManifest, extractTasks)
+        )
+      manifestTask.parent.completeAfter(manifestTask)
+      manifestTask.startAfter(extractTasks, immediate=True)
+
     if self.enabled:
-      task = engine.createTask(_run)
+      task = engine.createTask(lambda: _run(_extract))
       task.lazyStartAfter(getTask(source))
     else:
       task = None
@@ -304,24 +432,41 @@ class ZipTool(Tool):
     target = basePath(target)
     source = basePath(source)
     
+    compressWindow = self.compressWindow
+    compressChunkSize = self.compressChunkSize
+
+    compactRatio = self.compactRatio
+
+    def _getFiles(originalPaths, entries):
+      sourceDir = getPath(source)
+      files = []
+      for originalPath in originalPaths:
+        sourcePath = os.path.join(sourceDir, originalPath)
+        configuration.engine.logger.outputInfo("Adding %s to %s\n" % (sourcePath, target))
+        entry = entries[os.path.normcase(originalPath)]
+        files.append((configuration.abspath(sourcePath), originalPath, entry.stat()))
+      return files
+
     def _compress():
       sourceDir = getPath(source)
       absSourceDir = configuration.abspath(sourceDir)
 
       # Build a list of files/dirs to zip
-      toZip = cake.zipping.findFilesToCompress(absSourceDir, includeMatch)
+      entries = {}
+      toZip = cake.zipping.findFilesToCompress(absSourceDir, includeMatch, entries)
 
       # Check for an existing dependency info file
       buildArgs = []
-      toAppend = None
+      toAppend = toRemove = None
       _, reasonToBuild = configuration.checkDependencyInfo(target, buildArgs)
       if reasonToBuild is None:
-        # Figure out if we need to rebuild/append
-        toAppend, reasonToBuild = _shouldCompress(
+        # Figure out if we need to rebuild/update
+        toAppend, toRemove, reasonToBuild = _shouldCompress(
           configuration,
           sourceDir,
           target,
           toZip,
+          entries,
           onlyNewer,
           removeStale,
           )
@@ -336,31 +481,39 @@ class ZipTool(Tool):
       absTargetPath = configuration.abspath(target)
       if toAppend is None:
         # Recreate zip
-        cake.filesys.makeDirs(os.path.dirname(absTargetPath))
+        cake.filesys.makeDirs(
+          os.path.dirname(absTargetPath),
+          self.engine.knownDirectories,
+          )
         f = open(absTargetPath, "wb")
         try:
-          zipFile = zipfile.ZipFile(f, "w")
-          for originalPath in toZip.values():
-            sourcePath = os.path.join(sourceDir, originalPath)
-            absSourcePath = configuration.abspath(sourcePath)
-            configuration.engine.logger.outputInfo("Adding %s to %s\n" % (sourcePath, target))
-            cake.zipping.writeFileToZip(zipFile, absSourcePath, originalPath)
-          zipFile.close()
+          zipWriter = cake.zipping.ZipWriter(f)
+          cake.zipping.writeFilesToZip(
+            zipWriter,
+            _getFiles(toZip.values(), entries),
+            window=compressWindow,
+            chunkSize=compressChunkSize,
+            )
+          zipWriter.close()
         finally:
           f.close()
       else:
-        # Append to existing zip
-        f = open(absTargetPath, "r+b")
-        try:
-          zipFile = zipfile.ZipFile(f, "a")
-          for originalPath in toAppend:
-            sourcePath = os.path.join(sourceDir, originalPath)
-            absSourcePath = configuration.abspath(sourcePath)
-            configuration.engine.logger.outputInfo("Adding %s to %s\n" % (sourcePath, target))
-            cake.zipping.writeFileToZip(zipFile, absSourcePath, originalPath)
-          zipFile.close()
-        finally:
-          f.close()
+        # Update the existing zip in place
+        for name in toRemove:
+          engine.logger.outputInfo("Removing %s from %s\n" % (name, target))
+        compacted = cake.zipping.updateZip(
+          absTargetPath,
+          _getFiles(toAppend, entries),
+          toRemove,
+          compactRatio=compactRatio,
+          window=compressWindow,
+          chunkSize=compressChunkSize,
+          )
+        if compacted:
+          engine.logger.outputDebug(
+            "reason",
+            "Compacted '" + target + "' to remove unused space.\n",
+            )
 
       # Now that the zip has been written successfully, save the new dependency file 
       newDependencyInfo = configuration.createDependencyInfo(
@@ -0,0 +1,251 @@
+"""Persistent Directory Listing Cache.
+
+@see: Cake Build System (http://sourceforge.net/projects/cake-build)
+@copyright: Copyright (c) 2010 Lewis Baker, Stuart McMahon.
+@license: Licensed under the MIT license.
+"""
+
+import fnmatch
+import os
+import os.path
+import pickle
+import re
+import threading
+import time
+
+import cake.filesys
+
+_magicCheck = re.compile(r"[*?[]")
+
+def _hasMagic(path):
+  return _magicCheck.search(path) is not None
+
+class ListingCache(object):
+  """A cache of directory listings that persists between builds.
+
+  Each listing is keyed by the absolute path of the directory and is
+  only used while the directory's modification time is unchanged. The
+  modification time of a directory changes whenever an entry is added
+  to, removed from or renamed within it, so an unchanged directory only
+  costs one stat() rather than reading its entries again.
+
+  Directories are stat()ed every time they are listed, so changes made
+  while the build is running, by cake or by the commands it runs, are
+  seen by later listings.
+  """
+
+  MAGIC = b"CKLC"
+  """The magic number at the end of the cache file.
+
+  @type: bytes
+  """
+
+  VERSION = 1
+  """The version of the cache file format.
+
+  @type: int
+  """
+
+  RACY_WINDOW = 2.0
+  """Listings of directories modified this many seconds before they
+  were read are not saved or reused.
+
+  A directory may change again without its modification time changing
+  if the file system only records times to a coarse resolution.
+  @type: float
+  """
+
+  def __init__(self, path):
+    """Load a listing cache, starting empty if it doesn't exist.
+
+    @param path: The path of the listing cache file.
+    @type path: string
+    """
+    self.path = path
+    self._lock = threading.Lock()
+    self._listings = self._load()
+    self._modified = False
+
+  def _load(self):
+    try:
+      contents = cake.filesys.readFile(self.path)
+    except EnvironmentError:
+      return {}
+
+    magicLength = len(self.MAGIC)
+    if contents[-magicLength:] != self.MAGIC:
+      return {}
+    try:
+      version, listings = pickle.loads(contents[:-magicLength])
+    except Exception:
+      return {}
+    if version != self.VERSION or not isinstance(listings, dict):
+      return {}
+    return listings
+
+  def save(self):
+    """Write the cache file if any listings have changed.
+    """
+    self._lock.acquire()
+    try:
+      if not self._modified:
+        return
+      listings = dict(
+        (path, listing)
+        for path, listing in self._listings.items()
+        if not listing[4]
+        )
+      data = pickle.dumps((self.VERSION, listings), pickle.HIGHEST_PROTOCOL)
+      tempPath = self.path + ".tmp"
+      try:
+        cake.filesys.writeFile(tempPath, data + self.MAGIC)
+        os.replace(tempPath, self.path)
+      except EnvironmentError:
+        return # The listings will be read again next time.
+      self._modified = False
+    finally:
+      self._lock.release()
+
+  def listDirectory(self, path):
+    """List the entries of a directory.
+
+    The directory is only read if it has changed since it was last
+    listed, or if it was modified shortly before it was last listed.
+
+    @param path: The absolute path of the directory.
+    @type path: string
+
+    @return: A tuple of the names of the sub-directories, the names of
+    the sub-directories that are symbolic links and the names of the
+    files in the directory.
+    @rtype: tuple of (list of string, list of string, list of string)
+
+    @raise EnvironmentError: If the directory could not be read.
+    """
+    key = os.path.normcase(os.path.normpath(path))
+    mtime = os.stat(path).st_mtime_ns
+    self._lock.acquire()
+    try:
+      listing = self._listings.get(key, None)
+    finally:
+      self._lock.release()
+
+    if listing is None or listing[0] != mtime or listing[4]:
+      dirs = []
+      linkedDirs = []
+      files = []
+      for entry in os.scandir(path):
+        try:
+          isDir = entry.is_dir()
+        except EnvironmentError:
+          isDir = False
+        if not isDir:
+          files.append(entry.name)
+        elif entry.is_symlink():
+          linkedDirs.append(entry.name)
+        else:
+          dirs.append(entry.name)
+      racy = time.time() - mtime / 1e9 < self.RACY_WINDOW
+      listing = (mtime, dirs, linkedDirs, files, racy)
+
+    self._lock.acquire()
+    try:
+      if self._listings.get(key, None) is not listing:
+        self._listings[key] = listing
+        self._modified = True
+    finally:
+      self._lock.release()
+    return listing[1:4]
+
+  def walkTree(self, path, recursive=True, includeMatch=None):
+    """Walk a directory for file and directory names.
+
+    Returns the same paths as L{cake.filesys.walkTree}, and like it lists
+    the entries of a directory before those of its sub-directories. The
+    order within a directory can differ as symbolic links to directories
+    are listed after the other sub-directories.
+
+    @param path: The path of the directory to search under.
+    @type path: string
+
+    @param recursive: Whether or not to recursively walk through
+    sub-directories.
+    @type recursive: bool
+
+    @param includeMatch: A callable used to decide whether to include
+    certain files in the result.
+    @type includeMatch: any callable
+
+    @return: A sequence of file and directory paths relative
+    to the specified directory path.
+    """
+    return self._walkTree("", path, recursive, includeMatch)
+
+  def _walkTree(self, relDir, absDir, recursive, includeMatch):
+    try:
+      dirs, linkedDirs, files = self.listDirectory(absDir)
+    except EnvironmentError:
+      if not recursive:
+        raise # Like os.listdir()
+      return # Like os.walk()
+
+    subDirs = []
+    for name in dirs:
+      path = os.path.join(relDir, name)
+      if includeMatch is None or includeMatch(path):
+        subDirs.append((path, name))
+        yield path
+    for name in linkedDirs + files:
+      path = os.path.join(relDir, name)
+      if includeMatch is None or includeMatch(path):
+        yield path
+
+    if recursive:
+      # Don't recurse through symbolic links to directories.
+      for path, name in subDirs:
+        subDir = os.path.join(absDir, name)
+        for subPath in self._walkTree(path, subDir, True, includeMatch):
+          yield subPath
+
+  def glob(self, pathname):
+    """Find the paths matching a glob-style pattern.
+
+    Behaves like glob.glob() except that directories are listed through
+    the cache.
+
+    @param pathname: An absolute glob-style path pattern. eg. '/src/*.c'
+    @type pathname: string
+
+    @return: A list of the paths that match the pattern.
+    @rtype: list of string
+    """
+    if not _hasMagic(pathname):
+      if os.path.lexists(pathname):
+        return [pathname]
+      return []
+
+    dirName, baseName = os.path.split(pathname)
+    if dirName != pathname and _hasMagic(dirName):
+      dirs = self.glob(dirName)
+    else:
+      dirs = [dirName]
+
+    results = []
+    for d in dirs:
+      if not _hasMagic(baseName):
+        path = os.path.join(d, baseName)
+        if (not baseName and os.path.isdir(d)) or os.path.lexists(path):
+          results.append(path)
+        continue
+
+      try:
+        dirNames, linkedDirs, files = self.listDirectory(d or os.curdir)
+      except EnvironmentError:
+        continue
+      names = dirNames + linkedDirs + files
+      if not baseName.startswith("."):
+        # Like glob.glob(), hidden files must be matched explicitly.
+        names = [n for n in names if not n.startswith(".")]
+      for name in fnmatch.filter(names, baseName):
+        results.append(os.path.join(d, name))
+    return results
@@ -5,9 +5,13 @@
 @license: Licensed under the MIT license.
 """
 
+import atexit
+import queue
 import sys
 import threading
 
+import cake.task
+
 class Logger(object):
   """A class used to log tool output.
   
@@ -57,12 +61,7 @@ class Logger(object):
     @type message: string
     """
     if not self.quiet:
-      self._lock.acquire()
-      try:
-        sys.stderr.write(message)
-        sys.stderr.flush()
-      finally:
-        self._lock.release()
+      self._write(sys.stderr, message)
 
   def outputWarning(self, message):
     """Output a warning message.
@@ -79,12 +78,7 @@ class Logger(object):
     @type message: string
     """
     if not self.quiet:
-      self._lock.acquire()
-      try:
-        sys.stdout.write(message)
-        sys.stdout.flush()
-      finally:
-        self._lock.release()
+      self._write(sys.stdout, message)
       
   def outputDebug(self, keyword, message):
     """Output a debug message.
@@ -99,3 +93,167 @@ class Logger(object):
     """
     if keyword in self._debugComponents:
       self.outputInfo(message)
+
+  def flush(self):
+    """Wait for all messages output so far to be written.
+    """
+    pass
+
+  def close(self):
+    """Write any remaining messages and stop logging asynchronously.
+    """
+    pass
+
+  def _write(self, stream, message):
+    self._lock.acquire()
+    try:
+      stream.write(message)
+      stream.flush()
+    finally:
+      self._lock.release()
+
+class AsyncLogger(Logger):
+  """A logger that writes messages on a background thread.
+  
+  Callers queue their messages and return without waiting for them to
+  be written. A single writer thread writes all of the messages that
+  are queued at once and flushes each stream once per batch.
+  
+  If groupByTask is True the messages output while a task is running are
+  held back and written as one block when the task completes, so that
+  the output of tasks running in parallel doesn't interleave.
+  
+  Remaining messages are written when the logger is closed, which
+  happens at the latest when the process exits.
+  """
+
+  MAX_BATCH = 1000
+  """The maximum number of messages or groups written at once.
+
+  @type: int
+  """
+
+  def __init__(self, groupByTask=False):
+    """Construct the logger and start its writer thread.
+
+    @param groupByTask: Whether to group the messages of each task.
+    @type groupByTask: bool
+    """
+    Logger.__init__(self)
+    self.groupByTask = groupByTask
+    self._queue = queue.Queue()
+    self._groups = {}
+    self._groupsLock = threading.Lock()
+    self._closed = False
+    self._thread = threading.Thread(target=self._writeMessages)
+    self._thread.daemon = True
+    self._thread.start()
+    atexit.register(self.close)
+
+  def flush(self):
+    """Wait for all messages output so far to be written.
+
+    The messages of tasks that haven't completed yet are written too.
+    """
+    self._groupsLock.acquire()
+    try:
+      groups = list(self._groups.values())
+      self._groups.clear()
+    finally:
+      self._groupsLock.release()
+    if self._closed:
+      return
+    for group in groups:
+      self._queue.put(group)
+    self._queue.join()
+
+  def close(self):
+    """Write any remaining messages and stop the writer thread.
+
+    Messages output after the logger is closed are written immediately.
+    """
+    if self._closed:
+      return
+    self.flush()
+    self._closed = True
+    self._queue.put(None)
+    self._thread.join()
+
+    # Write any messages queued while the writer thread was stopping.
+    try:
+      while True:
+        item = self._queue.get_nowait()
+        for stream, message in item or []:
+          Logger._write(self, stream, message)
+    except queue.Empty:
+      pass
+
+  def _write(self, stream, message):
+    if self._closed:
+      return Logger._write(self, stream, message)
+
+    if self.groupByTask:
+      task = cake.task.Task.getCurrent()
+      if task is not None:
+        self._groupsLock.acquire()
+        try:
+          group = self._groups.get(task, None)
+          isNewGroup = group is None
+          if isNewGroup:
+            group = self._groups[task] = []
+          group.append((stream, message))
+        finally:
+          self._groupsLock.release()
+        if isNewGroup:
+          task.addCallback(lambda: self._endGroup(task))
+        return
+
+    self._queue.put([(stream, message)])
+
+  def _endGroup(self, task):
+    self._groupsLock.acquire()
+    try:
+      group = self._groups.pop(task, None)
+    finally:
+      self._groupsLock.release()
+    if group:
+      self._queue.put(group)
+
+  def _writeMessages(self):
+    get = self._queue.get
+    getNoWait = self._queue.get_nowait
+    while True:
+      items = [get()]
+      try:
+        while len(items) < self.MAX_BATCH:
+          items.append(getNoWait())
+      except queue.Empty:
+        pass
+
+      stop = False
+      streams = []
+      self._lock.acquire()
+      try:
+        for item in items:
+          if item is None:
+            stop = True
+            continue
+          for stream, message in item:
+            try:
+              stream.write(message)
+            except Exception:
+              continue # Don't let a broken stream stop the writer.
+            if stream not in streams:
+              streams.append(stream)
+        for stream in streams:
+          try:
+            stream.flush()
+          except Exception:
+            pass
+      finally:
+        self._lock.release()
+        for _ in items:
+          self._queue.task_done()
+
+      if stop:
+        return
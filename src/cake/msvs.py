@@ -11,6 +11,7 @@ import _winreg as winreg
 import codecs
 
 import cake.path
+import cake.probe
 import cake.system
 from cake.registry import queryString, KEY_WOW64_32KEY
   
@@ -233,6 +234,26 @@ def vswhere(args=[]):
   if not os.path.isfile(vsWherePath):
     raise EnvironmentError("vswhere not found at " + vsWherePath)
 
+  # The results only change when vswhere or the installed instances change.
+  dependencies = [vsWherePath]
+  programData = os.environ.get('ProgramData', r'C:\ProgramData')
+  instancesDir = cake.path.join(
+    programData, 'Microsoft', 'VisualStudio', 'Packages', '_Instances'
+    )
+  if os.path.isdir(instancesDir):
+    dependencies.append(instancesDir)
+    for name in sorted(os.listdir(instancesDir)):
+      statePath = cake.path.join(instancesDir, name, 'state.json')
+      if os.path.isfile(statePath):
+        dependencies.append(statePath)
+
+  return cake.probe.cachedProbe(
+    'vswhere ' + ' '.join(args),
+    dependencies,
+    lambda: _runVswhere(vsWherePath, vsInstaller, args),
+    )
+
+def _runVswhere(vsWherePath, vsInstaller, args):
   p = subprocess.Popen(
     args=["vswhere", "-format", "json", "-utf8"] + args,
     executable=vsWherePath,
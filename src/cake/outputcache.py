@@ -0,0 +1,120 @@
+"""Content-Addressed Output Cache.
+
+Stores the targets of commands in the same cache directory layout as the
+object cache so the outputs of commands that have been run before, in
+this workspace or another, can be restored rather than run again.
+
+@see: Cake Build System (http://sourceforge.net/projects/cake-build)
+@copyright: Copyright (c) 2010 Lewis Baker, Stuart McMahon.
+@license: Licensed under the MIT license.
+"""
+
+import os.path
+import struct
+
+import cake.filesys
+import cake.hash
+import cake.path
+import cake.zipping
+
+_VERSION = 1
+
+def _getCacheFilePath(cachePath, digest):
+  digestStr = cake.hash.hexlify(digest)
+  return cake.path.join(cachePath, digestStr[0], digestStr[1], digestStr)
+
+def _getTargetDigest(key, index):
+  return cake.hash.sha1(key + struct.pack("<I", index)).digest()
+
+def calculateKey(engine, kind, args, sources, targetCount):
+  """Calculate the key that the outputs of a command are cached under.
+
+  @param engine: The engine used to get the digests of the sources.
+  @type engine: L{cake.engine.Engine}
+
+  @param kind: The kind of command, eg. 'shell', so that different kinds
+  of command with the same arguments don't share outputs.
+  @type kind: string
+
+  @param args: The arguments of the command. Their repr() must identify
+  the command and everything it does apart from reading the sources.
+  @type args: any
+
+  @param sources: The absolute paths of the sources the command reads.
+  @type sources: list of string
+
+  @param targetCount: The number of targets the command writes.
+  @type targetCount: int
+
+  @return: The digest of the arguments and the contents of the sources.
+  @rtype: string of 20 bytes
+
+  @raise EnvironmentError: If one of the sources could not be read.
+  """
+  hasher = cake.hash.sha1()
+  header = "%s %i %i %r\n" % (kind, _VERSION, targetCount, args)
+  hasher.update(header.encode("utf8"))
+  for source in sources:
+    hasher.update(
+      os.path.normcase(os.path.basename(source)).encode("utf8") + b"\0"
+      )
+    hasher.update(engine.getFileDigest(source))
+  return hasher.digest()
+
+def restoreTargets(engine, cachePath, key, targets):
+  """Restore the targets of a command from the cache.
+
+  @param engine: The engine to notify of the targets that were restored.
+  @type engine: L{cake.engine.Engine}
+
+  @param cachePath: The absolute path of the cache directory.
+  @type cachePath: string
+
+  @param key: The key returned by L{calculateKey}.
+  @type key: string of 20 bytes
+
+  @param targets: The absolute paths of the targets.
+  @type targets: list of string
+
+  @return: True if all of the targets were restored, False if any of
+  them aren't in the cache.
+  @rtype: bool
+  """
+  cacheFiles = [
+    _getCacheFilePath(cachePath, _getTargetDigest(key, i))
+    for i in range(len(targets))
+    ]
+  if not all(cake.filesys.isFile(p) for p in cacheFiles):
+    return False
+
+  for cacheFile, target in zip(cacheFiles, targets):
+    try:
+      cake.zipping.decompressFile(cacheFile, target)
+    except EnvironmentError:
+      return False # Invalid cache file
+    finally:
+      engine.notifyFileChanged(target)
+  return True
+
+def storeTargets(cachePath, key, targets):
+  """Store the targets of a command in the cache.
+
+  Failing to store the targets is not an error as the build doesn't
+  depend on the cache.
+
+  @param cachePath: The absolute path of the cache directory.
+  @type cachePath: string
+
+  @param key: The key returned by L{calculateKey}.
+  @type key: string of 20 bytes
+
+  @param targets: The absolute paths of the targets.
+  @type targets: list of string
+  """
+  try:
+    for i, target in enumerate(targets):
+      cacheFile = _getCacheFilePath(cachePath, _getTargetDigest(key, i))
+      if not cake.filesys.isFile(cacheFile):
+        cake.zipping.compressFile(target, cacheFile)
+  except EnvironmentError:
+    pass
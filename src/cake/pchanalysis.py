@@ -0,0 +1,156 @@
+"""Utilities for choosing the contents of precompiled headers.
+
+@see: Cake Build System (http://sourceforge.net/projects/cake-build)
+@copyright: Copyright (c) 2010 Lewis Baker, Stuart McMahon.
+@license: Licensed under the MIT license.
+"""
+
+import os
+import os.path
+
+class HeaderCandidate(object):
+  """A header included directly by the sources of several objects.
+
+  @ivar path: The absolute path of the header.
+  @type path: string
+  @ivar name: The name of the header as it appears in the #include
+  directive of the first source that included it.
+  @type name: string
+  @ivar angled: True if the header was included with #include <name>.
+  @type angled: bool
+  @ivar objectCount: The number of objects whose source includes the
+  header directly.
+  @type objectCount: int
+  @ivar cost: The total number of bytes of the header and the headers it
+  includes that were parsed by those objects.
+  @type cost: int
+  """
+
+  def __init__(self, path, name, angled, index):
+    self.path = path
+    self.name = name
+    self.angled = angled
+    self.objectCount = 0
+    self.cost = 0
+    self._index = index
+
+  def getIncludeDirective(self):
+    """Get the #include directive that includes this header from a
+    precompiled header.
+
+    @rtype: string
+    """
+    if self.angled:
+      return "#include <%s>" % self.name
+    else:
+      return '#include "%s"' % self.path.replace('\\', '/')
+
+def _findHeader(name, headersByName):
+  name = os.path.normcase(os.path.normpath(name))
+  for header in headersByName.get(os.path.basename(name), ()):
+    normHeader = os.path.normcase(header)
+    if normHeader == name or normHeader.endswith(os.path.sep + name):
+      return header
+  return None
+
+def rankHeaders(objects, getIncludes, getSize):
+  """Rank the headers included directly by sources by how much parsing a
+  precompiled header containing them would save.
+
+  Each #include directive of a source is matched against the headers it
+  was found to depend on when it was last compiled, so system headers
+  are found without knowing the compiler's include paths.
+
+  @param objects: A list of (source, headers) tuples, one for each object,
+  where headers is the list of absolute paths of the headers the source
+  depended on when it was last compiled.
+  @type objects: list of (string, list of string)
+
+  @param getIncludes: A function that returns the list of (name, angled)
+  #include directives of a file, eg. L{IncludeScanner.getIncludes}.
+  @type getIncludes: any callable
+
+  @param getSize: A function that returns the size of a file in bytes.
+  @type getSize: any callable
+
+  @return: The headers sorted from the most to the least total cost.
+  @rtype: list of L{HeaderCandidate}
+  """
+  candidates = {}
+  sizes = {}
+
+  def includes(path):
+    try:
+      return getIncludes(path)
+    except EnvironmentError:
+      return []
+
+  def size(path):
+    result = sizes.get(path, None)
+    if result is None:
+      try:
+        result = getSize(path)
+      except EnvironmentError:
+        result = 0
+      sizes[path] = result
+    return result
+
+  for source, headers in objects:
+    headersByName = {}
+    for header in headers:
+      key = os.path.normcase(os.path.basename(header))
+      headersByName.setdefault(key, []).append(header)
+
+    seen = set()
+    for name, angled in includes(source):
+      path = _findHeader(name, headersByName)
+      if path is None or path in seen:
+        continue
+      seen.add(path)
+
+      # Find the headers this header includes, directly or indirectly.
+      closure = set([path])
+      pending = [path]
+      while pending:
+        for includeName, _ in includes(pending.pop()):
+          included = _findHeader(includeName, headersByName)
+          if included is not None and included not in closure:
+            closure.add(included)
+            pending.append(included)
+
+      candidate = candidates.get(path, None)
+      if candidate is None:
+        candidate = candidates[path] = HeaderCandidate(
+          path, name, angled, len(candidates))
+      candidate.objectCount += 1
+      candidate.cost += sum(size(p) for p in closure)
+
+  return sorted(
+    candidates.values(),
+    key=lambda c: (-c.cost, c._index),
+    )
+
+def selectHeaders(candidates, objectCount, minFraction):
+  """Select the headers to put in a precompiled header.
+
+  @param candidates: The candidates returned by L{rankHeaders}.
+  @type candidates: list of L{HeaderCandidate}
+
+  @param objectCount: The number of objects that were analysed.
+  @type objectCount: int
+
+  @param minFraction: The fraction of objects that must include a header
+  for it to be selected.
+  @type minFraction: float
+
+  @return: A tuple of the selected headers, in the order they were first
+  included, and the estimated number of bytes of parsing saved.
+  @rtype: tuple of (list of L{HeaderCandidate}, int)
+  """
+  minCount = max(2, minFraction * objectCount)
+  selected = [c for c in candidates if c.objectCount >= minCount]
+  selected.sort(key=lambda c: c._index)
+
+  # Each header is still parsed once when building the precompiled header.
+  saving = sum(c.cost - c.cost // c.objectCount for c in selected)
+  return selected, saving
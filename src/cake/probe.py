@@ -0,0 +1,215 @@
+"""Persistent Cache of Tool Probe Results.
+
+Finding a compiler usually involves running it to find out its version.
+This module caches the results of such probes between runs of Cake so
+that a probe is only run again when the files it depends on change.
+
+@see: Cake Build System (http://sourceforge.net/projects/cake-build)
+@copyright: Copyright (c) 2010 Lewis Baker, Stuart McMahon.
+@license: Licensed under the MIT license.
+"""
+
+import os
+import os.path
+import threading
+try:
+  import cPickle as pickle
+except ImportError:
+  import pickle
+
+import cake.filesys
+
+class ProbeCache(object):
+  """A cache of probe results stored in a file.
+
+  Each result is stored with the size and modification time of the
+  files it was derived from and is discarded if any of them change.
+  """
+
+  MAGIC = "CKPB".encode('latin-1') # We need bytes for Python 3.x
+  """A magic value written to the end of the cache file.
+
+  @type: bytes
+  """
+
+  VERSION = 1
+  """The version of the cache file format.
+
+  @type: int
+  """
+
+  def __init__(self, path):
+    """Construct a probe cache.
+
+    @param path: The path of the file to store results in.
+    @type path: string
+    """
+    self.path = path
+    self._lock = threading.Lock()
+    self._entries = None
+
+  def _load(self):
+    try:
+      contents = cake.filesys.readFile(self.path)
+    except EnvironmentError:
+      return {}
+
+    magicLength = len(self.MAGIC)
+    if contents[-magicLength:] != self.MAGIC:
+      return {}
+    try:
+      version, entries = pickle.loads(contents[:-magicLength])
+    except Exception:
+      return {}
+    if version != self.VERSION or not isinstance(entries, dict):
+      return {}
+    return entries
+
+  def _save(self):
+    # Merge with results stored by other processes since we loaded.
+    entries = self._load()
+    entries.update(self._entries)
+    self._entries = entries
+
+    data = pickle.dumps((self.VERSION, entries), pickle.HIGHEST_PROTOCOL)
+    tempPath = "%s.%i.tmp" % (self.path, os.getpid())
+    try:
+      cake.filesys.writeFile(tempPath, data + self.MAGIC)
+      os.replace(tempPath, self.path)
+    except EnvironmentError:
+      # Not being able to store results only makes the next run slower.
+      try:
+        os.remove(tempPath)
+      except EnvironmentError:
+        pass
+
+  def probe(self, name, paths, probe):
+    """Get the result of a probe, running it only if needed.
+
+    @param name: A name that identifies the probe, eg. 'gcc-version'.
+    @type name: string
+
+    @param paths: The paths of the files or directories the result
+    depends on, eg. the path of the executable being probed. If any of
+    them change the probe is run again.
+    @type paths: list of string
+
+    @param probe: A function that takes no arguments and returns the
+    result. The result must be picklable. If it raises an exception the
+    exception is propagated and nothing is cached.
+    @type probe: any callable
+
+    @return: The result of the probe.
+    """
+    key = (name, tuple(paths))
+    try:
+      stamps = []
+      for path in paths:
+        s = os.stat(path)
+        stamps.append((s.st_size, s.st_mtime_ns))
+      stamps = tuple(stamps)
+    except EnvironmentError:
+      # Let the probe report missing files.
+      return probe()
+
+    self._lock.acquire()
+    try:
+      if self._entries is None:
+        self._entries = self._load()
+      entry = self._entries.get(key, None)
+    finally:
+      self._lock.release()
+
+    if entry is not None and entry[0] == stamps:
+      return entry[1]
+
+    result = probe()
+
+    self._lock.acquire()
+    try:
+      self._entries[key] = (stamps, result)
+      self._save()
+    finally:
+      self._lock.release()
+
+    return result
+
+_defaultCache = None
+_defaultCachePath = None
+_defaultCacheLock = threading.Lock()
+
+def getDefaultProbeCachePath():
+  """Get the path of the probe cache used by L{cachedProbe}.
+
+  This is the path set by L{setDefaultProbeCachePath}, otherwise the
+  value of the CAKE_PROBE_CACHE environment variable. If neither is set,
+  or the environment variable is set to an empty string, probe results
+  are not cached.
+
+  @rtype: string or None
+  """
+  if _defaultCachePath is not None:
+    return _defaultCachePath
+  return os.environ.get('CAKE_PROBE_CACHE', None) or None
+
+def setDefaultProbeCachePath(path):
+  """Set the path of the probe cache used by L{cachedProbe}.
+
+  The path is a process-wide setting rather than one of each engine,
+  since tools are probed by functions that have no engine, eg. when
+  looking for installed compilers. It is usually a file in the build's
+  cache directory, set by a config script before it looks for any
+  tools. See L{getUserProbeCachePath} to share results between builds.
+
+  @param path: The path of the cache file, or None to use the
+  CAKE_PROBE_CACHE environment variable.
+  @type path: string or None
+  """
+  global _defaultCache, _defaultCachePath
+
+  _defaultCacheLock.acquire()
+  try:
+    _defaultCachePath = path
+    _defaultCache = None
+  finally:
+    _defaultCacheLock.release()
+
+def getUserProbeCachePath():
+  """Get the path of a probe cache in the user's cache directory.
+
+  The results of probes are shared by every build run by the user if
+  this is passed to L{setDefaultProbeCachePath}.
+
+  @return: The path, or None if the user has no cache directory.
+  @rtype: string or None
+  """
+  if os.name == 'nt':
+    cacheDir = os.environ.get('LOCALAPPDATA', None)
+  else:
+    cacheDir = os.environ.get('XDG_CACHE_HOME', None)
+    if not cacheDir:
+      cacheDir = os.path.join(os.path.expanduser('~'), '.cache')
+  if not cacheDir:
+    return None
+  return os.path.join(cacheDir, 'cake', 'probes.cache')
+
+def cachedProbe(name, paths, probe):
+  """Get the result of a probe using the default probe cache.
+
+  @see: L{ProbeCache.probe}
+  """
+  global _defaultCache
+
+  _defaultCacheLock.acquire()
+  try:
+    if _defaultCache is None:
+      path = getDefaultProbeCachePath()
+      if path is not None:
+        _defaultCache = ProbeCache(path)
+    cache = _defaultCache
+  finally:
+    _defaultCacheLock.release()
+
+  if cache is None:
+    return probe()
+  return cache.probe(name, paths, probe)
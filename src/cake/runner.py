@@ -17,12 +17,14 @@ import platform
 import cake.engine
 import cake.logging
 import cake.path
+import cake.pchanalysis
 import cake.script
 import cake.task
 import cake.threadpool
 import cake.version
 
 from cake.async_util import flatten
+from cake.library.compilers import LibraryTarget
 
 from optparse import Option, OptionParser
 
@@ -31,7 +33,7 @@ class DebugKeywords:
     self.keywords = []
 
   def append(self, arg_value):
-    self.keywords.extend(value.split(sep=","))
+    self.keywords.extend(arg_value.split(sep=","))
 
 def run(args=None, cwd=None):
   """Run a cake build with the specified command-line args.
@@ -131,6 +133,13 @@ def run(args=None, cwd=None):
     help="Halt the build after a certain number of errors.",
     default=100,
     )
+  parser.add_option(
+    "--group-output",
+    dest="groupOutput",
+    action="store_true",
+    help="Output the messages of each task together when it completes.",
+    default=False,
+    )
   parser.add_option(
     "-l", "--list-targets",
     dest="listTargetsMode",
@@ -138,6 +147,14 @@ def run(args=None, cwd=None):
     help="List named targets in specified build scripts.",
     default=False,
   )
+  parser.add_option(
+    "--suggest-pch",
+    dest="suggestPchMode",
+    action="store_true",
+    help="Suggest precompiled headers for the libraries in specified "
+         "build scripts using the dependencies of their last build.",
+    default=False,
+  )
   
   # Find and remove script filenames from the arguments.
   scriptTargets = []
@@ -174,7 +191,7 @@ def run(args=None, cwd=None):
   if not scriptTargets:
     scriptTargets.append((cwd, None))
 
-  logger = cake.logging.Logger()
+  logger = cake.logging.AsyncLogger()
   engine = cake.engine.Engine(logger, parser, args)
 
   # Try to find an args.cake command line option.
@@ -240,10 +257,14 @@ def run(args=None, cwd=None):
   for c in options.debugComponents.keywords:
     logger.enableDebug(c)
   logger.quiet = options.quiet
+  logger.groupByTask = options.groupOutput
   
   engine.options = options
   engine.forceBuild = options.forceBuild
   engine.maximumErrorCount = options.maximumErrorCount
+
+  # Directories may have been deleted since the engine last built.
+  engine.knownDirectories.clear()
     
   threadPool = cake.threadpool.ThreadPool(options.jobs)
   cake.task.setThreadPool(threadPool)
@@ -282,6 +303,42 @@ def run(args=None, cwd=None):
 
     logger.outputInfo(message)
 
+  def suggestPch(scripts):
+    libraries = []
+    for script in scripts:
+      for target in flatten(script.getTarget("libs").targets):
+        if isinstance(target, LibraryTarget) and target not in libraries:
+          libraries.append(target)
+
+    message = ""
+    for library in libraries:
+      compiler = library.compiler
+      candidates, objectCount = compiler.suggestPchHeaders(library.objects)
+      headers, saving = cake.pchanalysis.selectHeaders(
+        candidates,
+        objectCount,
+        compiler.pchMinFraction,
+        )
+
+      message += "Precompiled header candidates for %s (%i of %i objects built)\n" % (
+        library.path, objectCount, len(library.objects))
+      if not candidates:
+        message += "  <no dependencies recorded, build the library first>\n"
+        continue
+      message += "  %12s %8s  %s\n" % ("cost (bytes)", "objects", "header")
+      for candidate in candidates[:20]:
+        message += "  %12i %8i  %s\n" % (
+          candidate.cost, candidate.objectCount, candidate.path)
+      if headers:
+        message += "Suggested precompiled header (saves parsing about %i bytes):\n" % saving
+        message += "".join("  " + h.getIncludeDirective() + "\n" for h in headers)
+      else:
+        message += "  <no headers are included by enough objects>\n"
+
+    if not libraries:
+      message += "No libraries found.\n"
+    logger.outputInfo(message)
+
   for scriptPath, targetNames in scriptTargets:
     scriptPath = cake.path.fileSystemPath(scriptPath)
     try:
@@ -299,6 +356,11 @@ def run(args=None, cwd=None):
         task = engine.createTask(lambda s=scripts: listTargets(scripts))
         task.startAfter(scriptTasks)
         tasks.append(task)
+      elif options.suggestPchMode:
+        scriptTasks = [s.task for s in scripts]
+        task = engine.createTask(lambda s=scripts: suggestPch(s))
+        task.startAfter(scriptTasks)
+        tasks.append(task)
       else:
         if targetNames:
           for script in scripts:
@@ -361,6 +423,16 @@ def run(args=None, cwd=None):
     "Build took %s.\n" % _formatTimeDelta(endTime - startTime)
     )
   
+  skippedChecks, knownDirs = engine.knownDirectories.getStats()
+  engine.logger.outputDebug(
+    "time",
+    "time: makeDirs skipped %i directory checks for %i known directories\n" % (
+      skippedChecks,
+      knownDirs,
+      ),
+    )
+  
+  logger.close()
   return engine.errorCount
 
 def _formatTimeDelta(t):
@@ -8,6 +8,17 @@ _modules = [
   "cake.test.path",
   "cake.test.threadpool",
   "cake.test.asyncresult",
+  "cake.test.includes",
+  "cake.test.gnu",
+  "cake.test.depslog",
+  "cake.test.probe",
+  "cake.test.pchanalysis",
+  "cake.test.memoise",
+  "cake.test.filesys",
+  "cake.test.listingcache",
+  "cake.test.logging",
+  "cake.test.compilers",
+  "cake.test.zipping",
   ]
 
 def suite():
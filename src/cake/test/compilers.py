@@ -0,0 +1,92 @@
+"""Compiler Unit Tests.
+"""
+
+import unittest
+import sys
+
+from cake.library.compilers import Compiler, _splitBatchOutput
+
+class _Engine(object):
+
+  def getFileDigest(self, path):
+    return b"digest"
+
+class _Configuration(object):
+  baseDir = "/base"
+
+  def abspath(self, path):
+    return "/base/" + path
+
+class _Compiler(object):
+  configuration = _Configuration()
+  engine = _Engine()
+
+def _getCompileKey(target, args):
+  return Compiler._getCompileKey(_Compiler(), target, "main.c", args)
+
+class CompileKeyTests(unittest.TestCase):
+
+  def testTargetIsReplaced(self):
+    self.assertEqual(
+      _getCompileKey("release/main.o", ["cc", "-c", "-o", "release/main.o"]),
+      _getCompileKey("profile/main.o", ["cc", "-c", "-o", "profile/main.o"]),
+      )
+    self.assertEqual(
+      _getCompileKey("release/main.obj", ["cl", "/Forelease/main.obj"]),
+      _getCompileKey("profile/main.obj", ["cl", "/Foprofile/main.obj"]),
+      )
+
+  def testArgsContainingTargetAreNotReplaced(self):
+    # Paths that only contain the target path still make compiles differ.
+    self.assertNotEqual(
+      _getCompileKey("a/main.o", ["cc", "-o", "a/main.o", "-MF", "a/main.o.d"]),
+      _getCompileKey("b/main.o", ["cc", "-o", "b/main.o", "-MF", "b/main.o.d"]),
+      )
+    self.assertNotEqual(
+      _getCompileKey("a/main.o", ["cc", "-o", "a/main.o", "-Ia/main.o.inc"]),
+      _getCompileKey("b/main.o", ["cc", "-o", "b/main.o", "-Ib/main.o.inc"]),
+      )
+
+class SplitBatchOutputTests(unittest.TestCase):
+
+  def testSplitGccOutput(self):
+    text = (
+      "a.c: In function 'A':\n"
+      "a.c:3:11: warning: division by zero\n"
+      "In file included from inc/inner.h:1,\n"
+      "                 from b.c:1:\n"
+      "inc/common.h:2:1: error: unknown type name 'x'\n"
+      "b.c:3:3: error: expected ';'\n"
+      )
+    self.assertEqual(_splitBatchOutput(text, ["a.c", "b.c", "c.c"]), [
+      "a.c: In function 'A':\n"
+      "a.c:3:11: warning: division by zero\n",
+      "In file included from inc/inner.h:1,\n"
+      "                 from b.c:1:\n"
+      "inc/common.h:2:1: error: unknown type name 'x'\n"
+      "b.c:3:3: error: expected ';'\n",
+      "",
+      ])
+
+  def testSplitClangOutput(self):
+    text = (
+      "In file included from b.c:1:\n"
+      "In file included from ./common.h:2:\n"
+      "./inner.h:1:1: error: unknown type name 'x'\n"
+      "c.c:2:3: warning: unused variable 'y'\n"
+      )
+    self.assertEqual(_splitBatchOutput(text, ["a.c", "b.c", "c.c"]), [
+      "",
+      "In file included from b.c:1:\n"
+      "In file included from ./common.h:2:\n"
+      "./inner.h:1:1: error: unknown type name 'x'\n",
+      "c.c:2:3: warning: unused variable 'y'\n",
+      ])
+
+if __name__ == "__main__":
+  suite = unittest.TestSuite([
+    unittest.TestLoader().loadTestsFromTestCase(CompileKeyTests),
+    unittest.TestLoader().loadTestsFromTestCase(SplitBatchOutputTests),
+    ])
+  runner = unittest.TextTestRunner(verbosity=2)
+  sys.exit(not runner.run(suite).wasSuccessful())
@@ -0,0 +1,95 @@
+"""Dependency Log Unit Tests.
+"""
+
+import unittest
+import sys
+import tempfile
+import shutil
+import os
+import os.path
+
+from cake.depslog import DepsLog
+
+class DepsLogTests(unittest.TestCase):
+
+  def setUp(self):
+    self.root = tempfile.mkdtemp(prefix="CakeDepsLogTest")
+    self.path = os.path.join(self.root, "deps.log")
+
+  def tearDown(self):
+    shutil.rmtree(self.root)
+
+  def testRecordAndReload(self):
+    log = DepsLog(self.path)
+    self.assertEqual(log.getDependencies("a.o"), None)
+    log.recordDependencies("a.o", ["a.c", "common.h"])
+    log.recordDependencies("b.o", ["b.c", "common.h"])
+    log.recordDependencies("a.o", ["a.c"])
+    self.assertEqual(log.getDependencies("a.o"), ["a.c"])
+    log.close()
+
+    log = DepsLog(self.path)
+    self.assertEqual(log.getDependencies("a.o"), ["a.c"])
+    self.assertEqual(log.getDependencies("b.o"), ["b.c", "common.h"])
+    self.assertEqual(log.getDependencies("c.o"), None)
+    log.close()
+
+  def testTruncatedRecordIsDiscarded(self):
+    log = DepsLog(self.path)
+    log.recordDependencies("a.o", ["a.c"])
+    log.recordDependencies("b.o", ["b.c"])
+    log.close()
+
+    size = os.path.getsize(self.path)
+    f = open(self.path, "r+b")
+    try:
+      f.truncate(size - 2)
+    finally:
+      f.close()
+
+    log = DepsLog(self.path)
+    self.assertEqual(log.getDependencies("a.o"), ["a.c"])
+    self.assertEqual(log.getDependencies("b.o"), None)
+    log.recordDependencies("b.o", ["b2.c"])
+    log.close()
+
+    log = DepsLog(self.path)
+    self.assertEqual(log.getDependencies("b.o"), ["b2.c"])
+    log.close()
+
+  def testInvalidFileIsReplaced(self):
+    f = open(self.path, "wb")
+    try:
+      f.write(b"garbage")
+    finally:
+      f.close()
+
+    log = DepsLog(self.path)
+    self.assertEqual(log.getDependencies("a.o"), None)
+    log.recordDependencies("a.o", ["a.c"])
+    log.close()
+
+    log = DepsLog(self.path)
+    self.assertEqual(log.getDependencies("a.o"), ["a.c"])
+    log.close()
+
+  def testCompaction(self):
+    log = DepsLog(self.path)
+    for i in range(20):
+      log.recordDependencies("a.o", ["a.c", "v%i.h" % i])
+    log.close()
+    uncompactedSize = os.path.getsize(self.path)
+
+    log = DepsLog(self.path)
+    self.assertEqual(log.getDependencies("a.o"), ["a.c", "v19.h"])
+    log.close()
+    self.assertTrue(os.path.getsize(self.path) < uncompactedSize)
+
+    log = DepsLog(self.path)
+    self.assertEqual(log.getDependencies("a.o"), ["a.c", "v19.h"])
+    log.close()
+
+if __name__ == "__main__":
+  suite = unittest.TestLoader().loadTestsFromTestCase(DepsLogTests)
+  runner = unittest.TextTestRunner(verbosity=2)
+  sys.exit(not runner.run(suite).wasSuccessful())
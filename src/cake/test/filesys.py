@@ -0,0 +1,181 @@
+"""File System Unit Tests.
+"""
+
+import unittest
+import sys
+import tempfile
+import shutil
+import threading
+import os
+import os.path
+
+import cake.filesys
+
+class WalkTreeTests(unittest.TestCase):
+
+  def setUp(self):
+    self.root = tempfile.mkdtemp(prefix="CakeFilesysTest")
+    os.makedirs(os.path.join(self.root, "a", "b"))
+    for path in ["x.txt", os.path.join("a", "y.txt"), os.path.join("a", "b", "z.c")]:
+      f = open(os.path.join(self.root, path), "w")
+      try:
+        f.write(path)
+      finally:
+        f.close()
+
+  def tearDown(self):
+    shutil.rmtree(self.root)
+
+  def testWalkTree(self):
+    paths = list(cake.filesys.walkTree(self.root))
+    self.assertEqual(sorted(paths), sorted([
+      "a",
+      "x.txt",
+      os.path.join("a", "b"),
+      os.path.join("a", "y.txt"),
+      os.path.join("a", "b", "z.c"),
+      ]))
+    # Parent directories come before their contents.
+    self.assertTrue(paths.index("a") < paths.index(os.path.join("a", "b")))
+
+  def testWalkTreeNotRecursive(self):
+    paths = cake.filesys.walkTree(self.root, recursive=False)
+    self.assertEqual(sorted(paths), ["a", "x.txt"])
+
+  def testWalkTreeIncludeMatch(self):
+    # Excluded directories are not searched.
+    paths = cake.filesys.walkTree(
+      self.root,
+      includeMatch=lambda p: not p.endswith("b"),
+      )
+    self.assertEqual(sorted(paths), sorted([
+      "a",
+      "x.txt",
+      os.path.join("a", "y.txt"),
+      ]))
+
+  def testWalkTreeEntries(self):
+    entries = dict(cake.filesys.walkTreeEntries(self.root))
+    self.assertTrue(entries["a"].is_dir())
+    self.assertFalse(entries["x.txt"].is_dir())
+    self.assertEqual(entries["x.txt"].stat().st_size, len("x.txt"))
+    path = os.path.join("a", "b", "z.c")
+    self.assertEqual(entries[path].path, os.path.join(self.root, path))
+
+  def testMissingDirectory(self):
+    missing = os.path.join(self.root, "missing")
+    self.assertEqual(list(cake.filesys.walkTree(missing)), [])
+    self.assertRaises(
+      EnvironmentError,
+      list,
+      cake.filesys.walkTree(missing, recursive=False),
+      )
+
+class CopyTests(unittest.TestCase):
+
+  def setUp(self):
+    self.root = tempfile.mkdtemp(prefix="CakeFilesysTest")
+    self.source = os.path.join(self.root, "source.bin")
+    self.data = os.urandom(100000)
+    cake.filesys.writeFile(self.source, self.data)
+
+  def tearDown(self):
+    shutil.rmtree(self.root)
+
+  def testCopyFileData(self):
+    target = os.path.join(self.root, "target.bin")
+    cake.filesys.writeFile(target, b"longer than the source" * 10000)
+    cake.filesys.copyFileData(self.source, target)
+    self.assertEqual(cake.filesys.readFile(target), self.data)
+
+  def testCopyEmptyFile(self):
+    source = os.path.join(self.root, "empty.bin")
+    target = os.path.join(self.root, "target.bin")
+    cake.filesys.writeFile(source, b"")
+    cake.filesys.copyFileData(source, target)
+    self.assertEqual(cake.filesys.readFile(target), b"")
+
+  def testLinkFile(self):
+    target = os.path.join(self.root, "target.bin")
+    cake.filesys.writeFile(target, b"old")
+    cake.filesys.linkFile(self.source, target)
+    self.assertTrue(os.path.samefile(self.source, target))
+
+class MakeDirsTests(unittest.TestCase):
+
+  def setUp(self):
+    self.root = tempfile.mkdtemp(prefix="CakeFilesysTest")
+
+  def tearDown(self):
+    shutil.rmtree(self.root)
+
+  def testKnownDirectoriesAreSkipped(self):
+    knownDirectories = cake.filesys.KnownDirectories()
+    path = os.path.join(self.root, "a", "b")
+    cake.filesys.makeDirs(path, knownDirectories)
+    self.assertTrue(os.path.isdir(path))
+
+    hits, _ = knownDirectories.getStats()
+    cake.filesys.makeDirs(path, knownDirectories)
+    cake.filesys.makeDirs(os.path.join(self.root, "a"), knownDirectories)
+    self.assertEqual(knownDirectories.getStats()[0], hits + 2)
+
+    # Deleting the directory by other means isn't noticed until the
+    # directory is forgotten.
+    os.rmdir(path)
+    cake.filesys.makeDirs(path, knownDirectories)
+    self.assertFalse(os.path.isdir(path))
+    knownDirectories.forget(path)
+    cake.filesys.makeDirs(path, knownDirectories)
+    self.assertTrue(os.path.isdir(path))
+
+  def testClearForgetsAllDirectories(self):
+    knownDirectories = cake.filesys.KnownDirectories()
+    path = os.path.join(self.root, "a", "b")
+    cake.filesys.makeDirs(path, knownDirectories)
+    shutil.rmtree(os.path.join(self.root, "a"))
+    knownDirectories.clear()
+    self.assertEqual(knownDirectories.getStats()[1], 0)
+    cake.filesys.makeDirs(path, knownDirectories)
+    self.assertTrue(os.path.isdir(path))
+
+  def testHitsAreCountedOnEachThread(self):
+    knownDirectories = cake.filesys.KnownDirectories()
+    cake.filesys.makeDirs(self.root, knownDirectories)
+    hits, _ = knownDirectories.getStats()
+    threads = [
+      threading.Thread(
+        target=cake.filesys.makeDirs,
+        args=(self.root, knownDirectories),
+        )
+      for _ in range(4)
+      ]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(knownDirectories.getStats()[0], hits + 4)
+
+  def testRemoveTreeForgetsDirectories(self):
+    knownDirectories = cake.filesys.KnownDirectories()
+    path = os.path.join(self.root, "a", "b")
+    cake.filesys.makeDirs(path, knownDirectories)
+    cake.filesys.removeTree(os.path.join(self.root, "a"), knownDirectories)
+    cake.filesys.makeDirs(path, knownDirectories)
+    self.assertTrue(os.path.isdir(path))
+
+  def testWithoutKnownDirectories(self):
+    path = os.path.join(self.root, "a", "b")
+    cake.filesys.makeDirs(path)
+    os.rmdir(path)
+    cake.filesys.makeDirs(path)
+    self.assertTrue(os.path.isdir(path))
+
+if __name__ == "__main__":
+  suite = unittest.TestLoader().loadTestsFromNames([
+    "cake.test.filesys.WalkTreeTests",
+    "cake.test.filesys.CopyTests",
+    "cake.test.filesys.MakeDirsTests",
+    ])
+  runner = unittest.TextTestRunner(verbosity=2)
+  sys.exit(not runner.run(suite).wasSuccessful())
@@ -434,8 +434,13 @@ def caketest(*args, **kwargs):
     # @caketest(fixture="path")
     # def test(t):
     #   pass
+    #
+    # @caketest(fixture="path", config="otherpath")
+    # def test(t):
+    #   pass # Uses the config.cake of fixture 'otherpath'
 
     fixture = kwargs.get("fixture", None)
+    config = kwargs.get("config", None)
     
     def decorator(testFunc):
       if fixture:
@@ -445,6 +450,9 @@ def caketest(*args, **kwargs):
           fixtureDir = os.path.abspath(fixtureDir)
           fixtureDir = os.path.normpath(fixtureDir)
           t.copyTree(fixtureDir, t.root)
+          if config:
+            configPath = os.path.join(t.testDir, config, "config.cake")
+            shutil.copy(os.path.normpath(os.path.abspath(configPath)), t.root)
           testFunc(t)
 
         return TestCase(run)
@@ -0,0 +1,52 @@
+"""GNU Dependency File Parser Unit Tests.
+"""
+
+import unittest
+import sys
+
+from cake.gnu import parseDependencyText
+
+class ParseDependencyTextTests(unittest.TestCase):
+
+  def testSimpleRule(self):
+    self.assertEqual(
+      parseDependencyText("foo.o: foo.c foo.h\n", ".o"),
+      ["foo.c", "foo.h"],
+      )
+
+  def testLineContinuations(self):
+    text = "foo.o: foo.c \\\n  a.h \\\r\n  b.h\n"
+    self.assertEqual(parseDependencyText(text, ".o"), ["foo.c", "a.h", "b.h"])
+
+  def testEscapedSpaces(self):
+    text = "foo.o: my\\ dir/foo.c has\\#hash.h a\\\\ b.h\n"
+    self.assertEqual(
+      parseDependencyText(text, ".o"),
+      ["my dir/foo.c", "has#hash.h", "a\\\\", "b.h"],
+      )
+
+  def testDollars(self):
+    self.assertEqual(parseDependencyText("foo.o: $$x.h\n", ".o"), ["$x.h"])
+
+  def testWindowsPaths(self):
+    text = "c:\\build\\foo.o: c:\\src\\foo.c \\\n c:\\src\\foo.h\n"
+    self.assertEqual(
+      parseDependencyText(text, ".o"),
+      ["c:\\src\\foo.c", "c:\\src\\foo.h"],
+      )
+
+  def testPhonyRules(self):
+    text = "foo.o: foo.c foo.h bar.h\n\nfoo.h:\n\nbar.h:\n"
+    self.assertEqual(
+      parseDependencyText(text, ".o"),
+      ["foo.c", "foo.h", "bar.h"],
+      )
+
+  def testDuplicates(self):
+    text = "foo.o foo.d: foo.c a.h\nfoo.o: a.h b.h\n"
+    self.assertEqual(parseDependencyText(text, ".o"), ["foo.c", "a.h", "b.h"])
+
+if __name__ == "__main__":
+  suite = unittest.TestLoader().loadTestsFromTestCase(ParseDependencyTextTests)
+  runner = unittest.TextTestRunner(verbosity=2)
+  sys.exit(not runner.run(suite).wasSuccessful())
@@ -0,0 +1,91 @@
+"""Include Scanner Unit Tests.
+"""
+
+import unittest
+import sys
+import tempfile
+import shutil
+import os
+import os.path
+
+import cake.includes
+
+class IncludeScannerTests(unittest.TestCase):
+
+  def setUp(self):
+    self.root = tempfile.mkdtemp(prefix="CakeIncludeTest")
+
+  def tearDown(self):
+    shutil.rmtree(self.root)
+
+  def writeFile(self, path, text):
+    path = os.path.join(self.root, path)
+    if not os.path.isdir(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    f = open(path, "wb")
+    try:
+      f.write(text.encode("utf8"))
+    finally:
+      f.close()
+    return path
+
+  def testParseIncludes(self):
+    from cake.includes import parseIncludes
+    self.assertEqual(parseIncludes(b""), [])
+    self.assertEqual(parseIncludes(b'#include "a.h"\n'), [("a.h", False)])
+    self.assertEqual(parseIncludes(b'  #  include <b/c.h>\n'), [("b/c.h", True)])
+    self.assertEqual(parseIncludes(b'#include MACRO\n'), [])
+    self.assertEqual(
+      parseIncludes(b'#include "a.h"\r\nint x;\n#include <b.h>\n'),
+      [("a.h", False), ("b.h", True)],
+      )
+
+  def testScanTransitive(self):
+    source = self.writeFile("src/main.c", '#include "local.h"\n#include <lib.h>\n')
+    local = self.writeFile("src/local.h", '#include <stdio.h>\n')
+    lib = self.writeFile("inc/lib.h", '#include "detail.h"\n')
+    detail = self.writeFile("inc/detail.h", '#include "lib.h"\n')
+
+    scanner = cake.includes.IncludeScanner()
+    headers = scanner.scan(source, [os.path.join(self.root, "inc")])
+    self.assertEqual(sorted(headers), sorted([local, lib, detail]))
+
+  def testAngledIncludeSkipsIncludingDirectory(self):
+    source = self.writeFile("src/main.c", '#include <a.h>\n')
+    self.writeFile("src/a.h", '')
+    a = self.writeFile("inc/a.h", '')
+
+    scanner = cake.includes.IncludeScanner()
+    self.assertEqual(scanner.scan(source, [os.path.join(self.root, "inc")]), [a])
+    self.assertEqual(scanner.scan(source, []), [])
+
+  def testForcedIncludes(self):
+    source = self.writeFile("main.c", '')
+    forced = self.writeFile("inc/forced.h", '#include "other.h"\n')
+    other = self.writeFile("inc/other.h", '')
+
+    scanner = cake.includes.IncludeScanner()
+    headers = scanner.scan(source, [os.path.join(self.root, "inc")], ["forced.h"])
+    self.assertEqual(sorted(headers), sorted([forced, other]))
+
+  def testIncludesMemoisedByTimestamp(self):
+    source = self.writeFile("main.c", '#include "a.h"\n')
+    a = self.writeFile("a.h", '')
+    b = self.writeFile("b.h", '')
+
+    timestamps = {source: 1}
+    scanner = cake.includes.IncludeScanner(
+      lambda p: timestamps.get(p, 0))
+    self.assertEqual(scanner.scan(source, []), [a])
+
+    # Not re-read while the timestamp is unchanged.
+    self.writeFile("main.c", '#include "b.h"\n')
+    self.assertEqual(scanner.scan(source, []), [a])
+
+    timestamps[source] = 2
+    self.assertEqual(scanner.scan(source, []), [b])
+
+if __name__ == "__main__":
+  suite = unittest.TestLoader().loadTestsFromTestCase(IncludeScannerTests)
+  runner = unittest.TextTestRunner(verbosity=2)
+  sys.exit(not runner.run(suite).wasSuccessful())
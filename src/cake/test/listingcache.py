@@ -0,0 +1,94 @@
+"""Listing Cache Unit Tests.
+"""
+
+import unittest
+import sys
+import tempfile
+import shutil
+import os
+import os.path
+
+import cake.filesys
+from cake.listingcache import ListingCache
+
+class ListingCacheTests(unittest.TestCase):
+
+  def setUp(self):
+    self.root = tempfile.mkdtemp(prefix="CakeListingCacheTest")
+    self.tree = os.path.join(self.root, "tree")
+    self.cachePath = os.path.join(self.root, "listings.cache")
+    for path in ["x.txt", os.path.join("a", "y.c"), os.path.join("a", "b", "z.c")]:
+      cake.filesys.writeFile(os.path.join(self.tree, path), path.encode("utf8"))
+    self.age(self.tree)
+
+  def tearDown(self):
+    shutil.rmtree(self.root)
+
+  def age(self, path):
+    # Listings of recently modified directories aren't saved.
+    os.utime(path, (0, 1000000000))
+
+  def testWalkTree(self):
+    cache = ListingCache(self.cachePath)
+    self.assertEqual(
+      sorted(cache.walkTree(self.tree)),
+      sorted(cake.filesys.walkTree(self.tree)),
+      )
+    self.assertEqual(
+      sorted(cache.walkTree(self.tree, recursive=False)),
+      sorted(cake.filesys.walkTree(self.tree, recursive=False)),
+      )
+
+  def testGlob(self):
+    cache = ListingCache(self.cachePath)
+    pattern = os.path.join(self.tree, "*", "*.c")
+    self.assertEqual(cache.glob(pattern), [os.path.join(self.tree, "a", "y.c")])
+    self.assertEqual(cache.glob(os.path.join(self.tree, "x.txt")), [
+      os.path.join(self.tree, "x.txt"),
+      ])
+    self.assertEqual(cache.glob(os.path.join(self.tree, "*.c")), [])
+
+  def testSavedListingsAreReused(self):
+    cache = ListingCache(self.cachePath)
+    self.assertEqual(cache.listDirectory(self.tree)[2], ["x.txt"])
+    cache.save()
+
+    # A change that doesn't update the modification time isn't seen.
+    cake.filesys.writeFile(os.path.join(self.tree, "w.txt"), b"w")
+    self.age(self.tree)
+    self.assertEqual(ListingCache(self.cachePath).listDirectory(self.tree)[2], ["x.txt"])
+
+    os.utime(self.tree, (0, 2000000000))
+    files = ListingCache(self.cachePath).listDirectory(self.tree)[2]
+    self.assertEqual(sorted(files), ["w.txt", "x.txt"])
+
+  def testChangesDuringBuildAreSeen(self):
+    cache = ListingCache(self.cachePath)
+    self.assertEqual(cache.listDirectory(self.tree)[2], ["x.txt"])
+
+    cake.filesys.writeFile(os.path.join(self.tree, "w.txt"), b"w")
+    os.utime(self.tree, (0, 2000000000))
+    self.assertEqual(sorted(cache.listDirectory(self.tree)[2]), ["w.txt", "x.txt"])
+
+  def testRecentListingsAreReadAgain(self):
+    cache = ListingCache(self.cachePath)
+    os.utime(self.tree, None)
+    mtime = os.stat(self.tree).st_mtime_ns
+    self.assertEqual(cache.listDirectory(self.tree)[2], ["x.txt"])
+
+    # A change within the file system's time resolution is still seen.
+    cake.filesys.writeFile(os.path.join(self.tree, "w.txt"), b"w")
+    os.utime(self.tree, ns=(mtime, mtime))
+    self.assertEqual(sorted(cache.listDirectory(self.tree)[2]), ["w.txt", "x.txt"])
+
+  def testRecentListingsAreNotSaved(self):
+    cache = ListingCache(self.cachePath)
+    os.utime(self.tree, None)
+    cache.listDirectory(self.tree)
+    cache.save()
+    self.assertEqual(ListingCache(self.cachePath)._listings, {})
+
+if __name__ == "__main__":
+  suite = unittest.TestLoader().loadTestsFromTestCase(ListingCacheTests)
+  runner = unittest.TextTestRunner(verbosity=2)
+  sys.exit(not runner.run(suite).wasSuccessful())
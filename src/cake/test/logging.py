@@ -0,0 +1,80 @@
+"""Logging Unit Tests.
+"""
+
+import io
+import unittest
+import threading
+import sys
+
+import cake.logging
+import cake.task
+import cake.threadpool
+
+class AsyncLoggerTests(unittest.TestCase):
+
+  def setUp(self):
+    self.stdout = sys.stdout
+    self.stderr = sys.stderr
+    sys.stdout = io.StringIO()
+    sys.stderr = io.StringIO()
+
+  def tearDown(self):
+    sys.stdout = self.stdout
+    sys.stderr = self.stderr
+
+  def testMessagesAreWritten(self):
+    logger = cake.logging.AsyncLogger()
+    logger.outputInfo("a\n")
+    logger.outputError("b\n")
+    logger.outputDebug("run", "c\n")
+    logger.flush()
+    self.assertEqual(sys.stdout.getvalue(), "a\n")
+    self.assertEqual(sys.stderr.getvalue(), "b\n")
+
+    logger.close()
+    logger.outputInfo("d\n")
+    self.assertEqual(sys.stdout.getvalue(), "a\nd\n")
+
+  def testCloseWritesQueuedMessages(self):
+    logger = cake.logging.AsyncLogger()
+    for i in range(100):
+      logger.outputInfo("%i\n" % i)
+    logger.close()
+    self.assertEqual(sys.stdout.getvalue(), "".join("%i\n" % i for i in range(100)))
+
+  def testGroupByTask(self):
+    logger = cake.logging.AsyncLogger(groupByTask=True)
+    threadPool = cake.threadpool.ThreadPool(2)
+    aStarted = threading.Event()
+    bStarted = threading.Event()
+
+    def a():
+      logger.outputInfo("a1\n")
+      aStarted.set()
+      bStarted.wait(5)
+      logger.outputInfo("a2\n")
+
+    def b():
+      aStarted.wait(5)
+      logger.outputInfo("b1\n")
+      bStarted.set()
+      logger.outputInfo("b2\n")
+
+    done = []
+    for func in (a, b):
+      e = threading.Event()
+      t = cake.task.Task(func)
+      t.addCallback(e.set)
+      t.start(threadPool=threadPool)
+      done.append(e)
+    for e in done:
+      e.wait(5)
+
+    logger.close()
+    output = sys.stdout.getvalue()
+    self.assertTrue(output in ("a1\na2\nb1\nb2\n", "b1\nb2\na1\na2\n"), output)
+
+if __name__ == "__main__":
+  suite = unittest.TestLoader().loadTestsFromTestCase(AsyncLoggerTests)
+  runner = unittest.TextTestRunner(verbosity=2)
+  sys.exit(not runner.run(suite).wasSuccessful())
@@ -0,0 +1,224 @@
+"""Tool Memoise and Clone Unit Tests.
+"""
+
+import unittest
+import sys
+import threading
+
+from cake.library import Tool, memoise
+
+class _Configuration(object):
+  engine = None
+
+class _CountingTool(Tool):
+
+  flags = []
+  prefix = "-D"
+  suffix = ".o"
+
+  def __init__(self, configuration):
+    Tool.__init__(self, configuration)
+    self.calls = {}
+
+  def _count(self, name):
+    self._unshare("calls")
+    self.calls[name] = self.calls.get(name, 0) + 1
+
+  @memoise('prefix', 'flags')
+  def getArgs(self):
+    self._count("getArgs")
+    return [self.prefix + f for f in self.flags]
+
+  @memoise()
+  def getCommand(self):
+    self._count("getCommand")
+    return ["cc"] + self.getArgs()
+
+  @memoise('suffix')
+  def getTarget(self, name):
+    self._count("getTarget")
+    return name + self.suffix
+
+  @memoise
+  def getAll(self):
+    self._count("getAll")
+    return self.prefix + self.suffix
+
+  def addFlag(self, flag):
+    self._unshare("flags")
+    self.flags.append(flag)
+    self._clearCache("flags")
+
+class MemoiseTests(unittest.TestCase):
+
+  def setUp(self):
+    self.tool = _CountingTool(_Configuration())
+    self.tool.flags = ["A"]
+
+  def testResultIsMemoised(self):
+    self.assertEqual(self.tool.getArgs(), ["-DA"])
+    self.assertEqual(self.tool.getArgs(), ["-DA"])
+    self.assertEqual(self.tool.calls["getArgs"], 1)
+
+  def testSettingUnrelatedAttributeKeepsResult(self):
+    self.tool.getArgs()
+    self.tool.suffix = ".obj"
+    self.assertEqual(self.tool.getArgs(), ["-DA"])
+    self.assertEqual(self.tool.calls["getArgs"], 1)
+    self.assertEqual(self.tool.getTarget("a"), "a.obj")
+
+  def testSettingReadAttributeDropsResult(self):
+    self.tool.getArgs()
+    self.tool.getTarget("a")
+    self.tool.prefix = "-U"
+    self.assertEqual(self.tool.getArgs(), ["-UA"])
+    self.assertEqual(self.tool.calls["getArgs"], 2)
+    self.tool.getTarget("a")
+    self.assertEqual(self.tool.calls["getTarget"], 1)
+
+  def testUndeclaredResultDropsOnAnySet(self):
+    self.tool.getAll()
+    self.tool.addFlag("B")
+    self.assertEqual(self.tool.getAll(), "-D.o")
+    self.assertEqual(self.tool.calls["getAll"], 2)
+
+  def testClearCacheByName(self):
+    self.tool.getArgs()
+    self.tool.addFlag("B")
+    self.assertEqual(self.tool.getArgs(), ["-DA", "-DB"])
+    self.assertEqual(self.tool.calls["getArgs"], 2)
+
+  def testClearCacheWithoutNamesDropsEverything(self):
+    self.tool.getArgs()
+    self.tool.getTarget("a")
+    self.tool._clearCache()
+    self.tool.getArgs()
+    self.tool.getTarget("a")
+    self.assertEqual(self.tool.calls["getArgs"], 2)
+    self.assertEqual(self.tool.calls["getTarget"], 2)
+
+  def testNestedResultDependsOnInnerResult(self):
+    # getCommand doesn't declare prefix but uses the result of getArgs.
+    self.tool.getArgs()
+    self.assertEqual(self.tool.getCommand(), ["cc", "-DA"])
+    self.tool.prefix = "-U"
+    self.assertEqual(self.tool.getCommand(), ["cc", "-UA"])
+    self.assertEqual(self.tool.calls["getCommand"], 2)
+
+  def testCloneKeepsUnaffectedResults(self):
+    self.tool.getArgs()
+    clone = self.tool.clone()
+    clone.suffix = ".obj"
+    self.assertEqual(clone.getArgs(), ["-DA"])
+    self.assertEqual(clone.calls["getArgs"], 1)
+    clone.flags = ["B"]
+    self.assertEqual(clone.getArgs(), ["-DB"])
+    self.assertEqual(self.tool.getArgs(), ["-DA"])
+
+class _ThreadedTool(Tool):
+
+  other = None
+
+  def __init__(self, configuration):
+    Tool.__init__(self, configuration)
+    self.started = threading.Event()
+    self.finish = threading.Event()
+    self.calls = 0
+
+  @memoise()
+  def getSlow(self):
+    self.calls += 1
+    self.started.set()
+    self.finish.wait()
+    return 1
+
+  @memoise('other')
+  def getOther(self):
+    return 2
+
+class ThreadTests(unittest.TestCase):
+
+  def testRecordingIsPerThread(self):
+    tool = _ThreadedTool(_Configuration())
+    thread = threading.Thread(target=tool.getSlow)
+    thread.start()
+    try:
+      tool.started.wait()
+      # Not called by getSlow so setting other mustn't drop its result.
+      self.assertEqual(tool.getOther(), 2)
+    finally:
+      tool.finish.set()
+      thread.join()
+    tool._clearCache("other")
+    self.assertEqual(tool.getSlow(), 1)
+    self.assertEqual(tool.calls, 1)
+
+class CloneTests(unittest.TestCase):
+
+  def setUp(self):
+    self.tool = _CountingTool(_Configuration())
+    self.tool.flags = ["A"]
+
+  def testValuesAreSharedUntilModified(self):
+    self.tool.getArgs()
+    clone = self.tool.clone()
+    self.assertTrue(clone.flags is self.tool.flags)
+    self.assertEqual(clone.getArgs(), ["-DA"])
+    self.assertEqual(clone.calls["getArgs"], 1)
+    # Reads and memoised calls don't copy, on either side.
+    self.assertTrue(clone.flags is self.tool.flags)
+    clone.addFlag("B")
+    self.assertEqual(clone.flags, ["A", "B"])
+    self.assertEqual(self.tool.flags, ["A"])
+    flags = self.tool.flags
+    self.tool.addFlag("C")
+    self.assertTrue(self.tool.flags is not flags)
+
+  def testMemoisedResultsAreShared(self):
+    self.tool.getArgs()
+    clone = self.tool.clone()
+    self.assertTrue(clone._Tool__memoise is self.tool._Tool__memoise)
+    clone.getTarget("a")
+    self.assertEqual(clone.calls["getTarget"], 1)
+    self.assertFalse(clone._Tool__memoise is self.tool._Tool__memoise)
+    self.tool.getTarget("a")
+    self.assertEqual(self.tool.calls["getTarget"], 1)
+
+  def testOriginalChangesAreNotSeenByClone(self):
+    clone = self.tool.clone()
+    self.tool.addFlag("B")
+    self.assertEqual(self.tool.getArgs(), ["-DA", "-DB"])
+    self.assertEqual(clone.getArgs(), ["-DA"])
+
+  def testCloneOfClone(self):
+    clone = self.tool.clone()
+    clone2 = clone.clone()
+    clone.addFlag("B")
+    clone2.addFlag("C")
+    self.assertEqual(self.tool.flags, ["A"])
+    self.assertEqual(clone.flags, ["A", "B"])
+    self.assertEqual(clone2.flags, ["A", "C"])
+
+  def testNestedToolsAreCloned(self):
+    self.tool.prefix = _CountingTool(_Configuration())
+    clone = self.tool.clone()
+    self.assertFalse(clone.prefix is self.tool.prefix)
+    clone.prefix.flags = ["B"]
+    self.assertEqual(self.tool.prefix.flags, [])
+
+  def testToolsInContainersAreClonedWhenUnshared(self):
+    self.tool.flags = [_CountingTool(_Configuration())]
+    clone = self.tool.clone()
+    clone._unshare("flags")
+    self.assertFalse(clone.flags[0] is self.tool.flags[0])
+
+  def testReplacedValueIsNotCopied(self):
+    clone = self.tool.clone()
+    flags = ["B"]
+    clone.flags = flags
+    self.assertTrue(clone.flags is flags)
+
+if __name__ == "__main__":
+  suite = unittest.TestLoader().loadTestsFromModule(sys.modules[__name__])
+  runner = unittest.TextTestRunner(verbosity=2)
+  sys.exit(not runner.run(suite).wasSuccessful())
@@ -0,0 +1,75 @@
+"""Precompiled Header Analysis Unit Tests.
+"""
+
+import unittest
+import sys
+import os.path
+
+from cake.pchanalysis import rankHeaders, selectHeaders
+
+def p(*parts):
+  return os.path.join(os.path.sep, "ws", *parts)
+
+class RankHeadersTests(unittest.TestCase):
+
+  def setUp(self):
+    self.includes = {
+      p("a.cpp"): [("common.h", False), ("vector", True)],
+      p("b.cpp"): [("vector", True), ("common.h", False)],
+      p("c.cpp"): [("other.h", False)],
+      p("common.h"): [("detail/impl.h", False)],
+      p("detail", "impl.h"): [],
+      p("other.h"): [],
+      p("sys", "vector"): [],
+      }
+    self.sizes = {
+      p("common.h"): 100,
+      p("detail", "impl.h"): 1000,
+      p("other.h"): 5,
+      p("sys", "vector"): 10,
+      }
+
+  def rank(self, objects):
+    return rankHeaders(objects, self.includes.__getitem__, self.sizes.__getitem__)
+
+  def testRanksByObjectsTimesCost(self):
+    commonHeaders = [p("common.h"), p("detail", "impl.h"), p("sys", "vector")]
+    candidates = self.rank([
+      (p("a.cpp"), commonHeaders),
+      (p("b.cpp"), commonHeaders),
+      (p("c.cpp"), [p("other.h")]),
+      ])
+    self.assertEqual(
+      [(c.path, c.objectCount, c.cost) for c in candidates],
+      [
+        (p("common.h"), 2, 2200),
+        (p("sys", "vector"), 2, 20),
+        (p("other.h"), 1, 5),
+      ])
+
+  def testIgnoresIncludesNotInDependencies(self):
+    candidates = self.rank([(p("a.cpp"), [p("sys", "vector")])])
+    self.assertEqual([c.path for c in candidates], [p("sys", "vector")])
+
+  def testSelectHeaders(self):
+    commonHeaders = [p("common.h"), p("detail", "impl.h"), p("sys", "vector")]
+    candidates = self.rank([
+      (p("a.cpp"), commonHeaders),
+      (p("b.cpp"), commonHeaders),
+      (p("c.cpp"), [p("other.h")]),
+      ])
+    headers, saving = selectHeaders(candidates, 3, 0.5)
+
+    # Headers are kept in the order they were first included.
+    self.assertEqual([h.path for h in headers], [p("common.h"), p("sys", "vector")])
+    self.assertEqual(saving, 1100 + 10)
+    self.assertEqual(headers[1].getIncludeDirective(), "#include <vector>")
+
+    headers, saving = selectHeaders(candidates, 3, 1.0)
+    self.assertEqual(headers, [])
+    self.assertEqual(saving, 0)
+
+if __name__ == "__main__":
+  suite = unittest.TestLoader().loadTestsFromTestCase(RankHeadersTests)
+  runner = unittest.TextTestRunner(verbosity=2)
+  sys.exit(not runner.run(suite).wasSuccessful())
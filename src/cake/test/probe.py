@@ -0,0 +1,115 @@
+"""Probe Cache Unit Tests.
+"""
+
+import unittest
+import sys
+import tempfile
+import shutil
+import os
+import os.path
+
+import cake.probe
+from cake.probe import ProbeCache
+
+class ProbeCacheTests(unittest.TestCase):
+
+  def setUp(self):
+    self.root = tempfile.mkdtemp(prefix="CakeProbeTest")
+    self.cachePath = os.path.join(self.root, "probes.cache")
+    self.exePath = os.path.join(self.root, "tool")
+    self.writeExe(b"v1")
+    self.calls = 0
+
+  def tearDown(self):
+    shutil.rmtree(self.root)
+
+  def writeExe(self, data):
+    f = open(self.exePath, "wb")
+    try:
+      f.write(data)
+    finally:
+      f.close()
+
+  def probe(self):
+    self.calls += 1
+    return [1, 2, self.calls]
+
+  def testResultIsCachedBetweenRuns(self):
+    cache = ProbeCache(self.cachePath)
+    self.assertEqual(cache.probe("version", [self.exePath], self.probe), [1, 2, 1])
+    self.assertEqual(cache.probe("version", [self.exePath], self.probe), [1, 2, 1])
+
+    cache = ProbeCache(self.cachePath)
+    self.assertEqual(cache.probe("version", [self.exePath], self.probe), [1, 2, 1])
+    self.assertEqual(self.calls, 1)
+
+    # Results are stored per probe name.
+    self.assertEqual(cache.probe("target", [self.exePath], self.probe), [1, 2, 2])
+
+  def testChangedExecutableIsProbedAgain(self):
+    cache = ProbeCache(self.cachePath)
+    cache.probe("version", [self.exePath], self.probe)
+
+    self.writeExe(b"version2")
+
+    cache = ProbeCache(self.cachePath)
+    self.assertEqual(cache.probe("version", [self.exePath], self.probe), [1, 2, 2])
+
+  def testFailedProbeIsNotCached(self):
+    cache = ProbeCache(self.cachePath)
+    def fail():
+      raise EnvironmentError("failed")
+    self.assertRaises(EnvironmentError, cache.probe, "version", [self.exePath], fail)
+    self.assertEqual(cache.probe("version", [self.exePath], self.probe), [1, 2, 1])
+
+  def testMissingPathIsNotCached(self):
+    cache = ProbeCache(self.cachePath)
+    missingPath = os.path.join(self.root, "missing")
+    cache.probe("version", [missingPath], self.probe)
+    cache.probe("version", [missingPath], self.probe)
+    self.assertEqual(self.calls, 2)
+
+  def testCorruptCacheIsIgnored(self):
+    f = open(self.cachePath, "wb")
+    try:
+      f.write(b"garbage")
+    finally:
+      f.close()
+
+    cache = ProbeCache(self.cachePath)
+    self.assertEqual(cache.probe("version", [self.exePath], self.probe), [1, 2, 1])
+
+class DefaultProbeCachePathTests(unittest.TestCase):
+
+  def setUp(self):
+    self.environ = os.environ.get('CAKE_PROBE_CACHE', None)
+    os.environ.pop('CAKE_PROBE_CACHE', None)
+
+  def tearDown(self):
+    cake.probe.setDefaultProbeCachePath(None)
+    if self.environ is None:
+      os.environ.pop('CAKE_PROBE_CACHE', None)
+    else:
+      os.environ['CAKE_PROBE_CACHE'] = self.environ
+
+  def testNotCachedByDefault(self):
+    self.assertEqual(cake.probe.getDefaultProbeCachePath(), None)
+
+  def testEnvironmentVariable(self):
+    os.environ['CAKE_PROBE_CACHE'] = "/tmp/env.cache"
+    self.assertEqual(cake.probe.getDefaultProbeCachePath(), "/tmp/env.cache")
+    os.environ['CAKE_PROBE_CACHE'] = ""
+    self.assertEqual(cake.probe.getDefaultProbeCachePath(), None)
+
+  def testSetPath(self):
+    os.environ['CAKE_PROBE_CACHE'] = "/tmp/env.cache"
+    cake.probe.setDefaultProbeCachePath("/build/probes.cache")
+    self.assertEqual(cake.probe.getDefaultProbeCachePath(), "/build/probes.cache")
+
+if __name__ == "__main__":
+  suite = unittest.TestSuite([
+    unittest.TestLoader().loadTestsFromTestCase(ProbeCacheTests),
+    unittest.TestLoader().loadTestsFromTestCase(DefaultProbeCachePathTests),
+    ])
+  runner = unittest.TextTestRunner(verbosity=2)
+  sys.exit(not runner.run(suite).wasSuccessful())
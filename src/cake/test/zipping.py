@@ -0,0 +1,111 @@
+"""Zipping Unit Tests.
+"""
+
+import unittest
+import sys
+import tempfile
+import shutil
+import os
+import os.path
+import zipfile
+
+import cake.filesys
+import cake.zipping
+
+class ZipWriterTests(unittest.TestCase):
+
+  def setUp(self):
+    self.root = tempfile.mkdtemp(prefix="CakeZippingTest")
+    self.source = os.path.join(self.root, "source")
+    self.zipPath = os.path.join(self.root, "test.zip")
+    self.writeFile("a.txt", b"alpha\n" * 1000)
+    self.writeFile(os.path.join("sub", "b.txt"), b"beta\n")
+    self.writeFile("empty.txt", b"")
+    self.writeFile(u"été.txt", b"summer\n")
+
+  def tearDown(self):
+    shutil.rmtree(self.root)
+
+  def writeFile(self, path, data):
+    cake.filesys.writeFile(os.path.join(self.source, path), data)
+
+  def getFiles(self, paths):
+    return [(os.path.join(self.source, p), p) for p in paths]
+
+  def writeZip(self, paths, chunkSize=100):
+    f = open(self.zipPath, "wb")
+    try:
+      zipWriter = cake.zipping.ZipWriter(f)
+      cake.zipping.writeFilesToZip(
+        zipWriter, self.getFiles(paths), chunkSize=chunkSize)
+      zipWriter.close()
+    finally:
+      f.close()
+
+  def readZip(self):
+    zipFile = zipfile.ZipFile(self.zipPath)
+    try:
+      self.assertEqual(zipFile.testzip(), None)
+      return dict(
+        (z.filename, zipFile.read(z))
+        for z in zipFile.infolist()
+        if not cake.zipping.isDirectoryInfo(z)
+        )
+    finally:
+      zipFile.close()
+
+  def checkZip(self, paths):
+    expected = {}
+    for path in paths:
+      sourcePath = os.path.join(self.source, path)
+      if os.path.isfile(sourcePath):
+        expected[path.replace(os.path.sep, "/")] = cake.filesys.readFile(sourcePath)
+    self.assertEqual(self.readZip(), expected)
+
+  def testWriteFilesToZip(self):
+    paths = ["a.txt", "sub", os.path.join("sub", "b.txt"), "empty.txt", u"été.txt"]
+    self.writeZip(paths)
+    self.checkZip(paths)
+
+  def testZip64(self):
+    limit = cake.zipping._ZIP64_LIMIT
+    cake.zipping._ZIP64_LIMIT = 100
+    try:
+      paths = ["a.txt", "sub", os.path.join("sub", "b.txt")]
+      self.writeZip(paths)
+      self.checkZip(paths)
+
+      self.writeFile(os.path.join("sub", "b.txt"), b"changed\n")
+      cake.zipping.updateZip(self.zipPath, self.getFiles(["empty.txt", os.path.join("sub", "b.txt")]), [])
+      self.checkZip(paths + ["empty.txt"])
+    finally:
+      cake.zipping._ZIP64_LIMIT = limit
+
+  def testUpdateZip(self):
+    self.writeZip(["a.txt", "empty.txt"])
+    self.assertFalse(cake.zipping.updateZip(
+      self.zipPath,
+      self.getFiles([os.path.join("sub", "b.txt")]),
+      ["empty.txt"],
+      ))
+    self.checkZip(["a.txt", os.path.join("sub", "b.txt")])
+
+    # Replacing the only large entry leaves too much unused space.
+    self.writeFile("a.txt", b"changed\n")
+    self.assertTrue(cake.zipping.updateZip(
+      self.zipPath,
+      self.getFiles(["a.txt"]),
+      [],
+      ))
+    self.checkZip(["a.txt", os.path.join("sub", "b.txt")])
+
+  def testUpdateEmptyZip(self):
+    self.writeZip([])
+    self.assertEqual(self.readZip(), {})
+    cake.zipping.updateZip(self.zipPath, self.getFiles(["a.txt"]), [])
+    self.checkZip(["a.txt"])
+
+if __name__ == "__main__":
+  suite = unittest.TestLoader().loadTestsFromTestCase(ZipWriterTests)
+  runner = unittest.TextTestRunner(verbosity=2)
+  sys.exit(not runner.run(suite).wasSuccessful())
@@ -6,11 +6,60 @@
 """
 
 import cake.filesys
+import cake.threadpool
+import calendar
+import collections
 import os
 import os.path
+import shutil
+import stat
+import struct
+import threading
 import time
 import zipfile
 import zlib
+try:
+  import cPickle as pickle
+except ImportError:
+  import pickle
+
+MANIFEST_MAGIC = "CKZM".encode('latin-1') # We need bytes for Python 3.x
+"""A magic value written to the end of extraction manifest files.
+
+@type: bytes
+"""
+
+MANIFEST_VERSION = 1
+"""The version of the extraction manifest file format.
+
+@type: int
+"""
+
+EXTRACT_BUFFER_SIZE = 1024 * 1024
+"""The size of the buffer used to stream files out of a zip.
+
+@type: int
+"""
+
+COMPRESS_CHUNK_SIZE = 1024 * 1024
+"""The default size of the chunks that files are split into to be
+compressed in parallel.
+
+@type: int
+"""
+
+COMPRESS_WINDOW = 16
+"""The default maximum number of chunks being compressed at once.
+
+@type: int
+"""
+
+COMPACT_RATIO = 0.5
+"""The default fraction of a zip that may be taken up by entries that are
+no longer used before L{updateZip} rewrites it.
+
+@type: float
+"""
 
 def compressFile(source, target):
   """Compress the contents of a file and write it to another file.
@@ -42,7 +91,7 @@ def decompressFile(source, target):
     raise EnvironmentError(str(e))
   cake.filesys.writeFile(target, data)
   
-def findFilesToCompress(sourcePath, includeMatch=None):
+def findFilesToCompress(sourcePath, includeMatch=None, entries=None):
   """Return a dictionary of files in a given directory.
   
   @param sourcePath: The path to the file or directory to compress.
@@ -50,13 +99,19 @@ def findFilesToCompress(sourcePath, includeMatch=None):
   @param includeMatch: A function that returns True when a path should
   be included in the zip.
   @type includeMatch: any callable
+  @param entries: If not None, a dictionary that is filled with the
+  os.DirEntry of each file found, using the same keys as the result.
+  @type entries: dict or None
   """
   toZip = {}
   if os.path.isdir(sourcePath):
     # Remove any trailing slash
     searchDir = os.path.normpath(sourcePath)
-    for path in cake.filesys.walkTree(searchDir, includeMatch=includeMatch):
-      toZip[os.path.normcase(path)] = path
+    for path, entry in cake.filesys.walkTreeEntries(searchDir, includeMatch=includeMatch):
+      key = os.path.normcase(path)
+      toZip[key] = path
+      if entries is not None:
+        entries[key] = entry
   else:
     toZip[os.path.normcase(path)] = path
     
@@ -73,26 +128,112 @@ def isDirectoryInfo(zipInfo):
   """
   return (zipInfo.external_attr & 0x00000010) != 0 # FILE_ATTRIBUTE_DIRECTORY
 
-def writeFileToZip(zipFile, sourcePath, targetPath):
-  """Write a source file or directory to a zip.
-  
-  @param zipFile: The zip file object to write to.
+def getZipTime(zipInfo):
+  """Get the modification time of a zip entry.
+
+  @param zipInfo: The zip entry.
+  @type zipInfo: zipfile.ZipInfo
+
+  @return: The modification time in seconds since the epoch.
+  @rtype: int
+  """
+  year, month, day, hour, minute, second = zipInfo.date_time
+  return calendar.timegm((year, month, day, hour, minute, second, 0, 0, 0))
+
+def extractFile(zipFile, zipInfo, targetPath):
+  """Extract a file from a zip, streaming it to disk.
+
+  The modification time of the extracted file is set to that of the
+  zip entry.
+
+  @param zipFile: The zip file object to read from.
   @type zipFile: zipfile.ZipFile
-  @param sourcePath: The path to the source file or directory.
-  @type sourcePath: string
-  @param targetPath: The target path within the zip.
-  @param targetPath: string 
+  @param zipInfo: The entry to extract.
+  @type zipInfo: zipfile.ZipInfo
+  @param targetPath: The path of the file to write.
+  @type targetPath: string
   """
+  cake.filesys.makeDirs(os.path.dirname(targetPath))
+  source = zipFile.open(zipInfo, "r")
+  try:
+    f = open(targetPath, "wb")
+    try:
+      shutil.copyfileobj(source, f, EXTRACT_BUFFER_SIZE)
+    finally:
+      f.close()
+  finally:
+    source.close()
+
+  zipTime = getZipTime(zipInfo)
+  os.utime(targetPath, (zipTime, zipTime))
+
+def readManifest(path):
+  """Read an extraction manifest.
+
+  @param path: The path of the manifest file.
+  @type path: string
+
+  @return: The entries of the manifest, or an empty dictionary if the
+  manifest doesn't exist or is invalid.
+  @rtype: dict
+  """
+  try:
+    contents = cake.filesys.readFile(path)
+  except EnvironmentError:
+    return {}
+
+  magicLength = len(MANIFEST_MAGIC)
+  if contents[-magicLength:] != MANIFEST_MAGIC:
+    return {}
+  try:
+    version, entries = pickle.loads(contents[:-magicLength])
+  except Exception:
+    return {}
+  if version != MANIFEST_VERSION or not isinstance(entries, dict):
+    return {}
+  return entries
+
+def writeManifest(path, entries):
+  """Write an extraction manifest.
+
+  @param path: The path of the manifest file.
+  @type path: string
+  @param entries: The entries of the manifest.
+  @type entries: dict
+  """
+  data = pickle.dumps((MANIFEST_VERSION, entries), pickle.HIGHEST_PROTOCOL)
+  cake.filesys.writeFile(path, data + MANIFEST_MAGIC)
+
+def _makeZipInfo(sourceStat, targetPath):
   targetPath = targetPath.replace("\\", "/") # Zips use forward slashes
-  utcTime = time.gmtime(os.stat(sourcePath).st_mtime)
+  utcTime = time.gmtime(sourceStat.st_mtime)
   
-  if os.path.isdir(sourcePath):
+  if stat.S_ISDIR(sourceStat.st_mode):
     if not targetPath.endswith("/"):
       targetPath += "/" # Trailing slash denotes directory for some zip packages
 
     zi = zipfile.ZipInfo(targetPath, utcTime[0:6])
     zi.compress_type = zipfile.ZIP_DEFLATED
     zi.external_attr = 0x00000010 # FILE_ATTRIBUTE_DIRECTORY
+  else:
+    zi = zipfile.ZipInfo(targetPath, utcTime[0:6])
+    zi.compress_type = zipfile.ZIP_DEFLATED
+    zi.external_attr = 0x00000020 # FILE_ATTRIBUTE_ARCHIVE
+  return zi
+
+def writeFileToZip(zipFile, sourcePath, targetPath):
+  """Write a source file or directory to a zip.
+  
+  @param zipFile: The zip file object to write to.
+  @type zipFile: zipfile.ZipFile
+  @param sourcePath: The path to the source file or directory.
+  @type sourcePath: string
+  @param targetPath: The target path within the zip.
+  @param targetPath: string 
+  """
+  sourceStat = os.stat(sourcePath)
+  if stat.S_ISDIR(sourceStat.st_mode):
+    zi = _makeZipInfo(sourceStat, targetPath)
     zipFile.writestr(zi, "")
   else:  
     f = open(sourcePath, "rb")
@@ -101,11 +242,530 @@ def writeFileToZip(zipFile, sourcePath, targetPath):
     finally:
       f.close()
     
-    zi = zipfile.ZipInfo(targetPath, utcTime[0:6])
-    zi.compress_type = zipfile.ZIP_DEFLATED
-    zi.external_attr = 0x00000020 # FILE_ATTRIBUTE_ARCHIVE
+    zi = _makeZipInfo(sourceStat, targetPath)
     zipFile.writestr(zi, data)
-    
+
+class _Chunk(object):
+  """A piece of a file to be compressed by a worker thread.
+  """
+
+  def __init__(self, zipInfo, sourcePath, offset, size, first, last):
+    self.zipInfo = zipInfo
+    self.sourcePath = sourcePath
+    self.offset = offset
+    self.size = size
+    self.first = first
+    self.last = last
+    self.data = None
+    self.compressed = None
+    self.error = None
+    self.done = threading.Event()
+
+  def compress(self):
+    try:
+      f = open(self.sourcePath, "rb")
+      try:
+        f.seek(self.offset)
+        data = f.read(self.size)
+      finally:
+        f.close()
+      if len(data) != self.size:
+        raise EnvironmentError(
+          "%s changed size while being compressed" % self.sourcePath)
+
+      # Each chunk is compressed independently. Chunks before the last end
+      # with a sync flush so that their concatenation is a single deflate
+      # stream.
+      compressor = zlib.compressobj(
+        zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+      if self.last:
+        flush = zlib.Z_FINISH
+      else:
+        flush = zlib.Z_SYNC_FLUSH
+      self.compressed = compressor.compress(data) + compressor.flush(flush)
+      self.data = data
+    except Exception as e:
+      self.error = e
+    self.done.set()
+
+_ZIP64_LIMIT = (1 << 31) - 1
+"""Sizes and offsets larger than this are written using the Zip64
+extensions, matching zipfile.ZIP64_LIMIT.
+"""
+
+_UTF8_FLAG = 0x800
+
+def _dosDateTime(zipInfo):
+  year, month, day, hour, minute, second = zipInfo.date_time
+  dosDate = (year - 1980) << 9 | month << 5 | day
+  dosTime = hour << 11 | minute << 5 | second // 2
+  return dosDate, dosTime
+
+def _encodeFilename(zipInfo):
+  try:
+    return zipInfo.filename.encode("ascii"), zipInfo.flag_bits & ~_UTF8_FLAG
+  except UnicodeEncodeError:
+    return zipInfo.filename.encode("utf-8"), zipInfo.flag_bits | _UTF8_FLAG
+
+def _stripZip64Extra(extra):
+  """Remove any Zip64 extended information field from an extra field.
+  """
+  fields = []
+  i = 0
+  while i + 4 <= len(extra):
+    fieldId, length = struct.unpack("<HH", extra[i:i+4])
+    j = i + 4 + length
+    if fieldId != 0x0001:
+      fields.append(extra[i:j])
+    i = j
+  return b"".join(fields)
+
+class ZipWriter(object):
+  """Writes the entries and central directory of a zip from data that
+  has already been compressed.
+
+  Only the public attributes of zipfile.ZipInfo are used so that entries
+  read by zipfile.ZipFile can be kept in the central directory without
+  being copied.
+  """
+
+  def __init__(self, file, entries=(), comment=b""):
+    """Start writing entries at the current position of a file.
+
+    @param file: A seekable file object opened for writing.
+    @type file: file
+    @param entries: Entries already in the file, before the current
+    position, to list in the central directory.
+    @type entries: list of zipfile.ZipInfo
+    @param comment: The comment of the zip.
+    @type comment: bytes
+    """
+    self.file = file
+    self.entries = list(entries)
+    self.comment = comment
+    self._entry = None
+
+  def startEntry(self, zipInfo):
+    """Write the local header of an entry.
+
+    The entry's CRC and sizes are filled in by L{write} and L{endEntry}.
+
+    @param zipInfo: The entry. Its file_size must be set to the size of
+    the uncompressed data that will be written.
+    @type zipInfo: zipfile.ZipInfo
+    """
+    zipInfo.header_offset = self.file.tell()
+    zipInfo.CRC = 0
+    zipInfo.compress_size = 0
+    zip64 = zipInfo.file_size * 1.05 > _ZIP64_LIMIT
+    if zip64:
+      zipInfo.extract_version = max(zipInfo.extract_version, 45)
+      zipInfo.create_version = max(zipInfo.create_version, 45)
+      extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0)
+      size = 0xFFFFFFFF
+    else:
+      extra = b""
+      size = 0
+    extra += _stripZip64Extra(zipInfo.extra)
+
+    filename, flagBits = _encodeFilename(zipInfo)
+    zipInfo.flag_bits = flagBits & ~0x08 # No data descriptor
+    dosDate, dosTime = _dosDateTime(zipInfo)
+    self.file.write(struct.pack(
+      "<4s2B4HL2L2H",
+      b"PK\x03\x04",
+      zipInfo.extract_version,
+      0,
+      zipInfo.flag_bits,
+      zipInfo.compress_type,
+      dosTime,
+      dosDate,
+      0,
+      size,
+      size,
+      len(filename),
+      len(extra),
+      ))
+    self.file.write(filename)
+    self.file.write(extra)
+    self._entry = (zipInfo, zip64, 0)
+
+  def write(self, data, compressed):
+    """Write some of the data of the current entry.
+
+    @param data: The uncompressed data, used to calculate the CRC.
+    @type data: bytes
+    @param compressed: The data as it is stored in the zip.
+    @type compressed: bytes
+    """
+    zipInfo, zip64, crc = self._entry
+    self.file.write(compressed)
+    zipInfo.compress_size += len(compressed)
+    self._entry = (zipInfo, zip64, zlib.crc32(data, crc))
+
+  def endEntry(self):
+    """Fill in the CRC and sizes of the current entry's local header.
+
+    @raise zipfile.LargeZipFile: If the entry turned out to need the Zip64
+    extensions after its local header was written without them.
+    """
+    zipInfo, zip64, crc = self._entry
+    self._entry = None
+    zipInfo.CRC = crc & 0xFFFFFFFF
+    if not zip64 and max(zipInfo.file_size, zipInfo.compress_size) > _ZIP64_LIMIT:
+      raise zipfile.LargeZipFile(
+        "%s grew too large while being written" % zipInfo.filename)
+
+    end = self.file.tell()
+    self.file.seek(zipInfo.header_offset + 14)
+    if zip64:
+      filename, _ = _encodeFilename(zipInfo)
+      self.file.write(struct.pack("<L", zipInfo.CRC))
+      self.file.seek(zipInfo.header_offset + 30 + len(filename) + 4)
+      self.file.write(struct.pack("<QQ", zipInfo.file_size, zipInfo.compress_size))
+    else:
+      self.file.write(struct.pack(
+        "<LLL", zipInfo.CRC, zipInfo.compress_size, zipInfo.file_size))
+    self.file.seek(end)
+    self.entries.append(zipInfo)
+
+  def writeEntry(self, zipInfo, data):
+    """Write an entry whose data is compressed by the calling thread.
+
+    @param zipInfo: The entry.
+    @type zipInfo: zipfile.ZipInfo
+    @param data: The uncompressed data of the entry.
+    @type data: bytes
+    """
+    if zipInfo.compress_type == zipfile.ZIP_DEFLATED:
+      compressor = zlib.compressobj(
+        zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+      compressed = compressor.compress(data) + compressor.flush()
+    else:
+      compressed = data
+    zipInfo.file_size = len(data)
+    self.startEntry(zipInfo)
+    self.write(data, compressed)
+    self.endEntry()
+
+  def close(self):
+    """Write the central directory and truncate the file after it.
+
+    An entry that was started but not ended is left out.
+    """
+    if self._entry is not None:
+      self.file.seek(self._entry[0].header_offset)
+      self._entry = None
+
+    f = self.file
+    startDir = f.tell()
+    for zipInfo in self.entries:
+      fileSize = zipInfo.file_size
+      compressSize = zipInfo.compress_size
+      headerOffset = zipInfo.header_offset
+      zip64Fields = []
+      if fileSize > _ZIP64_LIMIT:
+        zip64Fields.append(fileSize)
+        fileSize = 0xFFFFFFFF
+      if compressSize > _ZIP64_LIMIT:
+        zip64Fields.append(compressSize)
+        compressSize = 0xFFFFFFFF
+      if headerOffset > _ZIP64_LIMIT:
+        zip64Fields.append(headerOffset)
+        headerOffset = 0xFFFFFFFF
+
+      extra = _stripZip64Extra(zipInfo.extra)
+      extractVersion = zipInfo.extract_version
+      createVersion = zipInfo.create_version
+      if zip64Fields:
+        extra = struct.pack(
+          "<HH%iQ" % len(zip64Fields),
+          0x0001,
+          8 * len(zip64Fields),
+          *zip64Fields
+          ) + extra
+        extractVersion = max(extractVersion, 45)
+        createVersion = max(createVersion, 45)
+
+      filename, flagBits = _encodeFilename(zipInfo)
+      dosDate, dosTime = _dosDateTime(zipInfo)
+      f.write(struct.pack(
+        "<4s4B4HL2L5H2L",
+        b"PK\x01\x02",
+        createVersion,
+        zipInfo.create_system,
+        extractVersion,
+        0,
+        flagBits,
+        zipInfo.compress_type,
+        dosTime,
+        dosDate,
+        zipInfo.CRC,
+        compressSize,
+        fileSize,
+        len(filename),
+        len(extra),
+        len(zipInfo.comment),
+        0,
+        zipInfo.internal_attr,
+        zipInfo.external_attr,
+        headerOffset,
+        ))
+      f.write(filename)
+      f.write(extra)
+      f.write(zipInfo.comment)
+
+    endDir = f.tell()
+    count = len(self.entries)
+    sizeDir = endDir - startDir
+    offsetDir = startDir
+    if count >= 0xFFFF or sizeDir > _ZIP64_LIMIT or offsetDir > _ZIP64_LIMIT:
+      f.write(struct.pack(
+        "<4sQ2H2L4Q", b"PK\x06\x06", 44, 45, 45, 0, 0,
+        count, count, sizeDir, offsetDir,
+        ))
+      f.write(struct.pack("<4sLQL", b"PK\x06\x07", 0, endDir, 1))
+      count = min(count, 0xFFFF)
+      sizeDir = min(sizeDir, 0xFFFFFFFF)
+      offsetDir = min(offsetDir, 0xFFFFFFFF)
+    f.write(struct.pack(
+      "<4s4H2LH", b"PK\x05\x06", 0, 0, count, count,
+      sizeDir, offsetDir, len(self.comment),
+      ))
+    f.write(self.comment)
+    f.truncate()
+
+def _iterChunks(files, chunkSize):
+  for item in files:
+    sourcePath, targetPath = item[:2]
+    if len(item) > 2:
+      sourceStat = item[2]
+    else:
+      sourceStat = os.stat(sourcePath)
+
+    zipInfo = _makeZipInfo(sourceStat, targetPath)
+    if stat.S_ISDIR(sourceStat.st_mode):
+      yield _Chunk(zipInfo, None, 0, 0, True, True)
+      continue
+
+    size = zipInfo.file_size = sourceStat.st_size
+    offset = 0
+    while True:
+      chunk = min(chunkSize, size - offset)
+      last = offset + chunk >= size
+      yield _Chunk(zipInfo, sourcePath, offset, chunk, offset == 0, last)
+      if last:
+        break
+      offset += chunk
+
+_threadPool = None
+_threadPoolLock = threading.Lock()
+
+def _getThreadPool():
+  global _threadPool
+  _threadPoolLock.acquire()
+  try:
+    if _threadPool is None:
+      _threadPool = cake.threadpool.ThreadPool(
+        cake.threadpool.getProcessorCount())
+    return _threadPool
+  finally:
+    _threadPoolLock.release()
+
+def writeFilesToZip(
+  zipWriter,
+  files,
+  window=COMPRESS_WINDOW,
+  chunkSize=COMPRESS_CHUNK_SIZE,
+  ):
+  """Write source files and directories to a zip, compressing them in
+  parallel.
+
+  Files are split into chunks that are read and compressed by a pool of
+  worker threads. The calling thread writes the compressed chunks to the
+  zip in order.
+
+  @param zipWriter: The zip writer to write to.
+  @type zipWriter: L{ZipWriter}
+  @param files: A list of (sourcePath, targetPath) tuples giving the
+  path of each source file or directory and its path within the zip.
+  Each tuple may also contain the stat result of the source file if it
+  is already known.
+  @type files: list of tuples
+  @param window: The maximum number of chunks being compressed or
+  waiting to be written at once. This bounds the memory used to
+  window * chunkSize uncompressed bytes plus their compressed data.
+  @type window: int
+  @param chunkSize: The size of the chunks files are split into.
+  @type chunkSize: int
+  """
+  threadPool = _getThreadPool()
+  chunks = _iterChunks(files, max(chunkSize, 1))
+  inFlight = collections.deque()
+
+  def queueChunk():
+    chunk = next(chunks, None)
+    if chunk is None:
+      return
+    if chunk.sourcePath is None:
+      chunk.done.set() # Directories have nothing to compress
+    else:
+      threadPool.queueJob(chunk.compress)
+    inFlight.append(chunk)
+
+  for _ in range(max(window, 1)):
+    queueChunk()
+
+  while inFlight:
+    chunk = inFlight.popleft()
+    chunk.done.wait()
+    queueChunk()
+    if chunk.error is not None:
+      raise chunk.error
+
+    if chunk.sourcePath is None:
+      zipWriter.writeEntry(chunk.zipInfo, b"")
+      continue
+
+    if chunk.first:
+      zipWriter.startEntry(chunk.zipInfo)
+    zipWriter.write(chunk.data, chunk.compressed)
+    chunk.data = chunk.compressed = None
+    if chunk.last:
+      zipWriter.endEntry()
+
+def _getEntryExtent(f, zipInfo):
+  """Find the bytes taken up by an entry's local header and data.
+  """
+  start = zipInfo.header_offset
+  f.seek(start)
+  header = f.read(30)
+  if len(header) != 30 or header[:4] != b"PK\x03\x04":
+    raise zipfile.BadZipfile("Bad local header for %s" % zipInfo.filename)
+  nameLength, extraLength = struct.unpack("<HH", header[26:30])
+  end = start + 30 + nameLength + extraLength + zipInfo.compress_size
+
+  if zipInfo.flag_bits & 0x08:
+    # The sizes and CRC follow the data in a data descriptor.
+    zip64 = max(zipInfo.compress_size, zipInfo.file_size) > zipfile.ZIP64_LIMIT
+    f.seek(end)
+    if f.read(4) == b"PK\x07\x08":
+      end += 4
+    end += 20 if zip64 else 12
+  return start, end
+
+def _copyBytes(source, target, start, end):
+  source.seek(start)
+  remaining = end - start
+  while remaining > 0:
+    data = source.read(min(remaining, EXTRACT_BUFFER_SIZE))
+    if not data:
+      raise EOFError("Unexpected end of zip")
+    target.write(data)
+    remaining -= len(data)
+
+def updateZip(
+  zipPath,
+  files,
+  removeNames,
+  compactRatio=COMPACT_RATIO,
+  window=COMPRESS_WINDOW,
+  chunkSize=COMPRESS_CHUNK_SIZE,
+  ):
+  """Update a zip in place, adding and removing entries.
+
+  Entries that are removed, or replaced by a file with the same name,
+  are dropped from the central directory. Their data is left in place as
+  unused space unless it is at the end of the zip, where it is
+  overwritten by the new entries. Unchanged entries are never
+  recompressed. If the unused space grows beyond compactRatio of the
+  zip, the zip is rewritten without it by copying the compressed data of
+  the remaining entries.
+
+  @param zipPath: The path of the zip to update.
+  @type zipPath: string
+  @param files: A list of (sourcePath, targetPath) tuples of the files
+  and directories to add, see L{writeFilesToZip}.
+  @type files: list of (string, string) tuples
+  @param removeNames: The names of the entries to remove.
+  @type removeNames: list of string
+  @param compactRatio: The fraction of the zip that may be unused before
+  it is compacted.
+  @type compactRatio: float
+  @param window: See L{writeFilesToZip}.
+  @type window: int
+  @param chunkSize: See L{writeFilesToZip}.
+  @type chunkSize: int
+
+  @return: True if the zip was compacted.
+  @rtype: bool
+  """
+  removeNames = set(removeNames)
+  for item in files:
+    targetPath = item[1].replace("\\", "/")
+    removeNames.add(targetPath)
+    removeNames.add(targetPath + "/")
+
+  f = open(zipPath, "r+b")
+  try:
+    zipFile = zipfile.ZipFile(f, "r")
+    try:
+      zipInfos = zipFile.infolist()
+      comment = zipFile.comment
+      # Only the last of several entries with the same name is used.
+      live = [
+        z for z in zipInfos
+        if z.filename not in removeNames and zipFile.getinfo(z.filename) is z
+        ]
+    finally:
+      zipFile.close()
+    extents = [_getEntryExtent(f, z) for z in live]
+
+    if zipInfos:
+      dataStart = min(z.header_offset for z in zipInfos)
+    else:
+      # An empty zip is just its end of central directory record.
+      f.seek(0, os.SEEK_END)
+      dataStart = f.tell() - 22 - len(comment)
+    if extents:
+      dataEnd = max(end for _, end in extents)
+    else:
+      dataEnd = dataStart
+    liveSize = sum(end - start for start, end in extents)
+    unused = dataEnd - dataStart - liveSize
+
+    if unused <= compactRatio * (dataEnd - dataStart):
+      # New entries overwrite anything after the last live entry.
+      f.seek(dataEnd)
+      zipWriter = ZipWriter(f, live, comment)
+      try:
+        writeFilesToZip(zipWriter, files, window=window, chunkSize=chunkSize)
+      finally:
+        zipWriter.close()
+      return False
+
+    # Compact the zip by copying the live entries to a new zip.
+    tempPath = "%s.%i.tmp" % (zipPath, os.getpid())
+    t = open(tempPath, "wb")
+    try:
+      _copyBytes(f, t, 0, dataStart)
+      for zipInfo, (start, end) in sorted(zip(live, extents), key=lambda x: x[1]):
+        zipInfo.header_offset = t.tell()
+        _copyBytes(f, t, start, end)
+      zipWriter = ZipWriter(t, live, comment)
+      writeFilesToZip(zipWriter, files, window=window, chunkSize=chunkSize)
+      zipWriter.close()
+    except:
+      t.close()
+      cake.filesys.remove(tempPath)
+      raise
+    t.close()
+  finally:
+    f.close()
+
+  os.replace(tempPath, zipPath)
+  return True
+
 def zipFiles(sourcePath, targetZip):
   """Zip a file or the contents of a directory.
   
@@ -122,11 +782,12 @@ def zipFiles(sourcePath, targetZip):
   cake.filesys.makeDirs(os.path.dirname(targetZip))
   f = open(targetZip, "wb")
   try:
-    zipFile = zipfile.ZipFile(f, "w")
-    for originalPath in toZip.values():
-      sourceFilePath = os.path.join(sourcePath, originalPath)
-      writeFileToZip(zipFile, sourceFilePath, originalPath)
-    zipFile.close()
+    zipWriter = ZipWriter(f)
+    writeFilesToZip(zipWriter, [
+      (os.path.join(sourcePath, originalPath), originalPath)
+      for originalPath in toZip.values()
+      ])
+    zipWriter.close()
   finally:
     f.close()
   return toZip.values()
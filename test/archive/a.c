@@ -0,0 +1,4 @@
+int A()
+{
+  return 0;
+}
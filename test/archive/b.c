@@ -0,0 +1,4 @@
+int B()
+{
+  return 0;
+}
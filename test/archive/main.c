@@ -0,0 +1,7 @@
+int A();
+int B();
+
+int main()
+{
+  return A() + B();
+}
@@ -0,0 +1,29 @@
+import cake.system
+from cake.test.framework import caketest
+
+@caketest(fixture="archive", config="c_library")
+def testIncrementalArchive(t):
+  out = t.runCake()
+  out.checkSucceeded()
+  out.checkHasLines(["Archiving libab.a", "Archiving libthin.a"])
+
+  t.runCake().checkBuildWasNoop()
+
+  t.writeTextFile("a.c", "int A()\n{\n  return 1;\n}\n")
+
+  out = t.runCake("--debug=reason,run")
+  out.checkSucceeded()
+  out.checkHasLine("Updating 'libab.a' in place: 1 changed, 0 removed.")
+  out.checkHasLineMatching("run: .*ar -rs libab\\.a obj/a\\.o$")
+  out.checkHasLines(["Linking main", "Linking thinmain"])
+
+  t.runCake().checkBuildWasNoop()
+
+@caketest(fixture="archive", config="c_library")
+def testThinArchive(t):
+  out = t.runCake()
+  out.checkSucceeded()
+
+  contents = t.readFileContents("libthin.a")
+  if contents is not None and not contents.startswith(b"!<thin>"):
+    t.reporter.error("'libthin.a' should be a thin archive.")
@@ -0,0 +1,6 @@
+#include "common.h"
+
+int B()
+{
+  return 2;
+}
@@ -0,0 +1,7 @@
+#ifndef COMMON_H
+#define COMMON_H
+
+int A();
+int B();
+
+#endif
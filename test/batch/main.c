@@ -0,0 +1,6 @@
+#include "common.h"
+
+int main()
+{
+  return A() + B() == 3 ? 0 : 1;
+}
@@ -0,0 +1,54 @@
+import os.path
+
+import cake.system
+from cake.test.framework import caketest
+
+@caketest(fixture="batch", config="c_library")
+def testBatchCompile(t):
+  out = t.runCake("--debug=run")
+  out.checkSucceeded()
+  out.checkHasLines(["Compiling main.c", "Compiling a.c", "Compiling b.c"])
+  out.checkHasLineMatching("run: .* -c .*main\\.c .*a\\.c .*b\\.c$")
+
+  t.runCake().checkBuildWasNoop()
+
+  t.writeTextFile("a.c", "int A()\n{\n  return 1;\n}\n")
+
+  out = t.runCake()
+  out.checkSucceeded()
+  out.checkHasLine("Compiling a.c")
+  out.checkNoLine("Compiling b.c")
+
+@caketest(fixture="batch", config="c_library")
+def testBatchCompileRunsInBaseDir(t):
+  out = t.runCake("--debug=run")
+  out.checkSucceeded()
+  # The same relative paths are passed as for a single compile.
+  out.checkHasLineMatching("run: .* -c .* main\\.c a\\.c b\\.c$")
+  for name in ["main.o", "a.o", "b.o", "main.d", "a.d", "b.d"]:
+    if os.path.exists(t.abspath(name)):
+      t.reporter.error("%s was left in the base directory" % name)
+
+@caketest(fixture="batch", config="c_library")
+def testBatchCompileFailure(t):
+  t.writeTextFile("a.c", "#warning a warning\nint A()\n{\n  return 1;\n}\n")
+  t.writeTextFile("b.c", "int B()\n{\n  return 2\n}\n")
+
+  out = t.runCake()
+  out.checkFailed()
+  # Each object's output is reported, including warnings from objects
+  # that compiled, and failed objects aren't compiled again.
+  out.checkHasLineMatching(".*a\\.c:.*warning.*a warning")
+  out.checkHasLineMatching(".*b\\.c:.*error.*")
+  out.checkHasLineMatching(".*: failed to compile b\\.c")
+  if out.lines.count("Compiling b.c") != 1:
+    t.reporter.error("b.c was compiled more than once")
+  t.checkFileExists("obj/a.o")
+
+  t.writeTextFile("b.c", "int B()\n{\n  return 2;\n}\n")
+
+  out = t.runCake()
+  out.checkSucceeded()
+  out.checkHasLine("Compiling b.c")
+  out.checkNoLine("Compiling a.c")
+  out.checkNoLine("Compiling main.c")
@@ -31,3 +31,50 @@ def testCompileProgramUsingLibrary(t):
 
   t.runCake("main").checkBuildWasNoop()
   t.runCake("printer").checkBuildWasNoop()
+
+@caketest(fixture="c_library")
+def testModifyAndRebuildCLibraryWithDepsLog(t):
+  config = t.readFileContents("config.cake").decode("utf8")
+  t.writeTextFile("config.cake", config + "\n".join([
+    "",
+    "configuration.engine.depsLogPath = configuration.abspath('deps.log')",
+    "",
+    ]))
+
+  t.runCake().checkSucceeded()
+  t.checkFileExists("deps.log")
+  t.runCake().checkBuildWasNoop()
+
+  t.touchFile("foo.h")
+
+  out = t.runCake()
+  out.checkSucceeded()
+  out.checkHasLine("Compiling foo.c")
+
+@caketest(fixture="c_library")
+def testCompilerOutputPrefix(t):
+  config = t.readFileContents("config.cake").decode("utf8")
+  t.writeTextFile("config.cake", config + "\n".join([
+    "",
+    "variant.tools['compiler'].prefixOutput = True",
+    "",
+    ]))
+  t.writeTextFile("foo.c", "int Foo()\n{\n  return 1\n}\n")
+
+  out = t.runCake()
+  out.checkFailed()
+  out.checkHasLineMatching("\\[foo\\.(o|obj)\\] .*foo\\.c.*error.*")
+
+@caketest(fixture="c_library")
+def testStreamedCompilerOutputIsPrefixed(t):
+  config = t.readFileContents("config.cake").decode("utf8")
+  t.writeTextFile("config.cake", config + "\n".join([
+    "",
+    "variant.tools['compiler'].streamOutput = True",
+    "",
+    ]))
+  t.writeTextFile("foo.c", "int Foo()\n{\n  return 1\n}\n")
+
+  out = t.runCake()
+  out.checkFailed()
+  out.checkHasLineMatching("\\[foo\\.(o|obj)\\] .*foo\\.c.*error.*")
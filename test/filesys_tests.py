@@ -58,3 +58,172 @@ def testCopyAlwaysIfUpToDate(t):
   output.checkHasLine("Copying readme.txt to doc.txt")
 
   t.checkFilesAreSame("readme.txt", "doc.txt")
+
+def _writeCopyDirectoryScript(t):
+  t.writeTextFile("copydir.cake", "\n".join([
+    "from cake.tools import filesys, script",
+    "filesys.copyDirectory(",
+    "  sourceDir=script.cwd('src'),",
+    "  targetDir=script.cwd('dst'),",
+    "  removeStale=True,",
+    "  )",
+    "",
+    ]))
+  t.writeTextFile("src/a.txt", "a")
+  t.writeTextFile("src/sub/b.txt", "b")
+
+@caketest(fixture="copyfile")
+def testCopyDirectory(t):
+  _writeCopyDirectoryScript(t)
+
+  output = t.runCake("copydir.cake")
+  output.checkSucceeded()
+  output.checkHasLines([
+    "Copying src/a.txt to dst/a.txt",
+    "Copying src/sub/b.txt to dst/sub/b.txt",
+    ])
+  t.checkFilesAreSame("src/sub/b.txt", "dst/sub/b.txt")
+
+  t.runCake("copydir.cake").checkBuildWasNoop()
+
+@caketest(fixture="copyfile")
+def testCopyDirectoryRemovesStaleFiles(t):
+  _writeCopyDirectoryScript(t)
+  t.runCake("copydir.cake").checkSucceeded()
+
+  t.writeTextFile("dst/stale.txt", "stale")
+  t.writeTextFile("dst/staledir/c.txt", "c")
+  output = t.runCake("copydir.cake")
+  output.checkSucceeded()
+  output.checkHasLines([
+    "Deleting dst/stale.txt",
+    "Deleting dst/staledir",
+    ])
+  output.checkNoLine("Copying src/a.txt to dst/a.txt")
+  if os.path.exists(t.abspath("dst/staledir")):
+    t.reporter.error("dst/staledir was not deleted")
+
+def _writeMirrorDirectoryScript(t, **keywords):
+  args = "".join("  %s=%r,\n" % item for item in sorted(keywords.items()))
+  t.writeTextFile("mirror.cake", "\n".join([
+    "from cake.tools import filesys, script",
+    "filesys.mirrorWorkers = 2",
+    "filesys.mirrorDirectory(",
+    "  sourceDir=script.cwd('src'),",
+    "  targetDir=script.cwd('dst'),",
+    args + "  )",
+    "",
+    ]))
+  t.writeTextFile("src/a.txt", "a")
+  t.writeTextFile("src/sub/b.txt", "b")
+  t.writeTextFile("src/sub/c.txt", "c")
+
+@caketest(fixture="copyfile")
+def testMirrorDirectory(t):
+  _writeMirrorDirectoryScript(t)
+
+  output = t.runCake("mirror.cake")
+  output.checkSucceeded()
+  output.checkHasLines([
+    "Copying src/a.txt to dst/a.txt",
+    "Copying src/sub/b.txt to dst/sub/b.txt",
+    "Copying src/sub/c.txt to dst/sub/c.txt",
+    ])
+  t.checkFilesAreSame("src/sub/b.txt", "dst/sub/b.txt")
+
+  t.runCake("mirror.cake").checkBuildWasNoop()
+
+  t.writeTextFile("src/sub/b.txt", "changed")
+  t.writeTextFile("dst/stale.txt", "stale")
+  output = t.runCake("mirror.cake")
+  output.checkSucceeded()
+  output.checkHasLines([
+    "Copying src/sub/b.txt to dst/sub/b.txt",
+    "Deleting dst/stale.txt",
+    ])
+  output.checkNoLine("Copying src/a.txt to dst/a.txt")
+  t.checkFilesAreSame("src/sub/b.txt", "dst/sub/b.txt")
+
+  # Changes to the target are overwritten too.
+  t.writeTextFile("dst/a.txt", "modified")
+  output = t.runCake("mirror.cake")
+  output.checkSucceeded()
+  output.checkHasLine("Copying src/a.txt to dst/a.txt")
+  t.checkFilesAreSame("src/a.txt", "dst/a.txt")
+
+@caketest(fixture="copyfile")
+def testMirrorDirectoryComparesDigests(t):
+  _writeMirrorDirectoryScript(t, compareDigests=True)
+  t.runCake("mirror.cake").checkSucceeded()
+
+  path = t.abspath("src/a.txt")
+  stat = os.stat(path)
+  os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 * 10**9))
+  t.runCake("mirror.cake").checkBuildWasNoop()
+
+@caketest(fixture="copyfile")
+def testMirrorDirectoryWithHardLinks(t):
+  _writeMirrorDirectoryScript(t, useHardLinks=True)
+
+  output = t.runCake("mirror.cake")
+  output.checkSucceeded()
+  output.checkHasLine("Linking src/sub/b.txt to dst/sub/b.txt")
+  if not os.path.samefile(t.abspath("src/sub/b.txt"), t.abspath("dst/sub/b.txt")):
+    t.reporter.error("dst/sub/b.txt is not a hard link to src/sub/b.txt")
+
+  t.runCake("mirror.cake").checkBuildWasNoop()
+
+@caketest(fixture="copyfile")
+def testListingCache(t):
+  config = t.readFileContents("config.cake").decode("utf8")
+  t.writeTextFile("config.cake", config + "\n".join([
+    "",
+    "configuration.engine.listingCachePath = configuration.abspath('listings.cache')",
+    "",
+    ]))
+  t.writeTextFile("globbed.cake", "\n".join([
+    "from cake.tools import filesys, script",
+    "for path in filesys.findFiles(script.cwd('src')):",
+    "  if path.endswith('.txt'):",
+    "    filesys.copyFile(script.cwd('src', path), script.cwd('dst', path))",
+    "filesys.copyFiles(filesys.glob(script.cwd('src/*.c')), script.cwd('dst'))",
+    "",
+    ]))
+  t.writeTextFile("src/a.txt", "a")
+  t.writeTextFile("src/a.c", "a")
+
+  output = t.runCake("globbed.cake")
+  output.checkSucceeded()
+  output.checkHasLines([
+    "Copying src/a.txt to dst/a.txt",
+    "Copying src/a.c to dst/a.c",
+    ])
+  t.checkFileExists("listings.cache")
+  t.runCake("globbed.cake").checkBuildWasNoop()
+
+  # New files change the directory's listing.
+  t.writeTextFile("src/b.txt", "b")
+  t.writeTextFile("src/b.c", "b")
+  output = t.runCake("globbed.cake")
+  output.checkSucceeded()
+  output.checkHasLines([
+    "Copying src/b.txt to dst/b.txt",
+    "Copying src/b.c to dst/b.c",
+    ])
+  output.checkNoLine("Copying src/a.txt to dst/a.txt")
+
+@caketest(fixture="copyfile")
+def testMirrorDirectoryCopiesOverHardLinks(t):
+  _writeMirrorDirectoryScript(t, useHardLinks=True)
+  t.runCake("mirror.cake").checkSucceeded()
+
+  # Copying over the links must not truncate the sources they share.
+  _writeMirrorDirectoryScript(t, useHardLinks=False)
+  output = t.runCake("mirror.cake")
+  output.checkSucceeded()
+  output.checkHasLine("Copying src/sub/b.txt to dst/sub/b.txt")
+  if t.readFileContents("src/sub/b.txt") != b"b":
+    t.reporter.error("src/sub/b.txt was changed by the copy")
+  t.checkFilesAreSame("src/sub/b.txt", "dst/sub/b.txt")
+  if os.path.samefile(t.abspath("src/sub/b.txt"), t.abspath("dst/sub/b.txt")):
+    t.reporter.error("dst/sub/b.txt is still a hard link to src/sub/b.txt")
@@ -0,0 +1,6 @@
+#define EXPORT __attribute__((visibility("default")))
+
+EXPORT int foo()
+{
+  return 1;
+}
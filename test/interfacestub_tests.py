@@ -0,0 +1,48 @@
+import cake.system
+from cake.test.framework import caketest
+
+@caketest(fixture="interfacestub", config="c_library")
+def testRelinkOnlyWhenInterfaceChanges(t):
+  out = t.runCake()
+  out.checkSucceeded()
+  out.checkHasLines(["Linking libfoo.so", "Linking main"])
+  t.checkFileExists("libfoo.so.ifs")
+
+  t.runCake().checkBuildWasNoop()
+
+  # Changing the implementation doesn't relink main.
+  t.writeTextFile("foo.c",
+    "#define EXPORT __attribute__((visibility(\"default\")))\n"
+    "\n"
+    "EXPORT int foo()\n{\n  return 2;\n}\n")
+
+  out = t.runCake()
+  out.checkSucceeded()
+  out.checkHasLine("Linking libfoo.so")
+  out.checkNoLine("Linking main")
+
+  # Adding an exported function does.
+  t.writeTextFile("foo.c",
+    "#define EXPORT __attribute__((visibility(\"default\")))\n"
+    "\n"
+    "EXPORT int foo()\n{\n  return 2;\n}\n"
+    "\n"
+    "EXPORT int bar()\n{\n  return 3;\n}\n")
+
+  out = t.runCake()
+  out.checkSucceeded()
+  out.checkHasLines(["Linking libfoo.so", "Linking main"])
+
+  t.runCake().checkBuildWasNoop()
+
+@caketest(fixture="interfacestub", config="c_library")
+def testDeletedStubIsRebuilt(t):
+  t.runCake().checkSucceeded()
+
+  t.removeFile("libfoo.so.ifs")
+  out = t.runCake()
+  out.checkSucceeded()
+  out.checkHasLine("Linking libfoo.so")
+  t.checkFileExists("libfoo.so.ifs")
+
+  t.runCake().checkBuildWasNoop()
@@ -0,0 +1,34 @@
+from cake.test.framework import caketest
+
+def _writeWarnings(t, name, count):
+  t.writeTextFile(name + ".c", "".join(
+    "#warning from-%s-%i\n" % (name, i) for i in range(count)
+    ))
+
+@caketest(fixture="c_library")
+def testGroupedCompilerOutput(t):
+  _writeWarnings(t, "a", 200)
+  _writeWarnings(t, "b", 200)
+  t.writeTextFile("build.cake", "\n".join([
+    "from cake.tools import compiler, script",
+    "compiler.streamOutput = True",
+    "compiler.objects(",
+    "  targetDir=script.cwd('obj'),",
+    "  sources=script.cwd(['a.c', 'b.c']),",
+    "  )",
+    "",
+    ]))
+
+  out = t.runCake("-j2", "--group-output")
+  out.checkSucceeded()
+
+  # Both compilers produce several lines per warning, and all of the
+  # lines of each must be written together.
+  owners = []
+  for line in out.lines:
+    for name in ("a", "b"):
+      if "from-%s-" % name in line and (not owners or owners[-1] != name):
+        owners.append(name)
+  if sorted(owners) != ["a", "b"]:
+    t.reporter.error(
+      "output of a.c and b.c was interleaved: %s" % "".join(owners))
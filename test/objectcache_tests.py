@@ -0,0 +1,75 @@
+import cake.system
+from cake.test.framework import caketest
+
+def _renameBuildDir(t, workspace):
+  t.writeTextFile(workspace + "/build.cake", "\n".join([
+    "from cake.tools import compiler, script",
+    "objects = compiler.objects(",
+    "  targetDir=script.cwd('renamed'),",
+    "  sources=[script.cwd('foo.c')],",
+    "  )",
+    "",
+    ]))
+
+@caketest(fixture="objectcache")
+def testObjectCacheHitInOtherWorkspace(t):
+  t.copyTree("ws", "ws2")
+  _renameBuildDir(t, "ws2")
+
+  out = t.runCake(cwd="ws")
+  out.checkSucceeded()
+  out.checkHasLine("Compiling foo.c")
+
+  # Never built at this target path so only the preprocessor digest can match.
+  out = t.runCake(cwd="ws2")
+  out.checkSucceeded()
+  out.checkHasLine("Cached foo.c")
+
+  t.runCake(cwd="ws2").checkBuildWasNoop()
+
+@caketest(fixture="objectcache")
+def testObjectCacheMissAfterSourceChange(t):
+  t.copyTree("ws", "ws2")
+  _renameBuildDir(t, "ws2")
+
+  t.runCake(cwd="ws").checkSucceeded()
+
+  t.writeTextFile("ws2/foo.c", "int Foo(int x) { return x + 1; }\n")
+
+  out = t.runCake(cwd="ws2")
+  out.checkSucceeded()
+  out.checkHasLine("Compiling foo.c")
+
+@caketest(fixture="objectcache")
+def testObjectCachePrewarm(t):
+  t.writeTextFile("ws/bar.c", "int Bar(int x) { return x - 1; }\n")
+  t.writeTextFile("ws/build.cake", "\n".join([
+    "from cake.tools import compiler, script",
+    "compiler.objectCachePrewarm = True",
+    "compiler.objectCachePrewarmWindow = 2",
+    "objects = compiler.objects(",
+    "  targetDir=script.cwd('build'),",
+    "  sources=script.cwd(['foo.c', 'bar.c']),",
+    "  )",
+    "",
+    ]))
+  original = t.readFileContents("ws/foo.c").decode("utf8")
+
+  out = t.runCake(cwd="ws")
+  out.checkSucceeded()
+  out.checkHasLines(["Compiling foo.c", "Compiling bar.c"])
+
+  t.writeTextFile("ws/foo.c", "int Foo(int x) { return x + 1; }\n")
+  out = t.runCake(cwd="ws")
+  out.checkSucceeded()
+  out.checkHasLine("Compiling foo.c")
+
+  # Changing the source back finds the first object in the cache.
+  t.writeTextFile("ws/foo.c", original)
+  out = t.runCake(cwd="ws")
+  out.checkSucceeded()
+  out.checkHasLine("Cached foo.c")
+  out.checkNoLine("Compiling foo.c")
+  out.checkNoLine("Compiling bar.c")
+
+  t.runCake(cwd="ws").checkBuildWasNoop()
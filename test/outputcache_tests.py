@@ -0,0 +1,115 @@
+import sys
+from cake.test.framework import caketest
+
+def _checkContents(t, path, expected):
+  contents = t.readFileContents(path)
+  if contents != expected:
+    t.reporter.error("%s contains %r, expected %r" % (path, contents, expected))
+
+def _writeGeneratorScripts(t):
+  config = t.readFileContents("config.cake").decode("utf8")
+  t.writeTextFile("config.cake", config.replace(
+    "configuration.addVariant(variant)",
+    "\n".join([
+      "from cake.library.shell import ShellTool",
+      "variant.tools['shell'] = ShellTool(configuration=configuration)",
+      "configuration.addVariant(variant)",
+      ]),
+    ))
+  t.writeTextFile("script.cake", "\n".join([
+    "from cake.tools import script",
+    "script.objectCachePath = script.cwd('cache')",
+    "def generate():",
+    "  data = open(script.cwd('in.txt')).read()",
+    "  open(script.cwd('gen.txt'), 'w').write(data.upper())",
+    "  open(script.cwd('runs.txt'), 'a').write('run\\n')",
+    "script.run(",
+    "  generate,",
+    "  args=['upper'],",
+    "  targets=[script.cwd('gen.txt')],",
+    "  sources=[script.cwd('in.txt')],",
+    "  cacheable=True,",
+    "  )",
+    "",
+    ]))
+  t.writeTextFile("shell.cake", "\n".join([
+    "import sys",
+    "from cake.tools import script, shell",
+    "shell.objectCachePath = script.cwd('cache')",
+    "shell.run(",
+    "  args=[sys.executable, '-c', 'import shutil; shutil.copyfile(\"in.txt\", \"out/shell.txt\")'],",
+    "  targets=[script.cwd('out/shell.txt')],",
+    "  sources=[script.cwd('in.txt')],",
+    "  cwd=script.cwd(),",
+    "  cacheable=True,",
+    "  )",
+    "",
+    ]))
+  t.writeTextFile("in.txt", "abc")
+
+@caketest(fixture="copyfile")
+def testScriptOutputIsRestoredFromCache(t):
+  _writeGeneratorScripts(t)
+
+  t.runCake("script.cake").checkSucceeded()
+  _checkContents(t, "gen.txt", b"ABC")
+
+  t.removeFile("gen.txt")
+  output = t.runCake("script.cake")
+  output.checkSucceeded()
+  output.checkHasLine("Restoring gen.txt from cache")
+  _checkContents(t, "gen.txt", b"ABC")
+  _checkContents(t, "runs.txt", b"run\n")
+
+  t.runCake("script.cake").checkBuildWasNoop()
+
+  # A change to the source's contents misses the cache.
+  t.writeTextFile("in.txt", "def")
+  output = t.runCake("script.cake")
+  output.checkSucceeded()
+  output.checkNoLine("Restoring gen.txt from cache")
+  _checkContents(t, "gen.txt", b"DEF")
+
+@caketest(fixture="copyfile")
+def testShellOutputIsRestoredFromCache(t):
+  _writeGeneratorScripts(t)
+
+  output = t.runCake("shell.cake")
+  output.checkSucceeded()
+  t.checkFilesAreSame("in.txt", "out/shell.txt")
+
+  t.removeFile("out/shell.txt")
+  output = t.runCake("shell.cake")
+  output.checkSucceeded()
+  output.checkHasLine("Restoring out/shell.txt from cache")
+  output.checkNoLine("Running %s" % sys.executable)
+  t.checkFilesAreSame("in.txt", "out/shell.txt")
+
+@caketest(fixture="copyfile")
+def testScriptCacheKeyIncludesFunction(t):
+  _writeGeneratorScripts(t)
+  t.runCake("script.cake").checkSucceeded()
+
+  # Same args and sources but a different function.
+  script = t.readFileContents("script.cake").decode("utf8")
+  t.writeTextFile("script.cake", script.replace("upper()", "lower()"))
+  t.removeFile("gen.txt")
+  output = t.runCake("script.cake")
+  output.checkSucceeded()
+  output.checkNoLine("Restoring gen.txt from cache")
+  _checkContents(t, "gen.txt", b"abc")
+
+@caketest(fixture="copyfile")
+def testShellCacheKeyIncludesEnvironment(t):
+  _writeGeneratorScripts(t)
+  t.runCake("shell.cake").checkSucceeded()
+
+  script = t.readFileContents("shell.cake").decode("utf8")
+  t.writeTextFile("shell.cake", script.replace(
+    "shell.run(",
+    "shell['CAKE_TEST_VALUE'] = '1'\nshell.run(",
+    ))
+  t.removeFile("out/shell.txt")
+  output = t.runCake("shell.cake")
+  output.checkSucceeded()
+  output.checkNoLine("Restoring out/shell.txt from cache")
@@ -0,0 +1,9 @@
+#include <string>
+#include <vector>
+#include "common.h"
+
+int bSize(const Table& table)
+{
+  std::vector<int> values;
+  return (int)(table.size() + values.size());
+}
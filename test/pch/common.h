@@ -0,0 +1,10 @@
+#ifndef COMMON_H
+#define COMMON_H
+
+#include <map>
+#include <string>
+#include <vector>
+
+typedef std::map<std::string, std::vector<int> > Table;
+
+#endif
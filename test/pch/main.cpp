@@ -0,0 +1,11 @@
+#include "common.h"
+
+int aSize(const Table& table);
+int bSize(const Table& table);
+int cSize(const Table& table);
+
+int main()
+{
+  Table table;
+  return aSize(table) + bSize(table) + cSize(table);
+}
@@ -0,0 +1,39 @@
+import cake.system
+from cake.test.framework import caketest
+
+@caketest(fixture="pch", config="c_library")
+def testSuggestPch(t):
+  out = t.runCake("--suggest-pch")
+  out.checkSucceeded()
+  out.checkHasLine("  <no dependencies recorded, build the library first>")
+
+  t.runCake().checkSucceeded()
+
+  out = t.runCake("--suggest-pch")
+  out.checkSucceeded()
+  out.checkNoLine("Archiving libabc.a")
+  out.checkHasLineMatching("Precompiled header candidates for .*abc.* \\(3 of 3 objects built\\)")
+  out.checkHasLineMatching("Suggested precompiled header .*")
+  out.checkHasLinesInOrder([
+    "  #include <string>",
+    "  #include <vector>",
+    ])
+  out.checkHasLineMatching("  #include \".*common\\.h\"")
+
+@caketest(fixture="pch", config="c_library")
+def testAutoPch(t):
+  out = t.runCake("autopch.cake")
+  out.checkSucceeded()
+  out.checkHasLine("Compiling a.cpp")
+
+  # The pch is chosen using the dependencies of the first build.
+  out = t.runCake("autopch.cake", "--debug=run")
+  out.checkSucceeded()
+  out.checkHasLineMatching("run: .*-include autopch/cake-pch\\.hpp.*")
+  out.checkHasLine("Compiling a.cpp")
+
+  t.runCake("autopch.cake").checkBuildWasNoop()
+
+  contents = t.readFileContents("autopch/cake-pch.hpp")
+  if contents is not None and b"#include <vector>" not in contents:
+    t.reporter.error("'autopch/cake-pch.hpp' should include <vector>.")
@@ -0,0 +1,21 @@
+import cake.system
+from cake.test.framework import caketest
+
+@caketest(fixture="sharedcompile", config="c_library")
+def testIdenticalCompilesAreShared(t):
+  out = t.runCake()
+  out.checkSucceeded()
+  out.checkHasLine("Compiling main.c")
+  out.checkHasLine("Cached main.c")
+  t.checkFilesAreSame("release/main.o", "profile/main.o")
+
+  t.runCake().checkBuildWasNoop()
+
+  t.writeTextFile("main.c", "int main()\n{\n  return 1;\n}\n")
+
+  out = t.runCake()
+  out.checkSucceeded()
+  out.checkHasLine("Compiling main.c")
+  out.checkHasLine("Cached main.c")
+  out.checkHasLines(["Linking release/main", "Linking profile/main"])
+  t.checkFilesAreSame("release/main.o", "profile/main.o")
@@ -0,0 +1,53 @@
+import sys
+from cake.test.framework import caketest
+
+_generator = "\n".join([
+  "data = open('in.txt').read() + open('inc.txt').read()",
+  "open('out.txt', 'w').write(data)",
+  "open('out.d', 'w').write('out.txt: in.txt \\\\\\n inc.txt\\n')",
+  "",
+  ])
+
+def _writeDepfileScript(t):
+  config = t.readFileContents("config.cake").decode("utf8")
+  t.writeTextFile("config.cake", config.replace(
+    "configuration.addVariant(variant)",
+    "\n".join([
+      "from cake.library.shell import ShellTool",
+      "variant.tools['shell'] = ShellTool(configuration=configuration)",
+      "configuration.addVariant(variant)",
+      ]),
+    ))
+  t.writeTextFile("generate.py", _generator)
+  t.writeTextFile("depfile.cake", "\n".join([
+    "import sys",
+    "from cake.tools import script, shell",
+    "shell.run(",
+    "  args=[sys.executable, 'generate.py'],",
+    "  targets=[script.cwd('out.txt')],",
+    "  sources=[script.cwd('in.txt'), script.cwd('generate.py')],",
+    "  cwd=script.cwd(),",
+    "  depfile=script.cwd('out.d'),",
+    "  )",
+    "",
+    ]))
+  t.writeTextFile("in.txt", "in")
+  t.writeTextFile("inc.txt", "inc")
+
+@caketest(fixture="copyfile")
+def testDepfileTracksImplicitInputs(t):
+  _writeDepfileScript(t)
+
+  output = t.runCake("depfile.cake")
+  output.checkSucceeded()
+  output.checkHasLine("Running %s" % sys.executable)
+
+  t.runCake("depfile.cake").checkBuildWasNoop()
+
+  # inc.txt isn't a source but is listed in the depfile.
+  t.touchFile("inc.txt")
+  output = t.runCake("depfile.cake")
+  output.checkSucceeded()
+  output.checkHasLine("Running %s" % sys.executable)
+
+  t.runCake("depfile.cake").checkBuildWasNoop()
@@ -0,0 +1,6 @@
+#include "common.h"
+
+int A()
+{
+  return 1;
+}
@@ -0,0 +1,6 @@
+#include "common.h"
+
+int C()
+{
+  return 3;
+}
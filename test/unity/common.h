@@ -0,0 +1,8 @@
+#ifndef COMMON_H
+#define COMMON_H
+
+int A();
+int B();
+int C();
+
+#endif
@@ -0,0 +1,6 @@
+#include "common.h"
+
+int main()
+{
+  return A() + B() + C() == 6 ? 0 : 1;
+}
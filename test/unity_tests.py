@@ -0,0 +1,33 @@
+import cake.system
+from cake.test.framework import caketest
+
+@caketest(fixture="unity", config="c_library")
+def testUnityBuild(t):
+  out = t.runCake()
+  out.checkSucceeded()
+  out.checkHasLine("Compiling obj/main.unity.cpp")
+  out.checkHasLine("Compiling c.cpp")
+  out.checkNoLine("Compiling a.cpp")
+
+  t.runCake().checkBuildWasNoop()
+
+  t.writeTextFile("b.cpp", "int B()\n{\n  return 2;\n}\n")
+
+  out = t.runCake()
+  out.checkSucceeded()
+  out.checkHasLine("Compiling obj/main.unity.cpp")
+  out.checkNoLine("Compiling c.cpp")
+
+@caketest(fixture="unity", config="c_library")
+def testUnityMembershipChange(t):
+  t.runCake().checkSucceeded()
+
+  buildScript = t.readFileContents("build.cake").decode("utf8")
+  t.writeTextFile("build.cake", buildScript.replace("unitySize=3", "unitySize=4"))
+
+  out = t.runCake()
+  out.checkSucceeded()
+  out.checkHasLine("Compiling obj/main.unity.cpp")
+  out.checkNoLine("Compiling c.cpp")
+
+  t.runCake().checkBuildWasNoop()
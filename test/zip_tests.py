@@ -0,0 +1,111 @@
+import os
+import time
+import zipfile
+
+from cake.test.framework import caketest
+
+@caketest(fixture="zip")
+def testExtract(t):
+  out = t.runCake()
+  out.checkSucceeded()
+  out.checkHasLines([
+    "Extracting build/out/a.txt",
+    "Extracting build/out/b.txt",
+    "Extracting build/out/sub/c.txt",
+    ])
+  t.checkFilesAreSame("data/a.txt", "build/out/a.txt")
+  t.checkFilesAreSame("data/sub/c.txt", "build/out/sub/c.txt")
+
+  t.runCake().checkBuildWasNoop()
+
+@caketest(fixture="zip")
+def testExtractOnlyChangedFiles(t):
+  t.runCake().checkSucceeded()
+
+  t.writeTextFile("build/out/b.txt", "modified\n")
+  out = t.runCake()
+  out.checkSucceeded()
+  out.checkHasLine("Extracting build/out/b.txt")
+  out.checkNoLine("Extracting build/out/a.txt")
+  t.checkFilesAreSame("data/b.txt", "build/out/b.txt")
+
+  t.runCake().checkBuildWasNoop()
+
+@caketest(fixture="zip")
+def testExtractRemovesStaleFiles(t):
+  t.runCake().checkSucceeded()
+
+  t.writeTextFile("build/out/stale.txt", "stale\n")
+  out = t.runCake()
+  out.checkSucceeded()
+  out.checkHasLine("Deleting build/out/stale.txt")
+  out.checkNoLine("Extracting build/out/a.txt")
+
+@caketest(fixture="zip")
+def testCompressInChunks(t):
+  t.writeTextFile("data/big.txt", "\n".join(str(i) for i in range(20000)))
+  t.writeTextFile("data/empty.txt", "")
+
+  out = t.runCake()
+  out.checkSucceeded()
+  out.checkHasLine("Adding data/big.txt to build/data.zip")
+  t.checkFilesAreSame("data/big.txt", "build/out/big.txt")
+  t.checkFilesAreSame("data/empty.txt", "build/out/empty.txt")
+
+  zipFile = zipfile.ZipFile(t.abspath("build/data.zip"))
+  try:
+    if zipFile.testzip() is not None:
+      t.reporter.error("build/data.zip is corrupt")
+  finally:
+    zipFile.close()
+
+def _getZipNames(t, path):
+  zipFile = zipfile.ZipFile(t.abspath(path))
+  try:
+    return zipFile.namelist()
+  finally:
+    zipFile.close()
+
+@caketest(fixture="zip")
+def testCompressUpdatesChangedFilesInPlace(t):
+  t.runCake().checkSucceeded()
+
+  t.writeTextFile("data/b.txt", "a changed beta\n")
+  t.writeTextFile("data/d.txt", "delta\n")
+  # Zips only store times to a 2 second resolution.
+  later = time.time() + 10
+  os.utime(t.abspath("data/b.txt"), (later, later))
+  out = t.runCake()
+  out.checkSucceeded()
+  out.checkHasLines([
+    "Removing b.txt from build/data.zip",
+    "Adding data/b.txt to build/data.zip",
+    "Adding data/d.txt to build/data.zip",
+    ])
+  out.checkNoLine("Adding data/a.txt to build/data.zip")
+  t.checkFilesAreSame("data/b.txt", "build/out/b.txt")
+  t.checkFilesAreSame("data/d.txt", "build/out/d.txt")
+
+  names = _getZipNames(t, "build/data.zip")
+  if len(names) != len(set(names)):
+    t.reporter.error("build/data.zip has duplicate entries: %r" % names)
+
+  t.runCake().checkBuildWasNoop()
+
+@caketest(fixture="zip")
+def testCompressRemovesStaleEntries(t):
+  t.runCake().checkSucceeded()
+
+  t.removeFile("data/a.txt")
+  out = t.runCake()
+  out.checkSucceeded()
+  out.checkHasLines([
+    "Removing a.txt from build/data.zip",
+    "Deleting build/out/a.txt",
+    ])
+  out.checkNoLine("Adding data/b.txt to build/data.zip")
+
+  names = _getZipNames(t, "build/data.zip")
+  if "a.txt" in names:
+    t.reporter.error("build/data.zip still contains a.txt: %r" % names)
+  t.checkFilesAreSame("data/b.txt", "build/out/b.txt")
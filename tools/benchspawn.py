@@ -0,0 +1,76 @@
+"""Measure the cost of launching a process the way Compiler._runProcess does.
+
+Usage: python tools/benchspawn.py [count] [command...]
+
+Compares running the command through a shell with output captured in
+temporary files (the old launcher) against running it directly from an
+argument list with output captured through pipes (the current launcher).
+The command defaults to a program that does nothing, so the times are
+dominated by the cost of starting a process.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+def runWithShell(args):
+  stdout = tempfile.TemporaryFile(mode="w+t")
+  stderr = tempfile.TemporaryFile(mode="w+t")
+  try:
+    p = subprocess.Popen(
+      args=" ".join(args),
+      shell=True,
+      stdin=subprocess.PIPE,
+      stdout=stdout,
+      stderr=stderr,
+      )
+    p.stdin.close()
+    p.wait()
+    stdout.seek(0)
+    stderr.seek(0)
+    return stdout.read(), stderr.read()
+  finally:
+    stdout.close()
+    stderr.close()
+
+def runDirect(args):
+  p = subprocess.Popen(
+    args=args,
+    stdin=subprocess.DEVNULL,
+    stdout=subprocess.PIPE,
+    stderr=subprocess.PIPE,
+    universal_newlines=True,
+    errors="replace",
+    )
+  return p.communicate()
+
+def measure(name, run, args, count):
+  run(args) # Warm up
+  start = time.perf_counter()
+  for _ in range(count):
+    run(args)
+  elapsed = time.perf_counter() - start
+  print("%-28s %8.3f ms per process" % (name, 1000.0 * elapsed / count))
+
+def main(argv):
+  count = 200
+  if len(argv) > 1:
+    count = int(argv[1])
+  args = argv[2:]
+  if not args:
+    true = shutil.which("true")
+    if true is not None:
+      args = [true]
+    else:
+      args = [sys.executable, "-c", "pass"]
+
+  print("Running %s %i times" % (" ".join(args), count))
+  if os.name != "nt":
+    measure("shell + temporary files", runWithShell, args, count)
+  measure("argv + pipes", runDirect, args, count)
+
+if __name__ == "__main__":
+  main(sys.argv)